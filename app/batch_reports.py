@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Batch PDF report generation
+
+Builds one complete project report per selected project for a period, fanned
+out across a ProcessPoolExecutor so month-end runs scale with the number of
+cores. Workers are spawned (not forked), so each one opens its own
+connection pool and builds its own ReportLab styles once, then reuses them
+for every project it is handed. The reports land in a directory or a zip,
+next to a manifest.json describing every report and failure.
+
+Usage:
+    python -m app.batch_reports --period this_month --output reports/
+    python -m app.batch_reports --period custom --start 2025-01-01 --end 2025-03-31 \\
+        --status Active --zip --output reports_q1.zip
+    python -m app.batch_reports --period all --project 3 --detailed --output reports/
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from app.db import DB_FILE, create_connection, get_db_profile, read_projet_summaries, set_db_profile
+from app.pdf_generator import PDFReportGenerator
+from app.report_cache import ReportCache
+
+MANIFEST_NAME = "manifest.json"
+
+# Per-process generator, created by _init_worker
+_generator = None
+
+
+def select_projects(conn, project_ids=None, status=None):
+    """Return [(id_projet, nom_projet)] for the given ids and/or status (all by default)"""
+    wanted = set(project_ids) if project_ids else None
+    return [(summary['id_projet'], summary['nom_projet'])
+            for summary in sorted(read_projet_summaries(conn), key=lambda s: s['id_projet'])
+            if (wanted is None or summary['id_projet'] in wanted)
+            and (status is None or summary['status'] == status)]
+
+
+def report_file_name(project_id, project_name):
+    """Stable, filesystem-safe PDF name for a project"""
+    ascii_name = unicodedata.normalize('NFKD', project_name or '').encode('ascii', 'ignore').decode()
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', ascii_name).strip('_')[:40]
+    return f"project_{project_id:04d}_{slug or 'sans_nom'}.pdf"
+
+
+def _init_worker(db_path, profile_name, use_cache):
+    """Process initializer: one generator (styles, connection pool) per worker"""
+    global _generator
+    set_db_profile(profile_name)
+    _generator = PDFReportGenerator(db_path, cache=ReportCache() if use_cache else None)
+
+
+def _generate_one(project_id, project_name, period, start_date, end_date, output_file, detailed=False):
+    """Worker side: build one report and return its manifest entry"""
+    started = time.perf_counter()
+    entry = {'project_id': project_id, 'project_name': project_name,
+             'file': os.path.basename(output_file)}
+    try:
+        if detailed:
+            _generator.generate_detailed_project_report(project_id, period, start_date, end_date,
+                                                        output_file=output_file)
+        else:
+            _generator.generate_complete_project_report(project_id, period, start_date, end_date,
+                                                        output_file=output_file)
+        entry['status'] = 'ok'
+        entry['size'] = os.path.getsize(output_file)
+    except Exception as e:
+        entry['status'] = 'error'
+        entry['error'] = str(e)
+    entry['seconds'] = round(time.perf_counter() - started, 3)
+    return entry
+
+
+def generate_batch_reports(period, output, project_ids=None, status=None, custom_start_date=None,
+                           custom_end_date=None, as_zip=False, workers=None, use_cache=True,
+                           db_path=DB_FILE, detailed=False):
+    """Generate a complete report for every selected project; return the manifest.
+
+    output is a directory, or the zip file to write when as_zip is True;
+    detailed adds the expense line breakdown and line items to each report.
+    """
+    if custom_start_date and custom_end_date:
+        start_date, end_date = custom_start_date, custom_end_date
+    else:
+        start_date, end_date = PDFReportGenerator(db_path).get_date_range(period)
+
+    conn = create_connection(db_path)
+    if conn is None:
+        raise RuntimeError("Unable to connect to database")
+    try:
+        projects = select_projects(conn, project_ids, status)
+    finally:
+        conn.close()
+
+    target_dir = tempfile.mkdtemp(prefix="reports_") if as_zip else output
+    os.makedirs(target_dir, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(projects)))
+    started = time.perf_counter()
+    reports = []
+    try:
+        if projects:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker,
+                                     initargs=(db_path, get_db_profile()[0], use_cache)) as executor:
+                futures = [executor.submit(_generate_one, project_id, name, period, start_date, end_date,
+                                           os.path.join(target_dir, report_file_name(project_id, name)),
+                                           detailed)
+                           for project_id, name in projects]
+                for future in as_completed(futures):
+                    entry = future.result()
+                    reports.append(entry)
+                    print(f"[{len(reports)}/{len(projects)}] {entry['file']}: {entry['status']}")
+
+        reports.sort(key=lambda entry: entry['project_id'])
+        manifest = {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'period': period,
+            'start_date': start_date,
+            'end_date': end_date,
+            'status_filter': status,
+            'detailed': detailed,
+            'workers': workers,
+            'seconds': round(time.perf_counter() - started, 3),
+            'succeeded': sum(1 for entry in reports if entry['status'] == 'ok'),
+            'failed': sum(1 for entry in reports if entry['status'] != 'ok'),
+            'reports': reports,
+        }
+        with open(os.path.join(target_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+        if as_zip:
+            with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for name in sorted(os.listdir(target_dir)):
+                    archive.write(os.path.join(target_dir, name), name)
+        return manifest
+    finally:
+        if as_zip:
+            shutil.rmtree(target_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--period", default="this_month",
+                        choices=["today", "this_week", "this_month", "all", "custom"])
+    parser.add_argument("--start", help="Start date (YYYY-MM-DD) for --period custom")
+    parser.add_argument("--end", help="End date (YYYY-MM-DD) for --period custom")
+    parser.add_argument("--project", type=int, action="append", dest="project_ids",
+                        help="Project id to include (repeatable; default: all projects)")
+    parser.add_argument("--status", help="Only projects with this status (Active, In Progress, Completed)")
+    parser.add_argument("--output", default=None, help="Output directory, or zip file with --zip")
+    parser.add_argument("--zip", action="store_true", help="Write a zip archive instead of a directory")
+    parser.add_argument("--detailed", action="store_true",
+                        help="Include the expense line breakdown and line items")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="Always rebuild, ignoring the report cache")
+    parser.add_argument("--db", default=DB_FILE, help="Database file")
+    args = parser.parse_args()
+
+    if args.period == "custom" and not (args.start and args.end):
+        parser.error("--period custom requires --start and --end")
+
+    output = args.output
+    if output is None:
+        output = f"reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}" + (".zip" if args.zip else "")
+
+    manifest = generate_batch_reports(args.period, output, project_ids=args.project_ids, status=args.status,
+                                      custom_start_date=args.start, custom_end_date=args.end,
+                                      as_zip=args.zip, workers=args.workers, use_cache=not args.no_cache,
+                                      db_path=args.db, detailed=args.detailed)
+    print(f"✅ {manifest['succeeded']} reports, {manifest['failed']} failed, "
+          f"{manifest['seconds']:.1f}s with {manifest['workers']} workers -> {output}")
+    return manifest['failed'] == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,136 @@
+"""
+Change tracking for incremental refresh
+
+Two cheap signals tell a view whether the database changed since it last
+looked:
+
+* PRAGMA data_version moves when another connection commits, and the
+  connection's own total_changes moves when this process writes. If neither
+  moved, nothing changed and the refresh can be skipped outright.
+* The change_log table (migration 7) is fed by triggers with one
+  (seq, table_name, row_id, op) row per insert, update or delete, so a view
+  can fetch only the rows touched since the last sequence number it saw.
+"""
+
+import threading
+from sqlite3 import Error
+
+from app.db import connection_id
+
+# Oldest change_log rows beyond this count are pruned at startup
+CHANGE_LOG_MAX_ROWS = 10000
+
+
+def get_data_version(conn):
+    """Return PRAGMA data_version for this connection"""
+    return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def get_last_change_seq(conn):
+    """Return the newest change_log sequence number (0 when empty)"""
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+
+def read_changes_since(conn, seq):
+    """Return ({table_name: {row_id: op}}, last_seq) for every change after seq.
+
+    Several changes to the same row collapse into one: an insert followed by
+    updates stays an insert, anything followed by a delete is a delete, and
+    a row inserted then deleted disappears.
+    """
+    changes = {}
+    last_seq = seq
+    cur = conn.execute("SELECT seq, table_name, row_id, op FROM change_log WHERE seq > ? ORDER BY seq", (seq,))
+    for last_seq, table_name, row_id, op in cur:
+        rows = changes.setdefault(table_name, {})
+        previous = rows.get(row_id)
+        if previous == 'I' and op == 'D':
+            del rows[row_id]
+        elif previous == 'I' and op == 'U':
+            continue
+        else:
+            rows[row_id] = op
+    return {table: rows for table, rows in changes.items() if rows}, last_seq
+
+
+def prune_change_log(conn, max_rows=CHANGE_LOG_MAX_ROWS):
+    """Delete all but the newest max_rows change_log rows; return rows deleted.
+
+    Cheap when there is nothing to prune (no write), so it can run on every
+    refresh.
+    """
+    if conn is None:
+        print("No database connection")
+        return 0
+    try:
+        oldest, newest = conn.execute("SELECT MIN(seq), MAX(seq) FROM change_log").fetchone()
+        if newest is None or newest - oldest < max_rows:
+            return 0
+        cur = conn.execute("DELETE FROM change_log WHERE seq <= (SELECT MAX(seq) FROM change_log) - ?",
+                           (max_rows,))
+        conn.commit()
+        return cur.rowcount
+    except Error as e:
+        print(f"Error pruning change log: {e}")
+        return 0
+
+
+class ChangeTracker:
+    """Remembers what a view last saw and reports what changed since.
+
+    data_version and total_changes are per connection, so the fast path only
+    applies when the pool hands back the same connection as last time.
+    """
+
+    def __init__(self):
+        # Background loaders may poll from worker threads
+        self._lock = threading.Lock()
+        self.connection_id = None
+        self.data_version = None
+        self.total_changes = None
+        self.last_seq = None
+
+    def _remember(self, conn):
+        self.connection_id = connection_id(conn)
+        self.data_version = get_data_version(conn)
+        self.total_changes = conn.total_changes
+
+    def mark_seen(self, conn):
+        """Record the current state after a full reload"""
+        with self._lock:
+            self._mark_seen(conn)
+
+    def _mark_seen(self, conn):
+        try:
+            self._remember(conn)
+            self.last_seq = get_last_change_seq(conn)
+        except Error as e:
+            print(f"Error reading change state: {e}")
+            self.last_seq = None
+
+    def poll(self, conn):
+        """Return the changes since the last call.
+
+        {} means nothing changed; None means the caller must reload
+        everything (first poll, or the log was pruned past last_seq).
+        """
+        with self._lock:
+            return self._poll(conn)
+
+    def _poll(self, conn):
+        try:
+            if (self.last_seq is not None and connection_id(conn) == self.connection_id
+                    and get_data_version(conn) == self.data_version
+                    and conn.total_changes == self.total_changes):
+                return {}
+            self._remember(conn)
+
+            oldest = conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+            if self.last_seq is None or (oldest is not None and oldest > self.last_seq + 1):
+                self.last_seq = get_last_change_seq(conn)
+                return None
+            changes, self.last_seq = read_changes_since(conn, self.last_seq)
+            return changes
+        except Error as e:
+            print(f"Error polling changes: {e}")
+            return None
@@ -1,19 +1,397 @@
+import logging
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from sqlite3 import Error
 
+from app.events import (
+    ProjectCreated, ProjectUpdated, ProjectDeleted, InvoiceCreated, InvoiceUpdated, InvoiceDeleted,
+    LinesChanged, publish
+)
 
-def create_connection(db_file="gestion_projets.db"):
-    """Create a database connection to a SQLite database"""
-    conn = None
-    try:
-        conn = sqlite3.connect(db_file)
-        print(f"Connected to SQLite version: {sqlite3.sqlite_version}")
+logger = logging.getLogger(__name__)
+
+DB_FILE = "gestion_projets.db"
+
+# TVA applied on top of expense lines to get an invoice total
+TVA_RATE = 0.10
+
+# Rows per page for the keyset-paginated readers
+PAGE_SIZE = 200
+
+# Rows pulled per fetchmany() call by the streaming iter_* readers
+FETCH_BATCH_SIZE = 500
+
+# Pragma profiles applied to every pooled connection, selectable per
+# deployment through GESTION_DB_PROFILE or set_db_profile().
+#   desktop        - local disk: WAL so the auto-refresh never blocks a save
+#   network_share  - file on an SMB/NFS share: WAL needs shared memory that
+#                    network filesystems cannot provide, so keep rollback
+#                    journaling and wait longer for locks
+#   kiosk          - read-only dashboards: opened with mode=ro, writes refused
+DB_PROFILES = {
+    "desktop": {
+        "read_only": False,
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -32000,       # ~32 MB page cache
+            "mmap_size": 268435456,     # 256 MB memory-mapped reads
+            "temp_store": "MEMORY",
+            "busy_timeout": 5000,
+        },
+    },
+    "network_share": {
+        "read_only": False,
+        "pragmas": {
+            "journal_mode": "DELETE",
+            "synchronous": "FULL",
+            "cache_size": -16000,
+            "mmap_size": 0,
+            "temp_store": "MEMORY",
+            "busy_timeout": 15000,
+        },
+    },
+    "kiosk": {
+        "read_only": True,
+        "pragmas": {
+            "cache_size": -32000,
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY",
+            "busy_timeout": 2000,
+            "query_only": "ON",
+        },
+    },
+}
+
+DEFAULT_DB_PROFILE = "desktop"
+_active_profile = os.environ.get("GESTION_DB_PROFILE", DEFAULT_DB_PROFILE)
+
+
+def set_db_profile(name):
+    """Select the pragma profile used by pools created from now on"""
+    global _active_profile
+    if name not in DB_PROFILES:
+        raise ValueError(f"Unknown database profile: {name}")
+    _active_profile = name
+
+
+def get_db_profile():
+    """Return (name, settings) of the active pragma profile"""
+    name = _active_profile if _active_profile in DB_PROFILES else DEFAULT_DB_PROFILE
+    return name, DB_PROFILES[name]
+
+
+class PooledConnection:
+    """One checkout of a connection from a ConnectionPool.
+
+    Behaves like the sqlite3 connection it wraps, but close() hands the
+    connection back to its pool instead of closing it, so existing
+    ``conn = create_connection() ... conn.close()`` code keeps working while
+    reusing long-lived connections. Every checkout gets its own wrapper: once
+    released it refuses further use, and closing it again is a no-op even
+    after another thread has checked the same connection out.
+    """
+
+    __slots__ = ("_pool", "_conn", "_owner", "_depth")
+
+    def __init__(self, pool, conn, owner):
+        self._pool = pool
+        self._conn = conn
+        self._owner = owner   # id of the thread that checked it out
+        self._depth = 1       # nested acquisitions by that thread
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name in PooledConnection.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+    def close(self):
+        self._pool.release(self)
+
+
+class ConnectionPool:
+    """Thread-aware pool of SQLite connections for a single database file.
+
+    Each thread reuses the same checkout for nested acquisitions (reference
+    counted), idle connections are health-checked before being handed out, and
+    pragmas are applied once when a connection is opened. A checkout may be
+    released from another thread than the one that acquired it.
+    """
+
+    def __init__(self, db_file=DB_FILE, max_size=5, pragmas=None, timeout=30.0, read_only=False):
+        self.db_file = db_file
+        self.max_size = max_size
+        self.pragmas = dict(pragmas or {})
+        self.read_only = read_only
+        self.timeout = timeout
+        self._idle = []
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._held = {}   # thread id -> its PooledConnection checkout
+        self._closed = False
+
+    def _open(self):
+        if self.read_only:
+            target, uri = f"file:{os.path.abspath(self.db_file)}?mode=ro", True
+        else:
+            target, uri = self.db_file, False
+        conn = sqlite3.connect(target, timeout=self.timeout, uri=uri, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
         return conn
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+        self._opened -= 1
+
+    def acquire(self):
+        """Return this thread's checkout, taking a connection from the pool if needed"""
+        owner = threading.get_ident()
+        with self._cond:
+            held = self._held.get(owner)
+            if held is not None:
+                held._depth += 1
+                return held
+            if self._closed:
+                raise Error("Connection pool is closed")
+            conn = None
+            while conn is None:
+                if self._idle:
+                    candidate = self._idle.pop()
+                    if self._is_healthy(candidate):
+                        conn = candidate
+                    else:
+                        self._discard(candidate)
+                elif self._opened < self.max_size:
+                    conn = self._open()
+                    self._opened += 1
+                elif not self._cond.wait(self.timeout):
+                    raise Error(f"No database connection available after {self.timeout}s")
+            checkout = PooledConnection(self, conn, owner)
+            self._held[owner] = checkout
+        return checkout
+
+    def release(self, checkout):
+        """Give back one acquisition; the connection returns to the pool at depth 0.
+
+        May be called from any thread, not only the one that acquired it.
+        Releasing a checkout that was already given back does nothing.
+        """
+        with self._cond:
+            if self._held.get(checkout._owner) is not checkout:
+                return   # already released
+            checkout._depth -= 1
+            if checkout._depth > 0:
+                return
+            del self._held[checkout._owner]
+            conn = checkout._conn
+            checkout._conn = None
+
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except Error:
+                pass
+        with self._cond:
+            if self._closed or not self._is_healthy(conn):
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        """Close idle connections and refuse new acquisitions"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._cond.notify_all()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_file=DB_FILE, **options):
+    """Get (or lazily create) the shared pool for a database file.
+
+    Unless pragmas are passed explicitly, the pool uses the active profile.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_file)
+        if pool is None:
+            profile_name, profile = get_db_profile()
+            if "pragmas" not in options:
+                options["pragmas"] = profile["pragmas"]
+                options.setdefault("read_only", profile["read_only"])
+            pool = ConnectionPool(db_file, **options)
+            _pools[db_file] = pool
+            logger.info("Connected to SQLite version: %s (%s, profile: %s)",
+                        sqlite3.sqlite_version, db_file, profile_name)
+        return pool
+
+
+def close_pools():
+    """Close every pool, e.g. on application shutdown"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+
+def connection_id(conn):
+    """Identity of the SQLite connection behind conn, the same across pool checkouts"""
+    if isinstance(conn, PooledConnection):
+        conn = conn._conn or conn
+    return id(conn)
+
+
+def create_connection(db_file=DB_FILE):
+    """Get a pooled connection to a SQLite database; call close() to release it"""
+    try:
+        return get_pool(db_file).acquire()
     except Error as e:
         print(f"Connection error: {e}")
         return None
 
 
+# Unit of work: open transaction() scopes per connection (keyed by id)
+_transaction_depth = {}
+_transaction_lock = threading.Lock()
+
+# Write events held back until the transaction() they were raised in commits
+_pending_events = {}
+
+
+def in_unit_of_work(conn):
+    """True while conn is inside a transaction() block"""
+    return _transaction_depth.get(id(conn), 0) > 0
+
+
+def _commit(conn):
+    """Commit, unless an enclosing transaction() will commit for us"""
+    if not in_unit_of_work(conn):
+        conn.commit()
+
+
+def _publish(conn, *events):
+    """Publish write events now, or when the enclosing transaction() commits"""
+    if in_unit_of_work(conn):
+        _pending_events.setdefault(id(conn), []).extend(events)
+    else:
+        publish(*events)
+
+
+def _raise_if_in_transaction(conn):
+    """Inside transaction(), let errors reach it so the whole unit rolls back"""
+    if in_unit_of_work(conn):
+        raise
+
+
+@contextmanager
+def transaction(conn):
+    """Group several CRUD calls into one atomic commit.
+
+    CRUD functions called inside the block defer their commit and raise
+    instead of swallowing errors. The outermost block commits once (or rolls
+    back on any exception); nested blocks use savepoints, so an inner failure
+    can be caught without losing the outer work. Write events are published
+    once the outermost block has committed.
+
+        with transaction(conn):
+            facture_id = create_facture_charge(conn, facture)
+            create_lignes_charge_bulk(conn, lignes)
+            update_montant_investi(conn, id_projet)
+    """
+    key = id(conn)
+    with _transaction_lock:
+        depth = _transaction_depth.get(key, 0)
+        _transaction_depth[key] = depth + 1
+    savepoint = f"uow_{depth}"
+    pending = len(_pending_events.get(key, ()))
+    committed = False
+    try:
+        if depth == 0:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+        else:
+            conn.execute(f"SAVEPOINT {savepoint}")
+        try:
+            yield conn
+        except BaseException:
+            if depth == 0:
+                conn.rollback()
+            else:
+                conn.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                conn.execute(f"RELEASE SAVEPOINT {savepoint}")
+                # The rolled back writes never happened
+                del _pending_events.get(key, [])[pending:]
+            raise
+        if depth == 0:
+            conn.commit()
+            committed = True
+        else:
+            conn.execute(f"RELEASE SAVEPOINT {savepoint}")
+    finally:
+        with _transaction_lock:
+            if depth == 0:
+                _transaction_depth.pop(key, None)
+            else:
+                _transaction_depth[key] = depth
+        events = _pending_events.pop(key, []) if depth == 0 else ()
+    if committed:
+        publish(*events)
+
+
+@contextmanager
+def read_snapshot(conn):
+    """Run several reads against one consistent snapshot of the database.
+
+    Opens a deferred transaction, so the snapshot is taken by the first read
+    (in WAL mode it never blocks writers), and rolls it back at the end.
+    Inside an already open transaction the reads simply share it.
+
+        with read_snapshot(conn):
+            totals = read_report_totals(conn, id_projet)
+            rows = list(iter_invoices(conn, id_projet=id_projet))
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+
+
 def create_tables(conn):
     """Create all database tables if they don't exist"""
     if conn is None:
@@ -91,9 +469,11 @@ def create_projet(conn, projet):
     try:
         cur = conn.cursor()
         cur.execute(sql, projet)
-        conn.commit()
+        _commit(conn)
+        _publish(conn, ProjectCreated(cur.lastrowid))
         return cur.lastrowid
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error creating project: {e}")
         return None
 
@@ -112,6 +492,335 @@ def read_projets(conn):
         return []
 
 
+PROJET_SUMMARY_SQL = '''
+    SELECT p.id_projet, p.nom_projet, p.date_estimation, p.date_lancement,
+           p.budget_max, p.montant_investi, p.status,
+           COALESCE(s.nombre_factures, 0), COALESCE(s.total_charges, 0),
+           COALESCE(s.montant_en_attente, 0), s.derniere_facture
+    FROM Projet p
+    LEFT JOIN ProjetSummary s ON s.id_projet = p.id_projet
+'''
+
+
+def _summary_row_to_dict(row):
+    """Turn a PROJET_SUMMARY_SQL row into a dict with derived KPIs"""
+    budget_max = row[4] or 0
+    montant_investi = row[5] or 0
+    return {
+        'id_projet': row[0],
+        'nom_projet': row[1],
+        'date_estimation': row[2],
+        'date_lancement': row[3],
+        'budget_max': budget_max,
+        'montant_investi': montant_investi,
+        'status': row[6] or 'Active',
+        'nombre_factures': row[7],
+        'total_charges': row[8],
+        'montant_en_attente': row[9],
+        'derniere_facture': row[10],
+        'reste_budget': budget_max - montant_investi,
+        'pourcentage_utilise': (montant_investi / budget_max * 100) if budget_max > 0 else 0,
+        'is_over_budget': montant_investi > budget_max,
+    }
+
+
+def read_projet_summaries(conn):
+    """Read every project with its KPIs from the ProjetSummary table"""
+    if conn is None:
+        print("No database connection")
+        return []
+    try:
+        cur = conn.cursor()
+        cur.execute(PROJET_SUMMARY_SQL + " ORDER BY p.id_projet")
+        return [_summary_row_to_dict(row) for row in cur.fetchall()]
+    except Error as e:
+        print(f"Error reading project summaries: {e}")
+        return []
+
+
+def read_projet_summary(conn, id_projet):
+    """Read one project with its KPIs, or None"""
+    if conn is None:
+        print("No database connection")
+        return None
+    try:
+        cur = conn.cursor()
+        cur.execute(PROJET_SUMMARY_SQL + " WHERE p.id_projet = ?", (id_projet,))
+        row = cur.fetchone()
+        return _summary_row_to_dict(row) if row else None
+    except Error as e:
+        print(f"Error reading project summary: {e}")
+        return None
+
+
+def _fetch_page(cur, sql, params, limit, cursor_of):
+    """Run a keyset query for one page; return (rows, next_cursor)"""
+    cur.execute(sql + " LIMIT ?", params + [limit + 1])
+    rows = cur.fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, cursor_of(rows[-1])
+    return rows, None
+
+
+def read_projets_page(conn, after=None, limit=PAGE_SIZE, status=None, search=None):
+    """Read one page of project summaries ordered by (nom_projet, id_projet).
+
+    Pass the returned cursor as `after` to get the next page; the cursor is
+    None on the last page.
+    """
+    if conn is None:
+        print("No database connection")
+        return [], None
+    where, params = [], []
+    if after is not None:
+        where.append("(p.nom_projet, p.id_projet) > (?, ?)")
+        params.extend(after)
+    if status:
+        where.append("COALESCE(p.status, 'Active') = ?")
+        params.append(status)
+    if search:
+        where.append("p.nom_projet LIKE ?")
+        params.append(f"%{search}%")
+    sql = PROJET_SUMMARY_SQL
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY p.nom_projet, p.id_projet"
+    try:
+        rows, next_cursor = _fetch_page(conn.cursor(), sql, params, limit, lambda row: (row[1], row[0]))
+        return [_summary_row_to_dict(row) for row in rows], next_cursor
+    except Error as e:
+        print(f"Error reading projects page: {e}")
+        return [], None
+
+
+FACTURES_SQL = '''
+    SELECT fc.id_facture_charge, fc.date_facture, fc.fournisseur,
+           fc.montant_total, p.nom_projet, fc.status, fc.id_projet
+    FROM FactureCharge fc
+    JOIN Projet p ON fc.id_projet = p.id_projet
+'''
+
+
+def _factures_filters(id_projet=None, status=None, date_from=None, date_to=None):
+    """Build WHERE clauses and parameters for the invoice readers"""
+    where, params = [], []
+    if id_projet is not None:
+        where.append("fc.id_projet = ?")
+        params.append(id_projet)
+    if status:
+        where.append("COALESCE(fc.status, 'Pending') = ?")
+        params.append(status)
+    if date_from:
+        where.append("fc.date_facture >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("fc.date_facture <= ?")
+        params.append(date_to)
+    return where, params
+
+
+def read_factures_page(conn, after=None, limit=PAGE_SIZE, id_projet=None, status=None,
+                       date_from=None, date_to=None):
+    """Read one page of invoices, newest first, ordered by (date_facture, id) DESC.
+
+    Rows are (id_facture_charge, date_facture, fournisseur, montant_total,
+    nom_projet, status, id_projet). Pass the returned cursor as `after` to get
+    the next page; the cursor is None on the last page.
+    """
+    if conn is None:
+        print("No database connection")
+        return [], None
+    where, params = _factures_filters(id_projet, status, date_from, date_to)
+    if after is not None:
+        where.append("(fc.date_facture, fc.id_facture_charge) < (?, ?)")
+        params.extend(after)
+    sql = FACTURES_SQL
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY fc.date_facture DESC, fc.id_facture_charge DESC"
+    try:
+        return _fetch_page(conn.cursor(), sql, params, limit, lambda row: (row[1], row[0]))
+    except Error as e:
+        print(f"Error reading invoices page: {e}")
+        return [], None
+
+
+def read_factures_by_ids(conn, ids):
+    """Read specific invoices; rows have the read_factures_page() layout"""
+    if conn is None:
+        print("No database connection")
+        return []
+    ids = list(ids)
+    rows = []
+    try:
+        cur = conn.cursor()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cur.execute(FACTURES_SQL + f" WHERE fc.id_facture_charge IN ({placeholders})", chunk)
+            rows.extend(cur.fetchall())
+        return rows
+    except Error as e:
+        print(f"Error reading invoices: {e}")
+        return []
+
+
+def read_report_totals(conn, id_projet=None, date_from=None, date_to=None):
+    """Return (project summary or None, invoice count, total, average) in one statement.
+
+    The aggregates cover the invoices matching the filters; the summary dict
+    (see read_projet_summaries) is only read when id_projet is given.
+    """
+    if conn is None:
+        print("No database connection")
+        return None, 0, 0.0, 0.0
+    where, params = _factures_filters(id_projet, None, date_from, date_to)
+    sql = f'''
+        SELECT agg.nombre, agg.total, agg.moyenne, summary.*
+        FROM (SELECT COUNT(*) AS nombre,
+                     COALESCE(SUM(fc.montant_total), 0) AS total,
+                     COALESCE(AVG(fc.montant_total), 0) AS moyenne
+              FROM FactureCharge fc
+              JOIN Projet p ON fc.id_projet = p.id_projet
+              {"WHERE " + " AND ".join(where) if where else ""}) agg
+        LEFT JOIN ({PROJET_SUMMARY_SQL} WHERE p.id_projet = ?) summary ON 1
+    '''
+    try:
+        row = conn.execute(sql, params + [id_projet]).fetchone()
+        summary = _summary_row_to_dict(row[3:]) if row[3] is not None else None
+        return summary, row[0], row[1], row[2]
+    except Error as e:
+        print(f"Error reading report totals: {e}")
+        return None, 0, 0.0, 0.0
+
+
+def _iter_rows(conn, sql, params=(), batch_size=FETCH_BATCH_SIZE):
+    """Yield the rows of a query, fetching batch_size rows at a time.
+
+    A query error is logged and re-raised, even mid-stream, so consumers
+    never take a truncated result for a complete one.
+    """
+    if conn is None:
+        print("No database connection")
+        return
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    except Error as e:
+        print(f"Error streaming rows: {e}")
+        raise
+    finally:
+        cur.close()
+
+
+def iter_projets(conn, batch_size=FETCH_BATCH_SIZE):
+    """Stream every project row, like read_projets() but in constant memory"""
+    return _iter_rows(conn, "SELECT * FROM Projet ORDER BY id_projet", (), batch_size)
+
+
+def iter_invoices(conn, id_projet=None, status=None, date_from=None, date_to=None,
+                  batch_size=FETCH_BATCH_SIZE):
+    """Stream invoices newest first; rows have the read_factures_page() layout"""
+    where, params = _factures_filters(id_projet, status, date_from, date_to)
+    sql = FACTURES_SQL
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY fc.date_facture DESC, fc.id_facture_charge DESC"
+    return _iter_rows(conn, sql, params, batch_size)
+
+
+def iter_lines(conn, id_facture_charge=None, id_projet=None, batch_size=FETCH_BATCH_SIZE):
+    """Stream LigneCharge rows, optionally for one invoice or one project"""
+    sql = '''
+        SELECT lc.id_ligne, lc.id_facture_charge, lc.motif, lc.prix_unitaire,
+               lc.quantite, lc.montant_total
+        FROM LigneCharge lc
+    '''
+    where, params = [], []
+    if id_projet is not None:
+        sql += " JOIN FactureCharge fc ON fc.id_facture_charge = lc.id_facture_charge"
+        where.append("fc.id_projet = ?")
+        params.append(id_projet)
+    if id_facture_charge is not None:
+        where.append("lc.id_facture_charge = ?")
+        params.append(id_facture_charge)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY lc.id_facture_charge, lc.id_ligne"
+    return _iter_rows(conn, sql, params, batch_size)
+
+
+REPORT_LINES_FROM = '''
+    FROM FactureCharge fc
+    JOIN LigneCharge lc ON lc.id_facture_charge = fc.id_facture_charge
+'''
+
+
+def read_line_breakdown(conn, id_projet=None, date_from=None, date_to=None, top_n=10):
+    """Aggregate the expense lines of the matching invoices in SQL.
+
+    Returns ((line count, total), top motifs, supplier subtotals). Top motifs
+    are the top_n (motif, lines, quantity, amount) rows by amount; supplier
+    subtotals are (fournisseur, invoices, lines, amount) rows by amount. Line
+    amounts are net (invoices add TVA on top).
+    """
+    if conn is None:
+        print("No database connection")
+        return (0, 0.0), [], []
+    where, params = _factures_filters(id_projet, None, date_from, date_to)
+    filters = " WHERE " + " AND ".join(where) if where else ""
+    try:
+        cur = conn.cursor()
+        cur.execute(f'''
+            SELECT COUNT(*), COALESCE(SUM(lc.montant_total), 0)
+            {REPORT_LINES_FROM}{filters}
+        ''', params)
+        totals = cur.fetchone()
+        cur.execute(f'''
+            SELECT MIN(TRIM(lc.motif)), COUNT(*), SUM(lc.quantite), SUM(lc.montant_total) AS montant
+            {REPORT_LINES_FROM}{filters}
+            GROUP BY TRIM(lc.motif) COLLATE NOCASE
+            ORDER BY montant DESC
+            LIMIT ?
+        ''', params + [top_n])
+        motifs = cur.fetchall()
+        cur.execute(f'''
+            SELECT fc.fournisseur, COUNT(DISTINCT fc.id_facture_charge), COUNT(*),
+                   SUM(lc.montant_total) AS montant
+            {REPORT_LINES_FROM}{filters}
+            GROUP BY fc.fournisseur
+            ORDER BY montant DESC
+        ''', params)
+        return totals, motifs, cur.fetchall()
+    except Error as e:
+        print(f"Error reading line breakdown: {e}")
+        return (0, 0.0), [], []
+
+
+def iter_report_lines(conn, id_projet=None, date_from=None, date_to=None, batch_size=FETCH_BATCH_SIZE):
+    """Stream the expense lines of the matching invoices, in iter_invoices() order.
+
+    Rows are (id_ligne, id_facture_charge, date_facture, fournisseur, motif,
+    prix_unitaire, quantite, montant_total).
+    """
+    where, params = _factures_filters(id_projet, None, date_from, date_to)
+    sql = '''
+        SELECT lc.id_ligne, fc.id_facture_charge, fc.date_facture, fc.fournisseur,
+               lc.motif, lc.prix_unitaire, lc.quantite, lc.montant_total
+    ''' + REPORT_LINES_FROM
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY fc.date_facture DESC, fc.id_facture_charge DESC, lc.id_ligne"
+    return _iter_rows(conn, sql, params, batch_size)
+
+
 def update_projet(conn, projet):
     """Update a project with (nom_projet, date_estimation, date_lancement, budget_max, montant_investi, id_projet)"""
     if conn is None:
@@ -130,9 +839,12 @@ def update_projet(conn, projet):
     try:
         cur = conn.cursor()
         cur.execute(sql, projet)
-        conn.commit()
+        _commit(conn)
+        if cur.rowcount > 0:
+            _publish(conn, ProjectUpdated(projet[5]))
         return cur.rowcount > 0
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error updating project: {e}")
         return False
 
@@ -146,9 +858,12 @@ def delete_projet(conn, id_projet):
     try:
         cur = conn.cursor()
         cur.execute(sql, (id_projet,))
-        conn.commit()
+        _commit(conn)
+        if cur.rowcount > 0:
+            _publish(conn, ProjectDeleted(id_projet))
         return cur.rowcount > 0
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error deleting project: {e}")
         return False
 
@@ -168,11 +883,16 @@ def update_facture_charge(conn, facture):
     try:
         cur = conn.cursor()
         cur.execute(sql, facture)
-        conn.commit()
+        _commit(conn)
+        if cur.rowcount > 0:
+            _publish(conn, InvoiceUpdated(facture[5]))
         return cur.rowcount > 0
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error updating facture charge: {e}")
         return False
+
+
 def create_facture_charge(conn, facture):
     """Create a new facture charge with (id_projet, date_facture, fournisseur, montant_total)"""
     if conn is None:
@@ -186,13 +906,37 @@ def create_facture_charge(conn, facture):
     try:
         cur = conn.cursor()
         cur.execute(sql, facture)
-        conn.commit()
+        _commit(conn)
+        _publish(conn, InvoiceCreated(cur.lastrowid, facture[0]))
         return cur.lastrowid
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error creating facture charge: {e}")
         return None
 
 
+def delete_facture_charge(conn, facture_id):
+    """Delete an invoice and its expense lines"""
+    if conn is None:
+        print("No database connection")
+        return False
+    try:
+        with transaction(conn):
+            row = conn.execute("SELECT id_projet FROM FactureCharge WHERE id_facture_charge = ?",
+                               (facture_id,)).fetchone()
+            if row is None:
+                return False
+            # Lines first: the triggers take them off the invoice and project totals
+            conn.execute("DELETE FROM LigneCharge WHERE id_facture_charge = ?", (facture_id,))
+            conn.execute("DELETE FROM FactureCharge WHERE id_facture_charge = ?", (facture_id,))
+            _publish(conn, InvoiceDeleted(facture_id, row[0]))
+        return True
+    except Error as e:
+        _raise_if_in_transaction(conn)
+        print(f"Error deleting facture charge: {e}")
+        return False
+
+
 def read_factures_by_project(conn, project_id):
     """Read all factures for a specific project"""
     if conn is None:
@@ -222,9 +966,11 @@ def create_ligne_charge(conn, ligne_charge):
     try:
         cur = conn.cursor()
         cur.execute(sql, ligne_charge)
-        conn.commit()
+        _commit(conn)
+        _publish(conn, LinesChanged(ligne_charge[0]))
         return cur.lastrowid
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error creating ligne charge: {e}")
         return None
 
@@ -234,7 +980,7 @@ def read_lignes_charge_by_facture(conn, facture_id):
     if conn is None:
         print("No database connection")
         return []
-    sql = "SELECT * FROM LigneCharge WHERE id_facture_charge = ?"
+    sql = "SELECT * FROM LigneCharge WHERE id_facture_charge = ? ORDER BY id_ligne"
     try:
         cur = conn.cursor()
         cur.execute(sql, (facture_id,))
@@ -244,6 +990,34 @@ def read_lignes_charge_by_facture(conn, facture_id):
         return []
 
 
+def read_lignes_charge_by_factures(conn, facture_ids):
+    """Read the expense lines of many factures at once, grouped by facture.
+
+    Returns {facture_id: [rows]} with an entry (possibly empty) for every
+    requested id; rows have the read_lignes_charge_by_facture() layout.
+    Returns None on error.
+    """
+    if conn is None:
+        print("No database connection")
+        return None
+    facture_ids = list(dict.fromkeys(facture_ids))
+    lines = {facture_id: [] for facture_id in facture_ids}
+    try:
+        cur = conn.cursor()
+        # One query per 500 factures, to stay under SQLite's bound-parameter limit
+        for start in range(0, len(facture_ids), 500):
+            chunk = facture_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cur.execute(f"SELECT * FROM LigneCharge WHERE id_facture_charge IN ({placeholders}) "
+                        "ORDER BY id_facture_charge, id_ligne", chunk)
+            for row in cur.fetchall():
+                lines[row[1]].append(row)
+        return lines
+    except Error as e:
+        print(f"Error reading expense lines: {e}")
+        return None
+
+
 def delete_ligne_charge(conn, ligne_id):
     """Delete an expense line"""
     if conn is None:
@@ -251,11 +1025,14 @@ def delete_ligne_charge(conn, ligne_id):
         return False
     sql = "DELETE FROM LigneCharge WHERE id_ligne = ?"
     try:
+        factures = _factures_of_lines(conn, [ligne_id])
         cur = conn.cursor()
         cur.execute(sql, (ligne_id,))
-        conn.commit()
+        _commit(conn)
+        _publish(conn, *[LinesChanged(facture_id) for facture_id in factures])
         return cur.rowcount > 0
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error deleting expense line: {e}")
         return False
 
@@ -274,13 +1051,225 @@ def update_ligne_charge(conn, ligne_charge):
     try:
         cur = conn.cursor()
         cur.execute(sql, ligne_charge)
-        conn.commit()
+        _commit(conn)
+        _publish(conn, *[LinesChanged(facture_id) for facture_id in _factures_of_lines(conn, [ligne_charge[4]])])
         return cur.rowcount > 0
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error updating expense line: {e}")
         return False
 
 
+def _factures_of_lines(conn, ligne_ids):
+    """Return the ids of the invoices holding the given expense lines"""
+    ligne_ids = list(ligne_ids)
+    factures = set()
+    for start in range(0, len(ligne_ids), 500):
+        chunk = ligne_ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        cur = conn.execute(f"SELECT DISTINCT id_facture_charge FROM LigneCharge "
+                           f"WHERE id_ligne IN ({placeholders})", chunk)
+        factures.update(row[0] for row in cur)
+    return sorted(factures)
+
+
+def _validate_ligne_rows(rows, size, numeric_slice):
+    """Split rows into (index, row) pairs that look valid and (index, message) errors"""
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        if len(row) != size:
+            errors.append((index, f"must provide {size} elements"))
+            continue
+        try:
+            for value in row[numeric_slice]:
+                float(value)
+        except (TypeError, ValueError):
+            errors.append((index, "prix_unitaire, quantite and montant_total must be numeric"))
+            continue
+        valid.append((index, tuple(row)))
+    return valid, errors
+
+
+def _execute_bulk(conn, sql, indexed_rows, errors):
+    """Run sql for every row with executemany inside a single transaction.
+
+    If executemany fails, the batch is rolled back to a savepoint and
+    replayed row by row so the offending rows can be reported; the good rows
+    are still committed together (by the enclosing transaction() if any).
+    Returns the affected row count.
+    """
+    cur = conn.cursor()
+    cur.execute("SAVEPOINT bulk_write")
+    try:
+        cur.executemany(sql, [row for _, row in indexed_rows])
+        affected = cur.rowcount
+    except Error:
+        cur.execute("ROLLBACK TO SAVEPOINT bulk_write")
+        affected = 0
+        for index, row in indexed_rows:
+            try:
+                cur.execute(sql, row)
+                affected += cur.rowcount
+            except Error as e:
+                errors.append((index, str(e)))
+    cur.execute("RELEASE SAVEPOINT bulk_write")
+    _commit(conn)
+    return affected
+
+
+def create_lignes_charge_bulk(conn, lignes):
+    """Create many expense lines in one transaction.
+
+    lignes is a list of (id_facture_charge, motif, prix_unitaire, quantite, montant_total).
+    Returns (created_count, errors) where errors lists (row_index, message).
+    """
+    if conn is None:
+        print("No database connection")
+        return 0, [(index, "No database connection") for index in range(len(lignes))]
+    valid, errors = _validate_ligne_rows(lignes, 5, slice(2, 5))
+    if not valid:
+        return 0, errors
+    sql = ''' INSERT INTO LigneCharge(id_facture_charge, motif, prix_unitaire, quantite, montant_total)
+              VALUES(?,?,?,?,?) '''
+    try:
+        created = _execute_bulk(conn, sql, valid, errors)
+        _publish(conn, *[LinesChanged(facture_id) for facture_id in sorted({row[0] for _, row in valid})])
+    except Error as e:
+        _raise_if_in_transaction(conn)
+        print(f"Error creating expense lines: {e}")
+        conn.rollback()
+        return 0, errors + [(index, str(e)) for index, _ in valid]
+    return created, sorted(errors)
+
+
+def update_lignes_charge_bulk(conn, lignes):
+    """Update many expense lines in one transaction.
+
+    lignes is a list of (motif, prix_unitaire, quantite, montant_total, id_ligne).
+    Returns (updated_count, errors) where errors lists (row_index, message).
+    """
+    if conn is None:
+        print("No database connection")
+        return 0, [(index, "No database connection") for index in range(len(lignes))]
+    valid, errors = _validate_ligne_rows(lignes, 5, slice(1, 4))
+    if not valid:
+        return 0, errors
+    sql = ''' UPDATE LigneCharge
+              SET motif = ?, prix_unitaire = ?, quantite = ?, montant_total = ?
+              WHERE id_ligne = ? '''
+    try:
+        updated = _execute_bulk(conn, sql, valid, errors)
+        factures = _factures_of_lines(conn, [row[4] for _, row in valid])
+        _publish(conn, *[LinesChanged(facture_id) for facture_id in factures])
+    except Error as e:
+        _raise_if_in_transaction(conn)
+        print(f"Error updating expense lines: {e}")
+        conn.rollback()
+        return 0, errors + [(index, str(e)) for index, _ in valid]
+    return updated, sorted(errors)
+
+
+def delete_lignes_charge_bulk(conn, ligne_ids):
+    """Delete many expense lines by id in one transaction.
+
+    Returns (deleted_count, errors) where errors lists (row_index, message).
+    """
+    if conn is None:
+        print("No database connection")
+        return 0, [(index, "No database connection") for index in range(len(ligne_ids))]
+    if not ligne_ids:
+        return 0, []
+    errors = []
+    sql = "DELETE FROM LigneCharge WHERE id_ligne = ?"
+    try:
+        # Look the invoices up while their lines still exist
+        factures = _factures_of_lines(conn, ligne_ids)
+        deleted = _execute_bulk(conn, sql, [(index, (ligne_id,)) for index, ligne_id in enumerate(ligne_ids)], errors)
+        _publish(conn, *[LinesChanged(facture_id) for facture_id in factures])
+    except Error as e:
+        _raise_if_in_transaction(conn)
+        print(f"Error deleting expense lines: {e}")
+        conn.rollback()
+        return 0, [(index, str(e)) for index in range(len(ligne_ids))]
+    return deleted, sorted(errors)
+
+
+def save_lignes_charge_changes(conn, id_facture_charge, created=(), updated=(), deleted_ids=()):
+    """Apply one invoice's expense line edits in a single transaction.
+
+    created rows are (motif, prix_unitaire, quantite, montant_total), updated
+    rows are (motif, prix_unitaire, quantite, montant_total, id_ligne) and
+    deleted_ids are id_ligne values; lines that were not touched are not
+    written. The invoice total follows through the migration 4 triggers and
+    is only rewritten if it had drifted from SUM(lines) plus TVA.
+
+    Returns (new_ids, updated_count, deleted_count), new_ids matching
+    created, or None if nothing was written (one failed change rolls back
+    all of them).
+    """
+    if conn is None:
+        print("No database connection")
+        return None
+    created, updated, deleted_ids = list(created), list(updated), list(deleted_ids)
+    try:
+        with transaction(conn):
+            deleted, errors = delete_lignes_charge_bulk(conn, deleted_ids)
+            if errors:
+                raise Error(f"Cannot delete line {deleted_ids[errors[0][0]]}: {errors[0][1]}")
+            updated_count, errors = update_lignes_charge_bulk(conn, updated)
+            if errors:
+                raise Error(f"Cannot update line {updated[errors[0][0]][-1]}: {errors[0][1]}")
+            # One statement per new line, so the caller gets the new ids
+            cur = conn.cursor()
+            new_ids = []
+            for motif, prix_unitaire, quantite, montant_total in created:
+                cur.execute(''' INSERT INTO LigneCharge(id_facture_charge, motif, prix_unitaire, quantite, montant_total)
+                                VALUES(?,?,?,?,?) ''',
+                            (id_facture_charge, motif, float(prix_unitaire), float(quantite), float(montant_total)))
+                new_ids.append(cur.lastrowid)
+            cur.execute(f'''
+                UPDATE FactureCharge
+                SET montant_total = (SELECT COALESCE(SUM(montant_total), 0) FROM LigneCharge
+                                     WHERE id_facture_charge = ?) * {1 + TVA_RATE}
+                WHERE id_facture_charge = ?
+                  AND ABS(montant_total - (SELECT COALESCE(SUM(montant_total), 0) FROM LigneCharge
+                                           WHERE id_facture_charge = ?) * {1 + TVA_RATE}) > 0.005
+            ''', (id_facture_charge, id_facture_charge, id_facture_charge))
+            _publish(conn, LinesChanged(id_facture_charge))
+        return new_ids, updated_count, deleted
+    except (Error, TypeError, ValueError) as e:
+        print(f"Error saving expense lines: {e}")
+        return None
+
+
+def create_facture_with_lignes(conn, facture, lignes=()):
+    """Create an invoice and its expense lines atomically.
+
+    The invoice and project totals are kept current by triggers (migration
+    4): once the invoice has lines, its montant_total is SUM(lines) plus
+    TVA, whatever total it was created with.
+
+    facture is (id_projet, date_facture, fournisseur, montant_total) and each
+    ligne is (motif, prix_unitaire, quantite, montant_total). Returns
+    (id_facture_charge, line_errors); nothing is written if the invoice or
+    the project total update fails.
+    """
+    if conn is None:
+        print("No database connection")
+        return None, []
+    try:
+        with transaction(conn):
+            facture_id = create_facture_charge(conn, facture)
+            if facture_id is None:
+                raise Error("Invalid facture data")
+            rows = [(facture_id,) + tuple(ligne) for ligne in lignes]
+            _, errors = create_lignes_charge_bulk(conn, rows)
+        return facture_id, errors
+    except Error as e:
+        print(f"Error creating facture with lines: {e}")
+        return None, []
+
+
 # CRUD for Utilisateur
 def add_user(username, password, role):
     """Add a new user to the database"""
@@ -294,9 +1283,10 @@ def add_user(username, password, role):
     try:
         cur = conn.cursor()
         cur.execute(sql, (username, password, role))
-        conn.commit()
+        _commit(conn)
         return cur.lastrowid
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error creating user: {e}")
         return None
     finally:
@@ -346,17 +1336,14 @@ def update_user_role(conn, user_id, new_role):
     try:
         cur = conn.cursor()
         cur.execute(sql, (new_role, user_id))
-        conn.commit()
+        _commit(conn)
         return cur.rowcount > 0
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error updating user role: {e}")
         return False
 
 
-# CRUD for LigneCharge
-
-
-
 def read_factures_by_projet(conn, id_projet):
     """Read all factures for a specific project"""
     if conn is None:
@@ -373,7 +1360,11 @@ def read_factures_by_projet(conn, id_projet):
 
 # Function to update montant_investi in Projet
 def update_montant_investi(conn, id_projet):
-    """Update montant_investi in Projet based on sum of FactureCharge montant_total"""
+    """Recompute montant_investi for one project from its FactureCharge rows.
+
+    Triggers normally keep it current; use reconcile_totals() to repair a
+    whole database.
+    """
     if conn is None:
         print("No database connection")
         return False
@@ -386,13 +1377,84 @@ def update_montant_investi(conn, id_projet):
             )
             WHERE id_projet = ?
         ''', (id_projet, id_projet))
-        conn.commit()
+        _commit(conn)
+        if cur.rowcount > 0:
+            _publish(conn, ProjectUpdated(id_projet))
         return cur.rowcount > 0
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error updating montant_investi: {e}")
         return False
 
 
+def reconcile_totals(conn):
+    """Repair every invoice and project total in one grouped pass.
+
+    Invoices that have expense lines get SUM(lines) plus TVA, then every
+    project gets SUM(invoice totals). Only rows that actually drifted are
+    written. Returns (invoices_fixed, projects_fixed).
+    """
+    if conn is None:
+        print("No database connection")
+        return 0, 0
+    try:
+        with transaction(conn):
+            cur = conn.cursor()
+            cur.execute(f'''
+                UPDATE FactureCharge
+                SET montant_total = ROUND(t.total * {1 + TVA_RATE}, 2)
+                FROM (SELECT id_facture_charge, SUM(COALESCE(montant_total, 0)) AS total
+                      FROM LigneCharge GROUP BY id_facture_charge) AS t
+                WHERE FactureCharge.id_facture_charge = t.id_facture_charge
+                  AND ABS(COALESCE(FactureCharge.montant_total, 0) - t.total * {1 + TVA_RATE}) > 0.005
+            ''')
+            invoices_fixed = cur.rowcount
+            cur.execute('''
+                UPDATE Projet
+                SET montant_investi = ROUND(COALESCE(t.total, 0), 2)
+                FROM (SELECT p.id_projet, SUM(COALESCE(fc.montant_total, 0)) AS total
+                      FROM Projet p LEFT JOIN FactureCharge fc ON fc.id_projet = p.id_projet
+                      GROUP BY p.id_projet) AS t
+                WHERE Projet.id_projet = t.id_projet
+                  AND ABS(COALESCE(Projet.montant_investi, 0) - COALESCE(t.total, 0)) > 0.005
+            ''')
+            projects_fixed = cur.rowcount
+        return invoices_fixed, projects_fixed
+    except Error as e:
+        _raise_if_in_transaction(conn)
+        print(f"Error reconciling totals: {e}")
+        return 0, 0
+
+
+def rebuild_projet_summaries(conn):
+    """Recompute every ProjetSummary row from FactureCharge; return rows written"""
+    if conn is None:
+        print("No database connection")
+        return 0
+    try:
+        with transaction(conn):
+            cur = conn.cursor()
+            cur.execute("DELETE FROM ProjetSummary")
+            cur.execute('''
+                INSERT INTO ProjetSummary
+                    (id_projet, nombre_factures, total_charges, montant_en_attente, derniere_facture)
+                SELECT p.id_projet,
+                       COUNT(fc.id_facture_charge),
+                       ROUND(COALESCE(SUM(fc.montant_total), 0), 2),
+                       ROUND(COALESCE(SUM(CASE WHEN COALESCE(fc.status, 'Pending') = 'Pending'
+                                               THEN fc.montant_total ELSE 0 END), 0), 2),
+                       MAX(fc.date_facture)
+                FROM Projet p
+                LEFT JOIN FactureCharge fc ON fc.id_projet = p.id_projet
+                GROUP BY p.id_projet
+            ''')
+            return cur.rowcount
+    except Error as e:
+        _raise_if_in_transaction(conn)
+        print(f"Error rebuilding project summaries: {e}")
+        return 0
+
+
 def update_projet_status(conn, project_id, status):
     """Update project status"""
     if conn is None:
@@ -402,13 +1464,35 @@ def update_projet_status(conn, project_id, status):
     try:
         cur = conn.cursor()
         cur.execute(sql, (status, project_id))
-        conn.commit()
+        _commit(conn)
+        if cur.rowcount > 0:
+            _publish(conn, ProjectUpdated(project_id))
         return cur.rowcount > 0
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error updating project status: {e}")
         return False
 
 
+def update_projet_budget(conn, project_id, budget_max):
+    """Update project budget"""
+    if conn is None:
+        print("No database connection")
+        return False
+    sql = 'UPDATE Projet SET budget_max = ? WHERE id_projet = ?'
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, (budget_max, project_id))
+        _commit(conn)
+        if cur.rowcount > 0:
+            _publish(conn, ProjectUpdated(project_id))
+        return cur.rowcount > 0
+    except Error as e:
+        _raise_if_in_transaction(conn)
+        print(f"Error updating project budget: {e}")
+        return False
+
+
 def update_invoice_status(conn, invoice_id, status):
     """Update invoice status"""
     if conn is None:
@@ -418,9 +1502,12 @@ def update_invoice_status(conn, invoice_id, status):
     try:
         cur = conn.cursor()
         cur.execute(sql, (status, invoice_id))
-        conn.commit()
+        _commit(conn)
+        if cur.rowcount > 0:
+            _publish(conn, InvoiceUpdated(invoice_id))
         return cur.rowcount > 0
     except Error as e:
+        _raise_if_in_transaction(conn)
         print(f"Error updating invoice status: {e}")
         return False
 
@@ -0,0 +1,52 @@
+"""
+Write events
+
+The data layer publishes a typed event for each write it commits, so the
+views showing the touched rows can patch just those rows instead of
+reloading everything. Events published inside a transaction() are held
+back until it commits, and dropped if it rolls back (see app.db).
+
+Subscribers are called on the writing thread; GUI code subscribes through
+app.gui.events.EventRelay so its handlers run on the GUI thread.
+"""
+
+import threading
+from collections import namedtuple
+
+ProjectCreated = namedtuple('ProjectCreated', ['project_id'])
+ProjectUpdated = namedtuple('ProjectUpdated', ['project_id'])
+ProjectDeleted = namedtuple('ProjectDeleted', ['project_id'])
+InvoiceCreated = namedtuple('InvoiceCreated', ['facture_id', 'project_id'])
+InvoiceUpdated = namedtuple('InvoiceUpdated', ['facture_id'])
+InvoiceDeleted = namedtuple('InvoiceDeleted', ['facture_id', 'project_id'])
+# The lines of an invoice changed (and with them its total and its project's)
+LinesChanged = namedtuple('LinesChanged', ['facture_id'])
+
+_subscribers = []
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(callback):
+    """Call callback(event) for every published event; returns an unsubscribe function"""
+    with _subscribers_lock:
+        _subscribers.append(callback)
+
+    def unsubscribe():
+        with _subscribers_lock:
+            if callback in _subscribers:
+                _subscribers.remove(callback)
+    return unsubscribe
+
+
+def publish(*events):
+    """Deliver events to every subscriber, once each and in order"""
+    # Namedtuples of different types compare equal on equal fields
+    events = [event for _, event in dict.fromkeys((type(event), event) for event in events)]
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for event in events:
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error handling {type(event).__name__} event: {e}")
@@ -0,0 +1,23 @@
+"""
+Write events on the GUI thread
+
+EventRelay re-emits the data layer's write events (app.events) as a Qt
+signal. Writes may be committed on any thread; connected slots always run
+on the thread that owns the relay, so views can patch their models safely.
+"""
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from app.events import subscribe
+
+
+class EventRelay(QObject):
+    """Forwards every published write event to the published signal"""
+
+    published = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        unsubscribe = subscribe(self.published.emit)
+        # Stop receiving events with the owning window
+        self.destroyed.connect(lambda *args: unsubscribe())
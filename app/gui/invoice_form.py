@@ -1,11 +1,15 @@
 from PyQt5.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLabel, QLineEdit,
     QPushButton, QDateEdit, QDoubleSpinBox, QMessageBox, QGroupBox,
-    QComboBox, QTableWidget, QTableWidgetItem, QHeaderView, QWidget
+    QComboBox, QTableView, QHeaderView, QWidget
 )
 from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QFont
-from app.db import create_connection, create_facture_charge, read_projets, create_ligne_charge
+from app.db import (
+    TVA_RATE, create_connection, create_facture_with_lignes, save_lignes_charge_changes
+)
+from app.gui.table_models import ExpenseLinesTableModel
+from app.project_directory import get_project_directory
 
 
 class InvoiceDetailsDialog(QDialog):
@@ -15,6 +19,8 @@ class InvoiceDetailsDialog(QDialog):
         self.invoice_data = invoice_data or {}
         self.expense_lines = expense_lines or []
         self.parent_window = parent  # Store parent reference for updating
+        # Numeric line items with a running subtotal; also tracks edits for the save
+        self.expense_model = ExpenseLinesTableModel(self)
         self.setup_ui()
 
     def setup_ui(self):
@@ -170,14 +176,10 @@ class InvoiceDetailsDialog(QDialog):
         main_layout.addWidget(info_frame)
 
         # Expense table
-        expense_table = QTableWidget()
-        expense_table.setColumnCount(4)
-        expense_table.setHorizontalHeaderLabels(["Expense Lines", "Unit Price", "Quantity", "Total"])
+        expense_table = QTableView()
+        expense_table.setModel(self.expense_model)
         expense_table.setMinimumHeight(250)  # Increased height for better visibility
         
-        # Start with empty table - user will add expenses manually
-        expense_table.setRowCount(0)  # No default expenses
-        
         # Make table editable - use simple approach
         try:
             # Enable all edit triggers for easy editing
@@ -189,11 +191,8 @@ class InvoiceDetailsDialog(QDialog):
             # Most basic fallback
             expense_table.setEditTriggers(3)  # AllEditTriggers numeric value
         
-        # Connect itemChanged signal to handle calculations
-        expense_table.itemChanged.connect(self.on_item_changed)
-        
         expense_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background-color: white;
                 border: 1px solid #e2e8f0;
                 border-radius: 12px;
@@ -212,13 +211,13 @@ class InvoiceDetailsDialog(QDialog):
                 text-align: left;
                 min-width: 120px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 16px 12px;
                 border-bottom: 1px solid #f7fafc;
                 color: #2d3748;
                 font-size: 14px;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #ebf8ff;
             }
         """)
@@ -246,7 +245,7 @@ class InvoiceDetailsDialog(QDialog):
             print(f"Vertical header error: {e}")
         
         try:
-            expense_table.setSelectionBehavior(QTableWidget.SelectRows)
+            expense_table.setSelectionBehavior(QTableView.SelectRows)
         except Exception as e:
             print(f"Selection behavior error: {e}")
         
@@ -272,7 +271,31 @@ class InvoiceDetailsDialog(QDialog):
             }
         """)
         add_expense_btn.clicked.connect(self.add_expense_line)
-        main_layout.addWidget(add_expense_btn)
+        
+        # Remove Expense Line button
+        remove_expense_btn = QPushButton("Remove Selected Line")
+        remove_expense_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #e53e3e;
+                color: white;
+                border: none;
+                padding: 12px 24px;
+                border-radius: 8px;
+                font-weight: bold;
+                font-size: 14px;
+                margin: 10px 0;
+            }
+            QPushButton:hover {
+                background-color: #c53030;
+            }
+        """)
+        remove_expense_btn.clicked.connect(self.remove_expense_line)
+        
+        line_buttons_layout = QHBoxLayout()
+        line_buttons_layout.addWidget(add_expense_btn)
+        line_buttons_layout.addWidget(remove_expense_btn)
+        line_buttons_layout.addStretch()
+        main_layout.addLayout(line_buttons_layout)
 
         # Summary section
         summary_frame = QGroupBox()
@@ -313,8 +336,8 @@ class InvoiceDetailsDialog(QDialog):
         summary_layout.addWidget(self.tax_label)
         summary_layout.addWidget(self.total_due_btn)
         
-        # Connect table changes to update totals
-        self.expense_table.itemChanged.connect(self.update_totals)
+        # The model reports its running subtotal after every change
+        self.expense_model.subtotal_changed.connect(self.update_totals)
         
         main_layout.addWidget(summary_frame)
         
@@ -370,60 +393,16 @@ class InvoiceDetailsDialog(QDialog):
         """Load existing expense lines into the table"""
         if not self.expense_lines:
             return
-            
-        # Set the number of rows
-        self.expense_table.setRowCount(len(self.expense_lines))
-        
-        # Populate the table
-        for row, line in enumerate(self.expense_lines):
-            try:
-                # Assuming expense line format: (id, invoice_id, motif, prix_unitaire, quantite, montant_ligne)
-                motif = line[2] if len(line) > 2 else ''
-                prix_unitaire = line[3] if len(line) > 3 else 0.0
-                quantite = line[4] if len(line) > 4 else 0.0
-                montant_ligne = line[5] if len(line) > 5 else 0.0
-                
-                # Create table items
-                motif_item = QTableWidgetItem(str(motif))
-                price_item = QTableWidgetItem(f"DH{prix_unitaire:.2f}")
-                qty_item = QTableWidgetItem(str(quantite))
-                total_item = QTableWidgetItem(f"DH{montant_ligne:.2f}")
-                
-                # Set items in table
-                self.expense_table.setItem(row, 0, motif_item)
-                self.expense_table.setItem(row, 1, price_item)
-                self.expense_table.setItem(row, 2, qty_item)
-                self.expense_table.setItem(row, 3, total_item)
-                
-            except Exception as e:
-                print(f"Error loading expense line {row}: {e}")
-                continue
-        
-        # Update totals after loading
-        self.update_totals()
+        # Format: (id, invoice_id, motif, prix_unitaire, quantite, montant_ligne)
+        self.expense_model.set_lines(self.expense_lines)
     
-    def update_totals(self):
-        """Calculate and update the totals based on expense table data"""
+    def update_totals(self, subtotal=None):
+        """Show subtotal, TVA and total from the model's running subtotal"""
         try:
-            subtotal = 0.0
+            if subtotal is None:
+                subtotal = self.expense_model.subtotal
             
-            # Calculate subtotal from all rows in expense table
-            for row in range(self.expense_table.rowCount()):
-                total_item = self.expense_table.item(row, 3)  # Total column
-                if total_item and total_item.text():
-                    # Remove DH sign and commas, then convert to float
-                    total_text = total_item.text().replace('DH', '').replace(',', '')
-                    try:
-                        row_total = float(total_text)
-                        subtotal += row_total
-                    except ValueError:
-                        continue
-            
-            # Calculate TVA (10%)
-            tva_rate = 0.10
-            tva_amount = subtotal * tva_rate
-            
-            # Calculate final total
+            tva_amount = subtotal * TVA_RATE
             final_total = subtotal + tva_amount
             
             # Update the labels
@@ -437,53 +416,6 @@ class InvoiceDetailsDialog(QDialog):
         except Exception as e:
             print(f"Error updating totals: {e}")
     
-    def calculate_row_total(self, row):
-        """Calculate total for a specific row when unit price or quantity changes"""
-        try:
-            unit_price_item = self.expense_table.item(row, 1)  # Unit Price column
-            quantity_item = self.expense_table.item(row, 2)    # Quantity column
-            
-            if unit_price_item and quantity_item:
-                # Extract unit price value
-                unit_price_text = unit_price_item.text().replace('DH', '').replace(',', '')
-                quantity_text = quantity_item.text()
-                
-                try:
-                    unit_price = float(unit_price_text)
-                    quantity = float(quantity_text)
-                    total = unit_price * quantity
-                    
-                    # Temporarily disconnect signal to prevent recursion
-                    self.expense_table.itemChanged.disconnect()
-                    
-                    # Update the total column 
-                    total_item = QTableWidgetItem(f"DH{total:,.2f}")
-                    self.expense_table.setItem(row, 3, total_item)
-                    
-                    # Reconnect the signal
-                    self.expense_table.itemChanged.connect(self.on_item_changed)
-                    
-                    # Update overall totals
-                    self.update_totals()
-                    
-                except ValueError:
-                    # Reconnect signal even on error
-                    try:
-                        self.expense_table.itemChanged.connect(self.on_item_changed)
-                    except:
-                        pass
-                    
-        except Exception as e:
-            print(f"Error in calculate_row_total: {e}")
-            # Make sure to reconnect the signal even if there's an error
-            try:
-                self.expense_table.itemChanged.connect(self.on_item_changed)
-            except:
-                pass
-                    
-        except Exception as e:
-            print(f"Error calculating row total: {e}")
-    
     def edit_invoice(self):
         """Handle edit button click"""
         print("Edit button clicked!")  # Debug print
@@ -509,163 +441,72 @@ class InvoiceDetailsDialog(QDialog):
         """Handle add expense line button click"""
         print("Add expense line button clicked!")  # Debug print
         try:
-            # Temporarily disconnect the signal to prevent recursion
-            self.expense_table.itemChanged.disconnect()
-            
-            # Add a new empty row to the table
-            row_count = self.expense_table.rowCount()
-            self.expense_table.insertRow(row_count)
-            
-            # Set default values for new row
-            self.expense_table.setItem(row_count, 0, QTableWidgetItem("New Expense Item"))
-            self.expense_table.setItem(row_count, 1, QTableWidgetItem("0.00"))
-            self.expense_table.setItem(row_count, 2, QTableWidgetItem("1"))
-            
-            # Set initial total (will be calculated automatically)
-            total_item = QTableWidgetItem("DH0.00")
-            self.expense_table.setItem(row_count, 3, total_item)
-            
-            # Set row height
-            self.expense_table.setRowHeight(row_count, 45)
-            
-            # Reconnect the signal
-            self.expense_table.itemChanged.connect(self.on_item_changed)
+            row = self.expense_model.add_line()
+            self.expense_table.setRowHeight(row, 45)
             
             # Select the new row and start editing the first column
-            self.expense_table.setCurrentCell(row_count, 0)
-            self.expense_table.edit(self.expense_table.currentIndex())
-            
-            # Update totals
-            self.update_totals()
+            index = self.expense_model.index(row, 0)
+            self.expense_table.setCurrentIndex(index)
+            self.expense_table.edit(index)
             
             QMessageBox.information(self, "New Expense Added", 
                                   "New expense line added! Edit Unit Price and Quantity to auto-calculate total.")
         except Exception as e:
             print(f"Error in add_expense_line: {e}")
-            # Make sure to reconnect the signal even if there's an error
-            try:
-                self.expense_table.itemChanged.connect(self.on_item_changed)
-            except:
-                pass
             QMessageBox.critical(self, "Error", f"Failed to add expense line: {str(e)}")
     
-    def on_item_changed(self, item):
-        """Handle when an item in the table is changed"""
-        try:
-            row = item.row()
-            column = item.column()
-            
-            # Prevent editing the total column (column 3) by ignoring changes
-            if column == 3:
-                return
-            
-            # If unit price (column 1) or quantity (column 2) changed, recalculate row total
-            if column == 1 or column == 2:
-                self.calculate_row_total(row)
-                
-        except Exception as e:
-            print(f"Error in on_item_changed: {e}")
+    def remove_expense_line(self):
+        """Remove the selected expense line; saved lines are deleted on save"""
+        row = self.expense_table.currentIndex().row()
+        if row < 0:
+            QMessageBox.information(self, "No Selection", "Please select an expense line to remove.")
+            return
+        self.expense_model.remove_line(row)
     
     def save_expense_lines(self):
-        """Save all expense lines to the database"""
+        """Save the added, edited and removed expense lines to the database"""
         try:
             if 'id' not in self.invoice_data:
                 QMessageBox.warning(self, "Warning", "Cannot save: No invoice ID found")
                 return
                 
             invoice_id = self.invoice_data['id']
+            
+            # Only new, edited and removed lines are written
+            created, created_rows, updated, deleted = self.expense_model.changes()
+            
+            if not (created or updated or deleted):
+                QMessageBox.information(self, "Info", "No changes to save.")
+                return
+            
             conn = create_connection()
             if not conn:
                 QMessageBox.critical(self, "Error", "Cannot connect to database")
                 return
-                
-            # First, delete all existing expense lines for this invoice
+            
+            # Send only the changes, in a single transaction
             try:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM LigneCharge WHERE id_facture_charge = ?", (invoice_id,))
-                print(f"Deleted existing expense lines for invoice {invoice_id}")
-            except Exception as e:
-                print(f"Error deleting existing lines: {e}")
+                result = save_lignes_charge_changes(conn, invoice_id, created, updated, deleted)
+            finally:
+                conn.close()
             
-            # Then save all current expense lines from the table
-            saved_count = 0
-            for row in range(self.expense_table.rowCount()):
-                try:
-                    motif_item = self.expense_table.item(row, 0)
-                    price_item = self.expense_table.item(row, 1)
-                    qty_item = self.expense_table.item(row, 2)
-                    total_item = self.expense_table.item(row, 3)
-                    
-                    if motif_item and price_item and qty_item and total_item:
-                        motif = motif_item.text().strip()
-                        price_text = price_item.text().replace('DH', '').replace(',', '')
-                        qty_text = qty_item.text()
-                        total_text = total_item.text().replace('DH', '').replace(',', '')
-                        
-                        if motif and price_text and qty_text:
-                            try:
-                                prix_unitaire = float(price_text)
-                                quantite = float(qty_text)
-                                montant_ligne = float(total_text)
-                                
-                                if prix_unitaire > 0 and quantite > 0:
-                                    ligne_tuple = (invoice_id, motif, prix_unitaire, quantite, montant_ligne)
-                                    ligne_id = create_ligne_charge(conn, ligne_tuple)
-                                    if ligne_id:
-                                        saved_count += 1
-                                        print(f"Saved expense line: {motif} - DH{montant_ligne:.2f}")
-                            except ValueError as ve:
-                                print(f"Value error in row {row}: {ve}")
-                                continue
-                                
-                except Exception as e:
-                    print(f"Error saving expense line at row {row}: {e}")
-                    continue
+            if result is None:
+                QMessageBox.critical(self, "Error", "Failed to save expense lines, no changes were written.")
+                return
+            new_ids, updated_count, deleted_count = result
             
-            # Update the main invoice total in FactureCharge table
-            try:
-                # Calculate total from current expense table (same logic as update_totals)
-                subtotal = 0.0
-                for row in range(self.expense_table.rowCount()):
-                    total_item = self.expense_table.item(row, 3)  # Total column
-                    if total_item and total_item.text():
-                        total_text = total_item.text().replace('DH', '').replace(',', '')
-                        try:
-                            row_total = float(total_text)
-                            subtotal += row_total
-                        except ValueError:
-                            continue
-                
-                # Calculate final total with TVA (10%)
-                tva_rate = 0.10
-                tva_amount = subtotal * tva_rate
-                final_total = subtotal + tva_amount
-                
-                # Update the FactureCharge table with new total
-                cursor = conn.cursor()
-                cursor.execute("UPDATE FactureCharge SET montant_total = ? WHERE id_facture_charge = ?", 
-                             (final_total, invoice_id))
-                conn.commit()
-                print(f"Updated invoice {invoice_id} total to DH{final_total:.2f}")
-                
-                # Update the header amount label to reflect the saved amount
-                self.amount_label.setText(f"<b>Total Amount:</b><br><span style='color:#d69e2e;font-weight:bold;font-size:16px;'>DH{final_total:,.2f}</span>")
-                
-            except Exception as e:
-                print(f"Error updating invoice total: {e}")
+            # The saved state becomes the new baseline
+            self.expense_model.mark_saved(created_rows, new_ids, deleted)
+            print(f"Saved invoice {invoice_id} lines: {len(new_ids)} added, {updated_count} updated, {deleted_count} removed")
             
-            conn.close()
+            QMessageBox.information(self, "Success",
+                                    f"Saved changes: {len(new_ids)} added, {updated_count} updated, "
+                                    f"{deleted_count} removed.")
             
-            if saved_count > 0:
-                QMessageBox.information(self, "Success", f"Saved {saved_count} expense lines successfully!")
-                
-                # Refresh parent window if available
-                if self.parent_window and hasattr(self.parent_window, 'load_project_invoices'):
-                    self.parent_window.load_project_invoices()
-                elif self.parent_window and hasattr(self.parent_window, 'load_data'):
-                    self.parent_window.load_data()
-            else:
-                QMessageBox.information(self, "Info", "No expense lines to save.")
+            # Refresh the project dialog's table; the main window patches
+            # the touched rows from the write events
+            if self.parent_window and hasattr(self.parent_window, 'load_project_invoices'):
+                self.parent_window.load_project_invoices()
                 
         except Exception as e:
             print(f"Error saving expense lines: {e}")
@@ -690,11 +531,6 @@ class InvoiceDetailsDialog(QDialog):
             # Show confirmation message
             QMessageBox.information(self, "Status Updated", 
                                   f"Invoice status changed to: {new_status}")
-            
-            # Fallback: refresh parent window if it has load_data method
-            if self.parent_window and hasattr(self.parent_window, 'load_data'):
-                self.parent_window.load_data()
-                print("Parent window refreshed")
                 
         except Exception as e:
             print(f"Error updating status: {e}")
@@ -770,14 +606,17 @@ class InvoiceFormDialog(QDialog):
         main_layout.addLayout(button_layout)
     
     def load_projects(self):
-        """Load projects into combo box"""
+        """Load projects into combo box from the in-memory project directory"""
         try:
-            conn = create_connection()
-            if conn:
-                projects = read_projets(conn)
-                for project in projects:
-                    self.projet_combo.addItem(project[1], project[0])  # nom_projet, id_projet
-                conn.close()
+            directory = get_project_directory()
+            if not directory.is_loaded():
+                # Opened before any window loaded the directory
+                conn = create_connection()
+                if conn:
+                    directory.sync(conn)
+                    conn.close()
+            for project in directory.projects():
+                self.projet_combo.addItem(project[1], project[0])  # nom_projet, id_projet
         except Exception as e:
             print(f"Error loading projects: {e}")
     
@@ -815,55 +654,51 @@ class InvoiceFormDialog(QDialog):
             fournisseur = self.fournisseur_edit.text().strip()
             montant_total = self.montant_spin.value()
             
-            # Create invoice
+            # Collect expense lines if they exist (only for InvoiceDetailsDialog)
+            lignes = []
+            if hasattr(self, 'expense_table'):
+                for row in range(self.expense_table.rowCount()):
+                    try:
+                        motif_item = self.expense_table.item(row, 0)
+                        price_item = self.expense_table.item(row, 1)
+                        qty_item = self.expense_table.item(row, 2)
+                        total_item = self.expense_table.item(row, 3)
+                        
+                        if motif_item and price_item and qty_item and total_item:
+                            motif = motif_item.text().strip()
+                            # Remove DH and commas from price
+                            price_text = price_item.text().replace('DH', '').replace(',', '')
+                            qty_text = qty_item.text()
+                            total_text = total_item.text().replace('DH', '').replace(',', '')
+                            
+                            if motif and price_text and qty_text:
+                                try:
+                                    prix_unitaire = float(price_text)
+                                    quantite = float(qty_text)
+                                    montant_ligne = float(total_text)
+                                    
+                                    if prix_unitaire > 0 and quantite > 0:
+                                        lignes.append((motif, prix_unitaire, quantite, montant_ligne))
+                                except ValueError as ve:
+                                    print(f"Value error in expense line {row}: {ve}")
+                                    continue
+                    except Exception as e:
+                        print(f"Error reading expense line at row {row}: {e}")
+                        continue
+            
+            # Create invoice, its lines and the project total in one commit
             invoice_tuple = (project_id, date_facture, fournisseur, montant_total)
-            invoice_id = create_facture_charge(conn, invoice_tuple)
+            invoice_id, errors = create_facture_with_lignes(conn, invoice_tuple, lignes)
+            conn.close()
             
             if invoice_id:
-                # Save expense lines if they exist (only for InvoiceDetailsDialog)
-                if hasattr(self, 'expense_table'):
-                    print(f"Saving {self.expense_table.rowCount()} expense lines...")
-                    for row in range(self.expense_table.rowCount()):
-                        try:
-                            motif_item = self.expense_table.item(row, 0)
-                            price_item = self.expense_table.item(row, 1)
-                            qty_item = self.expense_table.item(row, 2)
-                            total_item = self.expense_table.item(row, 3)
-                            
-                            if motif_item and price_item and qty_item and total_item:
-                                motif = motif_item.text().strip()
-                                # Remove DH and commas from price
-                                price_text = price_item.text().replace('DH', '').replace(',', '')
-                                qty_text = qty_item.text()
-                                total_text = total_item.text().replace('DH', '').replace(',', '')
-                                
-                                if motif and price_text and qty_text:
-                                    try:
-                                        prix_unitaire = float(price_text)
-                                        quantite = float(qty_text)
-                                        montant_ligne = float(total_text)
-                                        
-                                        if prix_unitaire > 0 and quantite > 0:
-                                            ligne_tuple = (invoice_id, motif, prix_unitaire, quantite, montant_ligne)
-                                            ligne_id = create_ligne_charge(conn, ligne_tuple)
-                                            if ligne_id:
-                                                print(f"Saved expense line: {motif} - DH{montant_ligne:.2f}")
-                                            else:
-                                                print(f"Failed to save expense line: {motif}")
-                                    except ValueError as ve:
-                                        print(f"Value error in expense line {row}: {ve}")
-                                        continue
-                        except Exception as e:
-                            print(f"Error saving expense line at row {row}: {e}")
-                            continue
-                
+                for index, message in errors:
+                    print(f"Failed to save expense line {lignes[index][0]}: {message}")
                 QMessageBox.information(self, "Succès", f"Facture créée avec succès (ID: {invoice_id})")
                 self.accept()
             else:
                 QMessageBox.critical(self, "Erreur", "Impossible de créer la facture")
             
-            conn.close()
-            
         except Exception as e:
             QMessageBox.critical(self, "Erreur", f"Erreur lors de la sauvegarde:\n{str(e)}")
 
@@ -0,0 +1,138 @@
+"""
+Background data loading
+
+Every GUI read goes through a DataLoader: the query runs in a QRunnable on a
+small QThreadPool, and the result is handed back to a callback on the main
+thread. Requests are keyed; a new request for a key supersedes the previous
+one: it returns without querying if it has not started yet, and its result
+is ignored if it has.
+"""
+
+import threading
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from app.db import create_connection
+
+# Worker threads share the connection pool with the GUI thread; keep them
+# below its max_size
+LOADER_THREADS = 2
+
+_thread_pool = None
+
+
+def loader_thread_pool():
+    """Return the thread pool shared by every DataLoader"""
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = QThreadPool()
+        _thread_pool.setMaxThreadCount(LOADER_THREADS)
+    return _thread_pool
+
+
+class LoaderSignals(QObject):
+    """Signals a LoadTask emits from its worker thread"""
+
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class LoadTask(QRunnable):
+    """Runs fn(conn, *args) on a pooled connection in a worker thread"""
+
+    def __init__(self, request_id, fn, args):
+        super().__init__()
+        self.request_id = request_id
+        self.fn = fn
+        self.args = args
+        self.signals = LoaderSignals()
+        self.cancelled = threading.Event()
+
+    def run(self):
+        if self.cancelled.is_set():
+            return
+        conn = None
+        try:
+            conn = create_connection()
+            if conn is None:
+                raise RuntimeError("Unable to connect to database")
+            result = self.fn(conn, *self.args)
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(self.request_id, str(e))
+            return
+        finally:
+            if conn is not None:
+                conn.close()
+        if not self.cancelled.is_set():
+            self.signals.finished.emit(self.request_id, result)
+
+
+class DataLoader(QObject):
+    """Runs keyed read requests off the GUI thread; only the latest per key lands"""
+
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or loader_thread_pool()
+        self._next_id = 0
+        self._latest = {}     # key -> request id
+        self._requests = {}   # request id -> (key, cancelled, signals, on_done, on_error)
+
+    def load(self, key, fn, on_done, *args, on_error=None):
+        """Run fn(conn, *args) in the background and call on_done(result) here.
+
+        Any pending request with the same key is cancelled.
+        """
+        self.cancel(key)
+        self._next_id += 1
+        request_id = self._next_id
+        task = LoadTask(request_id, fn, args)
+        task.signals.finished.connect(self._on_finished)
+        task.signals.failed.connect(self._on_failed)
+        self._latest[key] = request_id
+        self._requests[request_id] = (key, task.cancelled, task.signals, on_done, on_error)
+        # The pool owns (and deletes) the task; cancellation only uses the
+        # event, so a superseded task that has not started returns at once
+        self.pool.start(task)
+        return request_id
+
+    def is_pending(self, key):
+        """Return True while a request for key has not delivered its result"""
+        return key in self._latest
+
+    def cancel(self, key):
+        """Drop the pending request for key, if any"""
+        request_id = self._latest.pop(key, None)
+        if request_id is None:
+            return
+        _, cancelled, _, _, _ = self._requests.pop(request_id)
+        cancelled.set()
+
+    def cancel_all(self):
+        """Drop every pending request"""
+        for key in list(self._latest):
+            self.cancel(key)
+
+    def _take(self, request_id):
+        request = self._requests.pop(request_id, None)
+        if request is None:
+            return None
+        key = request[0]
+        if self._latest.get(key) == request_id:
+            del self._latest[key]
+        return request
+
+    def _on_finished(self, request_id, result):
+        request = self._take(request_id)
+        if request is not None:
+            request[3](result)
+
+    def _on_failed(self, request_id, message):
+        request = self._take(request_id)
+        if request is None:
+            return
+        if request[4] is not None:
+            request[4](message)
+        else:
+            print(f"Background load failed: {message}")
@@ -1,15 +1,28 @@
 from PyQt5.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
+    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableView,
     QTableWidgetItem, QHeaderView, QMessageBox, QStatusBar, QFrame,
     QStackedWidget, QListWidget, QListWidgetItem, QPushButton, QLabel,
-    QDialog, QComboBox, QLineEdit, QDateEdit, QProgressDialog, QApplication
+    QDialog, QComboBox, QLineEdit, QDateEdit, QProgressDialog, QCheckBox
 )
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont, QPixmap, QColor
 from datetime import datetime
 
-from app.db import create_connection, read_projets, read_lignes_charge_by_facture
+from app.db import (create_connection, read_projet_summary, read_projets_page,
+                    read_factures_page, read_factures_by_ids, delete_facture_charge,
+                    update_invoice_status, PAGE_SIZE)
+from app.events import ProjectCreated, ProjectUpdated, ProjectDeleted, InvoiceCreated, InvoiceDeleted
+from app.change_tracking import ChangeTracker, prune_change_log
+from app.line_cache import LINE_PREFETCH_INVOICES, get_line_cache
+from app.project_directory import get_project_directory
+from app.gui.loaders import DataLoader
+from app.gui.events import EventRelay
+from app.gui.report_jobs import ReportQueue
+from app.gui.table_models import (ProjectsTableModel, InvoicesTableModel, StatusPillDelegate,
+                                  StatusDotDelegate, ButtonDelegate, PROJECT_STATUS_COLORS,
+                                  INVOICE_STATUS_COLORS)
 from app.utils import format_currency, format_date
+from app.pdf_generator import PHASE_FETCH, PHASE_BUILD
 from app.gui.project_form import show_project_form
 from app.gui.invoice_form import show_invoice_form, show_invoice_details
 
@@ -26,14 +39,40 @@ class MainApplicationWindow(QMainWindow):
         
         # Initialize invoice status storage (in a real app, this would be in database)
         self.invoice_statuses = {}  # Dictionary to store invoice_id -> status mapping
+        
+        # Tells the auto-refresh what changed since the last load
+        self.change_tracker = ChangeTracker()
+        
+        # Project directory version the reports combo was filled from
+        self.report_projects_version = None
+        
+        # Runs every database read off the GUI thread
+        self.loader = DataLoader(self)
+        
+        # Rows touched by write events, re-read together by patch_rows()
+        self.pending_projects = set()
+        self.pending_invoices = set()
+        self.new_projects = set()
+        self.new_invoices = set()
+        self.patch_scheduled = False
+        self.event_relay = EventRelay(self)
+        self.event_relay.published.connect(self.on_write_event)
+        
+        # PDF reports are generated one after another in the background
+        self.report_queue = ReportQueue(self)
+        self.report_queue.progress.connect(self.on_report_progress)
+        self.report_queue.finished.connect(self.on_report_finished)
+        self.report_queue.failed.connect(self.on_report_failed)
+        self.report_queue.cancelled.connect(self.on_report_cancelled)
+        self.report_dialogs = {}  # job id -> QProgressDialog
 
         try:
             self.setup_ui()
             self.load_data()
             
-            # Auto-refresh data every 30 seconds
+            # Auto-refresh data every 30 seconds (only what changed)
             self.refresh_timer = QTimer()
-            self.refresh_timer.timeout.connect(self.load_data)
+            self.refresh_timer.timeout.connect(self.refresh_data)
             self.refresh_timer.start(30000)
         except Exception as e:
             import traceback
@@ -272,47 +311,62 @@ class MainApplicationWindow(QMainWindow):
             title_layout.addWidget(self.add_project_btn)
         layout.addLayout(title_layout)
 
-        # Projects table
-        self.projects_table = QTableWidget()
-        self.projects_table.setColumnCount(4)
-        self.projects_table.setHorizontalHeaderLabels([
-            "Project Name", "Budget", "Remaining", "Status"
-        ])
+        # Projects table: model/view, the status pill is painted by a delegate
+        self.projects_model = ProjectsTableModel(self)
+        self.projects_table = QTableView()
+        self.projects_table.setModel(self.projects_model)
+        self.projects_table.setItemDelegateForColumn(ProjectsTableModel.STATUS_COLUMN,
+                                                     StatusPillDelegate(PROJECT_STATUS_COLORS, parent=self.projects_table))
+        # Styled once here; refreshes only touch the model
         self.projects_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background-color: white;
                 border: 1px solid #e2e8f0;
-                border-radius: 8px;
+                border-radius: 18px;
                 gridline-color: #e2e8f0;
                 selection-background-color: #edf2f7;
                 font-size: 15px;
             }
-            QHeaderView::section {
-                background-color: #f7f7f7;
-                color: #999999;
-                padding: 18px 0 18px 0;
-                border: none;
-                border-bottom: 2px solid #e2e8f0;
-                font-weight: bold;
-                font-size: 17px;
-                letter-spacing: 0.5px;
-            }
-            QTableWidget::item {
-                padding: 12px 24px;
+            QTableView::item {
+                padding: 8px;
+                border-bottom: 1px solid #e2e8f0;
                 font-size: 15px;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background: #f1f5f9;
+                color: #2d3748;
             }
         """)
         header = self.projects_table.horizontalHeader()
-        header.setSectionResizeMode(QHeaderView.Stretch)
-        self.projects_table.setAlternatingRowColors(True)
-        self.projects_table.setSelectionBehavior(QTableWidget.SelectRows)
+        header.setStyleSheet("""
+            QHeaderView::section {
+                background: #f7fafc;
+                font-weight: bold;
+                font-size: 16px;
+                color: #2d3748;
+                border: none;
+                border-bottom: 2px solid #e2e8f0;
+                padding: 12px 0;
+            }
+        """)
+        header.setSectionResizeMode(0, QHeaderView.Stretch)           # Project Name
+        header.setSectionResizeMode(1, QHeaderView.ResizeToContents)  # Budget
+        header.setSectionResizeMode(2, QHeaderView.ResizeToContents)  # Remaining
+        header.setSectionResizeMode(3, QHeaderView.Fixed)             # Status
+        self.projects_table.setColumnWidth(3, 150)
+        self.projects_table.verticalHeader().setVisible(False)
+        self.projects_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.projects_table.verticalHeader().setDefaultSectionSize(70)
+        self.projects_table.setAlternatingRowColors(False)
+        self.projects_table.setSelectionBehavior(QTableView.SelectRows)
+        self.projects_table.setEditTriggers(QTableView.NoEditTriggers)
         self.projects_table.setShowGrid(False)
 
         # Connect double-click to view project details
-        self.projects_table.cellDoubleClicked.connect(self.on_project_double_clicked)
+        self.projects_table.doubleClicked.connect(
+            lambda index: self.on_project_double_clicked(index.row(), index.column()))
+        self.projects_cursor = None
+        self.projects_table.verticalScrollBar().valueChanged.connect(self.on_projects_scrolled)
 
         layout.addWidget(self.projects_table)
 
@@ -323,6 +377,7 @@ class MainApplicationWindow(QMainWindow):
         from PyQt5.QtWidgets import QApplication
         
         # Close current window
+        self.report_queue.cancel_all()
         self.close()
         
         # Show login dialog
@@ -375,21 +430,30 @@ class MainApplicationWindow(QMainWindow):
         
         layout.addLayout(header_layout)
         
-        # Invoices table with new structure
-        self.invoices_table = QTableWidget()
-        self.invoices_table.setColumnCount(6)
-        self.invoices_table.setHorizontalHeaderLabels([
-            "Invoice ID", "Supplier", "Date", "Status", "Actions", ""
-        ])
+        # Invoices table: rows are fetched page by page as the view scrolls,
+        # status and actions are painted by delegates
+        self.invoices_model = InvoicesTableModel(self.fetch_invoices_page, self)
+        self.invoices_table = QTableView()
+        self.invoices_table.setModel(self.invoices_model)
+        self.invoices_table.setItemDelegateForColumn(InvoicesTableModel.STATUS_COLUMN,
+                                                     StatusDotDelegate(INVOICE_STATUS_COLORS, parent=self.invoices_table))
+        # Delete button only for Directors, "Read Only" for Employees
+        self.invoice_delete_delegate = ButtonDelegate("Delete", "#ef4444", "#dc2626",
+                                                      enabled=self.user_role == "Directeur",
+                                                      parent=self.invoices_table)
+        self.invoice_delete_delegate.clicked.connect(self.delete_invoice_at_row)
+        self.invoices_table.setItemDelegateForColumn(InvoicesTableModel.ACTIONS_COLUMN, self.invoice_delete_delegate)
+        self.invoices_table.setMouseTracking(True)
         
         # Configure table styling to match the design
         self.invoices_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background-color: white;
                 border: 1px solid #e2e8f0;
                 border-radius: 12px;
                 gridline-color: #e2e8f0;
                 selection-background-color: #f7fafc;
+                selection-color: #2d3748;
                 font-size: 14px;
             }
             QHeaderView::section {
@@ -401,7 +465,7 @@ class MainApplicationWindow(QMainWindow):
                 color: #374151;
                 font-size: 14px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 12px;
                 border-bottom: 1px solid #f1f5f9;
             }
@@ -421,10 +485,12 @@ class MainApplicationWindow(QMainWindow):
         self.invoices_table.setColumnWidth(5, 0)    # Hide the last column
         
         self.invoices_table.setAlternatingRowColors(False)  # Disable alternating colors for cleaner look
-        self.invoices_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.invoices_table.setSelectionBehavior(QTableView.SelectRows)
+        self.invoices_table.setEditTriggers(QTableView.NoEditTriggers)
         self.invoices_table.setShowGrid(False)
         self.invoices_table.verticalHeader().setVisible(False)
-        self.invoices_table.setRowHeight(0, 50)  # Set default row height
+        self.invoices_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.invoices_table.verticalHeader().setDefaultSectionSize(60)
         
         # Connect double-click to show invoice details
         self.invoices_table.doubleClicked.connect(self.show_invoice_details)
@@ -584,6 +650,13 @@ class MainApplicationWindow(QMainWindow):
         """)
         report_buttons_layout.addWidget(self.complete_report_btn)
         
+        # Detailed mode for the project report: expense line breakdown and line items
+        self.detailed_report_check = QCheckBox("Include expense line breakdown and line items")
+        self.detailed_report_check.setFont(QFont("Arial", 12))
+        self.detailed_report_check.setStyleSheet("color: #4a5568; margin-left: 5px;")
+        self.detailed_report_check.setEnabled(False)
+        report_buttons_layout.addWidget(self.detailed_report_check)
+        
         report_type_section.addWidget(report_buttons_container)
         main_layout.addLayout(report_type_section)
         
@@ -949,279 +1022,193 @@ class MainApplicationWindow(QMainWindow):
                 self.stacked_widget.setCurrentWidget(self.users_page)
     
     def load_data(self):
-        try:
-            conn = create_connection()
-            if not conn:
-                QMessageBox.warning(self, "Error", "Unable to connect to database")
-                return
-            
-            # Load projects
-            projects = read_projets(conn)
-            self.display_projects_table(projects)
-            
-            # Load invoices
-            self.load_invoices(conn)
-            
-            conn.close()
-            self.status_bar.showMessage(f"Data updated - {datetime.now().strftime('%H:%M:%S')}")
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            QMessageBox.critical(self, "Error", f"Error loading data:\n{str(e)}")
+        """Reload the loaded projects and invoices in the background"""
+        # A full reload supersedes pending page fetches and row refreshes
+        for key in ('refresh', 'projects', 'invoices'):
+            self.loader.cancel(key)
+        self.invoices_model.begin_reload()
+        # Re-read as many rows as are loaded so the diff keeps scroll and selection
+        self.loader.load('main', self.read_main_data, self.apply_main_data,
+                         max(PAGE_SIZE, self.projects_model.rowCount()),
+                         max(PAGE_SIZE, self.invoices_model.rowCount()),
+                         on_error=self.on_load_error)
 
-    def display_projects_table(self, projects):
-        if not projects:
-            self.projects_table.setRowCount(0)
-            return
+    def read_main_data(self, conn, projects_limit=PAGE_SIZE, invoices_limit=PAGE_SIZE):
+        """Worker side of load_data"""
+        # Mark first: anything committed while we read is reported again later
+        self.change_tracker.mark_seen(conn)
+        get_project_directory().sync(conn)
+        projects, projects_cursor = read_projets_page(conn, limit=projects_limit)
+        invoices, invoices_cursor = read_factures_page(conn, limit=invoices_limit)
+        return projects, projects_cursor, invoices, invoices_cursor
 
-        self.projects_table.setRowCount(len(projects))
-        self.project_ids = []
+    def apply_main_data(self, result):
+        """GUI side of load_data: apply the reload as a keyed row diff"""
+        projects, self.projects_cursor, invoices, invoices_cursor = result
+        self.projects_model.apply_rows(projects)
+        self.invoices_model.apply_page(invoices, invoices_cursor)
+        self.prefetch_invoice_lines(invoices)
+        self.refresh_report_projects()
+        self.status_bar.showMessage(f"Data updated - {datetime.now().strftime('%H:%M:%S')}")
+    
+    def prefetch_invoice_lines(self, invoices):
+        """Warm the expense line cache for the first invoices of a page, in one query"""
+        invoice_ids = [invoice[0] for invoice in invoices[:LINE_PREFETCH_INVOICES]]
+        if invoice_ids:
+            self.loader.load('line_prefetch', get_line_cache().prefetch, lambda count: None, invoice_ids)
 
-        for row, project_tuple in enumerate(projects):
-            self.project_ids.append(project_tuple[0])
-            nom_projet = project_tuple[1] if project_tuple[1] else 'N/A'
-            budget_max = project_tuple[4] if project_tuple[4] else 0
-            montant_investi = project_tuple[5] if project_tuple[5] else 0
+    def on_load_error(self, message):
+        self.invoices_model.fetch_failed()
+        QMessageBox.critical(self, "Error", f"Error loading data:\n{message}")
 
-            # Name
-            item_name = QTableWidgetItem(nom_projet)
-            item_name.setFont(QFont("Arial", 14))
-            item_name.setTextAlignment(Qt.AlignVCenter | Qt.AlignLeft)
-            self.projects_table.setItem(row, 0, item_name)
+    def refresh_data(self):
+        """Auto-refresh: skip when nothing changed, otherwise re-read only the changed rows"""
+        if self.loader.is_pending('main') or self.loader.is_pending('refresh'):
+            return
+        self.loader.load('refresh', self.read_changed_rows, self.apply_changed_rows,
+                         set(self.projects_model.keys()), set(self.invoices_model.keys()))
 
-            # Budget
-            item_budget = QTableWidgetItem(format_currency(budget_max))
-            item_budget.setFont(QFont("Arial", 14))
-            item_budget.setTextAlignment(Qt.AlignVCenter | Qt.AlignRight)
-            self.projects_table.setItem(row, 1, item_budget)
+    def read_changed_rows(self, conn, shown_projects, loaded_invoices):
+        """Worker side of refresh_data; None asks for a full reload"""
+        get_project_directory().sync(conn)
+        changes = self.change_tracker.poll(conn)
+        if changes is None or not changes:
+            return changes
+        # Keep the log bounded during long sessions, not only at startup
+        prune_change_log(conn)
+        
+        # Inserts and deletes move rows around: reload the loaded range and diff it
+        project_changes = changes.get('Projet', {})
+        invoice_changes = changes.get('FactureCharge', {})
+        if any(op != 'U' for op in list(project_changes.values()) + list(invoice_changes.values())):
+            return None
+        
+        projects = [read_projet_summary(conn, project_id)
+                    for project_id in project_changes if project_id in shown_projects]
+        invoices = read_factures_by_ids(conn, [i for i in invoice_changes if i in loaded_invoices])
+        return {'projects': [p for p in projects if p], 'invoices': invoices}
 
-            # Remaining
-            reste_budget = budget_max - montant_investi
-            item_remain = QTableWidgetItem(format_currency(reste_budget))
-            item_remain.setFont(QFont("Arial", 14))
-            item_remain.setTextAlignment(Qt.AlignVCenter | Qt.AlignRight)
-            self.projects_table.setItem(row, 2, item_remain)
+    def apply_changed_rows(self, result):
+        """GUI side of refresh_data"""
+        self.refresh_report_projects()
+        if result is None:
+            self.load_data()
+            return
+        if not result:
+            return
+        for project in result['projects']:
+            self.projects_model.update_row(project)
+        for invoice in result['invoices']:
+            self.invoices_model.update_row(invoice)
+        self.status_bar.showMessage(f"Data updated - {datetime.now().strftime('%H:%M:%S')}")
 
-            # Status badge - Use database status instead of calculated status
-            db_status = project_tuple[6] if len(project_tuple) > 6 and project_tuple[6] else 'Active'
-            
-            # Map database status to display colors
-            if db_status == "Completed":
-                status = "Completed"
-                bg_color = "#6b7280"  # Gray for completed
-                text_color = "white"
-            elif db_status == "In Progress":
-                status = "In Progress" 
-                bg_color = "#f59e0b"  # Orange/Yellow for in progress
-                text_color = "white"
-            else:  # Active or any other status
-                status = "Active"
-                bg_color = "#10b981"  # Green for active
-                text_color = "white"
+    def on_write_event(self, event):
+        """Patch the rows a write touched (see app.events) instead of reloading everything"""
+        if isinstance(event, ProjectDeleted):
+            self.projects_model.remove_row(event.project_id)
+            for row in reversed(range(self.invoices_model.rowCount())):
+                invoice = self.invoices_model.record_at(row)
+                if invoice[6] == event.project_id:
+                    self.invoices_model.remove_row(invoice[0])
+            return
+        if isinstance(event, InvoiceDeleted):
+            self.invoices_model.remove_row(event.facture_id)
+            self.pending_projects.add(event.project_id)
+        elif isinstance(event, ProjectCreated):
+            self.pending_projects.add(event.project_id)
+            self.new_projects.add(event.project_id)
+        elif isinstance(event, ProjectUpdated):
+            if not self.projects_model.has_key(event.project_id):
+                return
+            self.pending_projects.add(event.project_id)
+        elif isinstance(event, InvoiceCreated):
+            self.pending_invoices.add(event.facture_id)
+            self.new_invoices.add(event.facture_id)
+        else:
+            # InvoiceUpdated, LinesChanged: also moves the project totals
+            self.pending_invoices.add(event.facture_id)
+        # One background read for all the events of a save
+        if not self.patch_scheduled:
+            self.patch_scheduled = True
+            QTimer.singleShot(0, self.patch_rows)
 
-            # Create status widget
-            status_widget = QWidget()
-            status_layout = QHBoxLayout(status_widget)
-            status_layout.setContentsMargins(10, 10, 10, 10)  # More generous margins
-            status_layout.setAlignment(Qt.AlignCenter)
-            
-            status_label = QLabel(status)
-            status_label.setAlignment(Qt.AlignCenter)
-            status_label.setStyleSheet(f"""
-                QLabel {{
-                    background-color: {bg_color};
-                    color: {text_color};
-                    border-radius: 8px;
-                    font-weight: bold;
-                    font-size: 11px;
-                    padding: 5px 15px;
-                    min-width: 80px;
-                    max-width: 120px;
-                }}
-            """)
-            
-            status_layout.addWidget(status_label)
-            self.projects_table.setCellWidget(row, 3, status_widget)
-            
-            # Set row height for better appearance
-            self.projects_table.setRowHeight(row, 70)  # Increased height even more
+    def patch_rows(self):
+        """Re-read the rows touched by write events in the background"""
+        self.patch_scheduled = False
+        if not self.pending_projects and not self.pending_invoices:
+            return
+        project_ids, invoice_ids = set(self.pending_projects), set(self.pending_invoices)
+        # A newer patch supersedes this one; ids stay pending until applied
+        self.loader.load('patch', self.read_patched_rows,
+                         lambda result: self.apply_patched_rows(result, project_ids, invoice_ids),
+                         project_ids, invoice_ids, set(self.projects_model.keys()))
 
-        # Configure column widths
-        self.projects_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)      # Project Name
-        self.projects_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)  # Budget
-        self.projects_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)  # Remaining  
-        self.projects_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.Fixed)  # Status - Fixed width
-        self.projects_table.setColumnWidth(3, 150)  # Increased width for status column
+    def read_patched_rows(self, conn, project_ids, invoice_ids, shown_projects):
+        """Worker side of patch_rows"""
+        get_project_directory().sync(conn)
+        invoices = read_factures_by_ids(conn, sorted(invoice_ids))
+        # Invoice and line writes move their project's totals (migration 4 triggers)
+        project_ids = project_ids | {invoice[6] for invoice in invoices if invoice[6] in shown_projects}
+        projects = [read_projet_summary(conn, project_id) for project_id in sorted(project_ids)]
+        return {'projects': [p for p in projects if p], 'invoices': invoices}
 
-        # Table style: subtle row striping, no grid lines
-        self.projects_table.setAlternatingRowColors(False)
-        self.projects_table.setStyleSheet(self.projects_table.styleSheet() + """
-            QTableWidget {
-                border-radius: 18px;
-            }
-            QTableWidget::item {
-                border-bottom: 1px solid #e2e8f0;
-                font-size: 15px;
-                padding: 8px;
-            }
-            QTableWidget::item:selected {
-                background: #f1f5f9;
-            }
-        """)
-        self.projects_table.setShowGrid(False)
-        self.projects_table.verticalHeader().setVisible(False)
-        self.projects_table.horizontalHeader().setStyleSheet("""
-            QHeaderView::section {
-                background: #f7fafc;
-                font-weight: bold;
-                font-size: 16px;
-                color: #2d3748;
-                border: none;
-                border-bottom: 2px solid #e2e8f0;
-                padding: 12px 0;
-            }
-        """)
+    def apply_patched_rows(self, result, project_ids, invoice_ids):
+        """GUI side of patch_rows: update changed rows, insert new ones where they sort"""
+        for project in result['projects']:
+            if project['id_projet'] in self.new_projects:
+                self.projects_model.insert_row(project, complete=self.projects_cursor is None)
+            else:
+                self.projects_model.update_row(project)
+        for invoice in result['invoices']:
+            if invoice[0] in self.new_invoices:
+                self.invoices_model.insert_row(invoice, complete=self.invoices_model.is_complete())
+            else:
+                self.invoices_model.update_row(invoice)
+        self.pending_projects -= project_ids
+        self.pending_invoices -= invoice_ids
+        self.new_projects -= project_ids
+        self.new_invoices -= invoice_ids
+        self.refresh_report_projects()
+        self.status_bar.showMessage(f"Data updated - {datetime.now().strftime('%H:%M:%S')}")
+
+    def on_projects_scrolled(self, value):
+        """Fetch the next page of projects when scrolled to the bottom"""
+        if self.projects_cursor is None or value < self.projects_table.verticalScrollBar().maximum():
+            return
+        if self.loader.is_pending('main') or self.loader.is_pending('projects'):
+            return
+        self.loader.load('projects', read_projets_page, self.append_projects_page, self.projects_cursor)
+    
+    def append_projects_page(self, result):
+        projects, self.projects_cursor = result
+        self.projects_model.append_rows(projects)
     
     def on_project_double_clicked(self, row, column):
         """Handle double-click on project row to show details"""
-        if row < len(self.project_ids):
-            project_id = self.project_ids[row]
-            self.view_project_details(project_id)
+        project = self.projects_model.record_at(row)
+        if project:
+            self.view_project_details(project['id_projet'])
     
-    def load_invoices(self, conn):
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT fc.id_facture_charge, fc.date_facture, fc.fournisseur, 
-                       fc.montant_total, p.nom_projet, fc.status
-                FROM FactureCharge fc
-                JOIN Projet p ON fc.id_projet = p.id_projet
-                ORDER BY fc.date_facture DESC
-            """)
-            invoices = cursor.fetchall()
-            self.invoices_table.setRowCount(len(invoices))
-            
-            # Store invoice IDs for later use (hidden from user)
-            self.invoice_ids = []
-            
-            for row, invoice in enumerate(invoices):
-                # Store the actual ID for later use
-                self.invoice_ids.append(invoice[0])
-                
-                # Column 0: Invoice ID (formatted like INV-2025-001)
-                invoice_id = f"INV-2025-{str(invoice[0]).zfill(3)}"
-                id_item = QTableWidgetItem(invoice_id)
-                id_item.setFont(QFont("Arial", 12, QFont.Bold))
-                self.invoices_table.setItem(row, 0, id_item)
-                
-                # Column 1: Supplier
-                supplier_item = QTableWidgetItem(invoice[2])  # Supplier name
-                self.invoices_table.setItem(row, 1, supplier_item)
-                
-                # Column 2: Date
-                date_item = QTableWidgetItem(format_date(invoice[1]))
-                self.invoices_table.setItem(row, 2, date_item)
-                
-                # Column 3: Status with colored indicator
-                status_widget = QWidget()
-                status_layout = QHBoxLayout(status_widget)
-                status_layout.setContentsMargins(12, 8, 12, 8)
-                status_layout.setSpacing(6)
-                
-                # Status dot
-                status_dot = QLabel("●")
-                status_dot.setStyleSheet("font-size: 14px;")
-                
-                # Status text
-                status_text = QLabel()
-                status_text.setFont(QFont("Arial", 11, QFont.Bold))
-                
-                # Use status from database (index 5 in our query)
-                status_name = invoice[5] if len(invoice) > 5 and invoice[5] else "Pending"
-                
-                # Set color based on status
-                status_colors = {
-                    "Paid": "#22c55e",      # Green
-                    "Pending": "#eab308",   # Yellow
-                    "Overdue": "#ef4444"    # Red
-                }
-                status_color = status_colors.get(status_name, "#eab308")
-                
-                status_dot.setStyleSheet(f"color: {status_color}; font-size: 14px;")
-                status_text.setText(status_name)
-                status_text.setStyleSheet(f"color: {status_color}; font-weight: bold; font-size: 11px;")
-                
-                status_layout.addWidget(status_dot)
-                status_layout.addWidget(status_text)
-                status_layout.addStretch()
-                
-                self.invoices_table.setCellWidget(row, 3, status_widget)
-                
-                # Column 4: Action buttons
-                actions_widget = QWidget()
-                actions_layout = QHBoxLayout(actions_widget)
-                actions_layout.setContentsMargins(6, 4, 6, 4)
-                actions_layout.setSpacing(4)
-                
-                # Center the delete button
-                actions_layout.addStretch()  # Add stretch before button
-                
-                # Delete button only (Director only)
-                if self.user_role == "Directeur":
-                    delete_btn = QPushButton("Delete")
-                    delete_btn.setFixedSize(55, 28)  # Fixed size to prevent cutoff
-                    delete_btn.setStyleSheet("""
-                        QPushButton {
-                            background-color: #ef4444;
-                            color: white;
-                            border: none;
-                            padding: 4px 8px;
-                            border-radius: 4px;
-                            font-weight: bold;
-                            font-size: 11px;
-                        }
-                        QPushButton:hover {
-                            background-color: #dc2626;
-                        }
-                    """)
-                    delete_btn.clicked.connect(lambda checked, r=row: self.delete_invoice_at_row(r))
-                    actions_layout.addWidget(delete_btn)
-                else:
-                    # Show read-only label for Employees
-                    read_only_label = QLabel("Read Only")
-                    read_only_label.setStyleSheet("""
-                        QLabel {
-                            color: #6b7280;
-                            font-style: italic;
-                            font-size: 11px;
-                        }
-                    """)
-                    actions_layout.addWidget(read_only_label)
-                
-                actions_layout.addStretch()  # Add stretch after button
-                
-                self.invoices_table.setCellWidget(row, 4, actions_widget)
-                
-                # Set row height for better appearance
-                self.invoices_table.setRowHeight(row, 60)
-        except Exception as e:
-            print(f"Error loading invoices: {e}")
-            import traceback
-            traceback.print_exc()
-            QMessageBox.critical(self, "Error", f"Failed to load invoices: {str(e)}")
+    def fetch_invoices_page(self, after, on_page):
+        """Page reader for the invoices model, run in the background"""
+        def on_result(result):
+            on_page(*result)
+            self.prefetch_invoice_lines(result[0])
+        self.loader.load('invoices', read_factures_page, on_result, after,
+                         on_error=lambda message: self.invoices_model.fetch_failed())
     
     def create_new_project(self):
         if self.user_role != "Directeur":
             QMessageBox.warning(self, "Access Denied", "Only Directors can create new projects.")
             return
-        if show_project_form(parent=self):
-            self.load_data()
+        # The new project's row comes in through on_write_event
+        show_project_form(parent=self)
 
     def edit_invoice_at_row(self, row):
         """Edit invoice at specific row"""
         try:
-            if row < len(self.invoice_ids):
-                invoice_id = self.invoice_ids[row]
+            invoice_id = self.invoices_model.key_at(row)
+            if invoice_id is not None:
                 print(f"Edit invoice {invoice_id} at row {row}")
                 # You can implement the edit functionality here
                 self.edit_invoice()
@@ -1234,8 +1221,8 @@ class MainApplicationWindow(QMainWindow):
             QMessageBox.warning(self, "Access Denied", "Only Directors can delete invoices.")
             return
         try:
-            if row < len(self.invoice_ids):
-                invoice_id = self.invoice_ids[row]
+            invoice_id = self.invoices_model.key_at(row)
+            if invoice_id is not None:
                 print(f"Delete invoice {invoice_id} at row {row}")
                 # Set the selection to this row and call delete
                 self.invoices_table.selectRow(row)
@@ -1247,9 +1234,13 @@ class MainApplicationWindow(QMainWindow):
         """Update the status of an invoice"""
         try:
             self.invoice_statuses[invoice_id] = new_status
-            print(f"Updated invoice {invoice_id} status to {new_status}")
-            # Refresh the table to show the new status
-            self.load_data()
+            
+            conn = create_connection()
+            if conn:
+                update_invoice_status(conn, invoice_id, new_status)
+                conn.close()
+                print(f"Updated invoice {invoice_id} status to {new_status}")
+            # The invoice row is patched through on_write_event
         except Exception as e:
             print(f"Error updating invoice status: {e}")
     
@@ -1265,44 +1256,8 @@ class MainApplicationWindow(QMainWindow):
                 conn.close()
                 print(f"Updated project {project_id} status to {new_status} in database")
             
-            # Then update the UI
-            # Find and update the specific row in the projects table
-            for row in range(self.projects_table.rowCount()):
-                if row < len(self.project_ids) and self.project_ids[row] == project_id:
-                    # Update the status widget with new color
-                    status_colors = {
-                        'Active': '#10b981',      # Green
-                        'In Progress': '#f59e0b', # Orange
-                        'Completed': '#6b7280'    # Gray
-                    }
-                    
-                    bg_color = status_colors.get(new_status, '#6b7280')
-                    
-                    # Create new status widget
-                    status_widget = QWidget()
-                    status_layout = QHBoxLayout(status_widget)
-                    status_layout.setContentsMargins(10, 10, 10, 10)
-                    status_layout.setAlignment(Qt.AlignCenter)
-                    
-                    status_label = QLabel(new_status)
-                    status_label.setAlignment(Qt.AlignCenter)
-                    status_label.setStyleSheet(f"""
-                        QLabel {{
-                            background-color: {bg_color};
-                            color: white;
-                            border-radius: 8px;
-                            font-weight: bold;
-                            font-size: 11px;
-                            padding: 5px 15px;
-                            min-width: 80px;
-                            max-width: 120px;
-                        }}
-                    """)
-                    
-                    status_layout.addWidget(status_label)
-                    self.projects_table.setCellWidget(row, 3, status_widget)
-                    break
-                    
+            # The project row is patched through on_write_event
+            
         except Exception as e:
             print(f"Error updating project status: {e}")
 
@@ -1321,9 +1276,8 @@ class MainApplicationWindow(QMainWindow):
         if not selected_rows:
             return
         
-        row = selected_rows[0].row()
-        if row < len(self.invoice_ids):
-            invoice_id = self.invoice_ids[row]
+        invoice_id = self.invoices_model.key_at(selected_rows[0].row())
+        if invoice_id is not None:
             # TODO: Implement edit invoice form
             QMessageBox.information(self, "Edit Invoice", f"Edit invoice ID: {invoice_id}")
     
@@ -1335,91 +1289,66 @@ class MainApplicationWindow(QMainWindow):
         selected_rows = self.invoices_table.selectionModel().selectedRows()
         if not selected_rows:
             return
-        row = selected_rows[0].row()
-        if row < len(self.invoice_ids):
-            invoice_id = self.invoice_ids[row]
+        invoice_id = self.invoices_model.key_at(selected_rows[0].row())
+        if invoice_id is not None:
             reply = QMessageBox.question(self, "Delete Invoice", 
                                        "Are you sure you want to delete this invoice?",
                                        QMessageBox.Yes | QMessageBox.No)
             if reply == QMessageBox.Yes:
                 try:
                     conn = create_connection()
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM FactureCharge WHERE id_facture_charge = ?", (invoice_id,))
-                    conn.commit()
+                    deleted = delete_facture_charge(conn, invoice_id)
                     conn.close()
-                    QMessageBox.information(self, "Success", "Invoice deleted successfully")
-                    self.load_data()  # Refresh data
+                    if deleted:
+                        QMessageBox.information(self, "Success", "Invoice deleted successfully")
+                    else:
+                        QMessageBox.critical(self, "Error", "Error deleting invoice")
                 except Exception as e:
                     QMessageBox.critical(self, "Error", f"Error deleting invoice: {str(e)}")
     
     def show_invoice_details(self, index):
         """Show invoice details dialog when double-clicking an invoice"""
         row = index.row()
-        if row < self.invoices_table.rowCount() and row < len(self.invoice_ids):
-            # Get invoice data from the new table structure
-            invoice_id = self.invoice_ids[row]
+        invoice_id = self.invoices_model.key_at(row)
+        if invoice_id is not None:
+            # Get invoice data from the model
+            model = self.invoices_model
             current_status = self.invoice_statuses.get(invoice_id, 'Pending')  # Get current status
             
             invoice_data = {
                 'id': invoice_id,
-                'number': self.invoices_table.item(row, 0).text() if self.invoices_table.item(row, 0) else '',  # Invoice ID 
-                'supplier': self.invoices_table.item(row, 1).text() if self.invoices_table.item(row, 1) else '',  # Supplier
-                'date': self.invoices_table.item(row, 2).text() if self.invoices_table.item(row, 2) else '',    # Date
+                'number': model.data(model.index(row, 0)),    # Invoice ID 
+                'supplier': model.data(model.index(row, 1)),  # Supplier
+                'date': model.data(model.index(row, 2)),      # Date
                 'amount': 'DH10,000.00',  # Placeholder amount - you can get this from database
                 'status': current_status  # Pass current status
             }
             
-            # Get expense lines from database
-            expense_lines = []
-            try:
-                conn = create_connection()
-                if conn:
-                    expense_lines = read_lignes_charge_by_facture(conn, invoice_id)
-                    conn.close()
-            except Exception as e:
-                print(f"Error fetching expense lines: {e}")
-            
-            # Show the invoice details dialog with expense lines
-            show_invoice_details(invoice_data, expense_lines, self)
+            # Get expense lines (usually prefetched) in the background, then
+            # show the invoice details dialog with them
+            self.loader.load('invoice_lines', get_line_cache().get_lines,
+                             lambda expense_lines: show_invoice_details(invoice_data, expense_lines, self),
+                             invoice_id)
     
     def create_new_invoice(self):
-        if show_invoice_form(parent=self):
-            self.load_data()
+        # The new invoice's row comes in through on_write_event
+        show_invoice_form(parent=self)
     
     def view_project_details(self, project_id):
         """View detailed information for a specific project"""
-        try:
-            conn = create_connection()
-            cursor = conn.cursor()
-            
-            # Get project details
-            cursor.execute("SELECT * FROM Projet WHERE id_projet = ?", (project_id,))
-            project = cursor.fetchone()
-            
-            if not project:
-                QMessageBox.warning(self, "Error", "Project not found")
-                return
-            
-            conn.close()
-            
-            # Convert project tuple to dictionary
-            project_data = {
-                'id_projet': project[0],
-                'nom_projet': project[1],
-                'date_estimation': project[2],
-                'date_lancement': project[3],
-                'budget_max': project[4],
-                'montant_investi': project[5],
-                'status': project[6] if len(project) > 6 else 'Active'
-            }
-            
-            # Show project details dialog
-            from app.gui.project_details import show_project_details
-            show_project_details(project_data, self, self.user_role)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load project details: {str(e)}")
+        self.loader.load('project_details', read_projet_summary, self.show_project_details, project_id,
+                         on_error=lambda message: QMessageBox.critical(
+                             self, "Error", f"Failed to load project details: {message}"))
+    
+    def show_project_details(self, project_data):
+        """Open the project details dialog once its summary is loaded"""
+        if not project_data:
+            QMessageBox.warning(self, "Error", "Project not found")
+            return
+        
+        # Show project details dialog
+        from app.gui.project_details import show_project_details
+        show_project_details(project_data, self, self.user_role)
     
     def show_project_details_dialog(self, project, invoices):
         """Show project details in a dialog"""
@@ -1522,9 +1451,14 @@ class MainApplicationWindow(QMainWindow):
     # User Management Methods
     def load_users_data(self):
         """Load users data into the table"""
+        from app.db import get_all_users
+        self.loader.load('users', lambda conn: get_all_users(), self.display_users_table,
+                         on_error=lambda message: QMessageBox.critical(
+                             self, "Error", f"Failed to load users: {message}"))
+    
+    def display_users_table(self, users):
+        """Fill the users table"""
         try:
-            from app.db import get_all_users
-            users = get_all_users()
             if not users:
                 self.users_table.setRowCount(0)
                 return
@@ -1991,21 +1925,37 @@ class MainApplicationWindow(QMainWindow):
             QMessageBox.critical(self, "Error", f"Failed to delete user: {str(e)}")
     
     def load_projects_for_reports(self):
-        """Load projects into the combo box for reports"""
+        """Load projects into the combo box for reports, from the project directory"""
+        directory = get_project_directory()
+        if directory.is_loaded():
+            self.refresh_report_projects()
+        else:
+            self.loader.load('report_projects', directory.sync,
+                             lambda changed: self.refresh_report_projects())
+    
+    def refresh_report_projects(self):
+        """Refill the reports project combo box if the project directory changed"""
+        directory = get_project_directory()
+        if not directory.is_loaded() or directory.version == self.report_projects_version:
+            return
+        self.report_projects_version = directory.version
+        self.fill_report_projects(directory.projects())
+    
+    def fill_report_projects(self, projects):
+        """Fill the reports project combo box, keeping the selected project"""
         try:
-            from app.db import create_connection, read_projets
-            conn = create_connection()
-            if conn:
-                projects = read_projets(conn)
-                self.project_combo.clear()
-                self.project_combo.addItem("All Projects", None)
-                
-                for project in projects:
-                    project_name = project[1] if len(project) > 1 else "Unknown"
-                    project_id = project[0] if len(project) > 0 else None
-                    self.project_combo.addItem(project_name, project_id)
-                
-                conn.close()
+            selected_project_id = self.project_combo.currentData()
+            self.project_combo.clear()
+            self.project_combo.addItem("All Projects", None)
+            
+            for project in projects:
+                project_name = project[1] if len(project) > 1 else "Unknown"
+                project_id = project[0] if len(project) > 0 else None
+                self.project_combo.addItem(project_name, project_id)
+            
+            index = self.project_combo.findData(selected_project_id)
+            if index >= 0:
+                self.project_combo.setCurrentIndex(index)
         except Exception as e:
             print(f"Error loading projects for reports: {e}")
     
@@ -2017,6 +1967,7 @@ class MainApplicationWindow(QMainWindow):
         elif report_type == 'complete':
             self.invoice_report_btn.setChecked(False)
             self.complete_report_btn.setChecked(True)
+        self.detailed_report_check.setEnabled(self.complete_report_btn.isChecked())
     
     def select_date_range(self, button):
         """Handle date range selection"""
@@ -2045,7 +1996,7 @@ class MainApplicationWindow(QMainWindow):
             if self.invoice_report_btn.isChecked():
                 report_type = 'invoice'
             elif self.complete_report_btn.isChecked():
-                report_type = 'complete'
+                report_type = 'detailed' if self.detailed_report_check.isChecked() else 'complete'
             else:
                 QMessageBox.warning(self, "No Selection", "Please select a report type.")
                 return
@@ -2071,46 +2022,67 @@ class MainApplicationWindow(QMainWindow):
                 custom_end_date = self.end_date_edit.date().toString("yyyy-MM-dd")
             
             # Validate complete report requires project selection
-            if report_type == 'complete' and selected_project_id is None:
+            if report_type in ('complete', 'detailed') and selected_project_id is None:
                 QMessageBox.warning(self, "Project Required", 
                                   "Complete project report requires selecting a specific project.")
                 return
             
-            # Generate PDF
-            from app.pdf_generator import PDFReportGenerator
-            
-            # Show progress dialog
-            from PyQt5.QtWidgets import QProgressDialog
-            from PyQt5.QtCore import Qt
+            # Queue the report; it is built in the background
+            job_id = self.report_queue.submit(
+                report_type,
+                project_id=selected_project_id,
+                period=date_value,
+                custom_start_date=custom_start_date,
+                custom_end_date=custom_end_date
+            )
             
-            progress = QProgressDialog("Generating PDF report...", "Cancel", 0, 0, self)
+            progress = QProgressDialog("Waiting for previous reports...", "Cancel", 0, 0, self)
             progress.setWindowTitle("Generating Report")
-            progress.setWindowModality(Qt.WindowModal)
+            progress.setWindowModality(Qt.NonModal)
+            progress.setAutoClose(False)
+            progress.setAutoReset(False)
             progress.setMinimumDuration(0)
+            progress.canceled.connect(lambda: self.report_queue.cancel(job_id))
             progress.show()
+            self.report_dialogs[job_id] = progress
             
-            # Process events to show dialog
-            QApplication.processEvents()
-            
-            generator = PDFReportGenerator()
-            
-            if report_type == 'invoice':
-                output_file = generator.generate_invoice_report(
-                    project_id=selected_project_id,
-                    period=date_value,
-                    custom_start_date=custom_start_date,
-                    custom_end_date=custom_end_date
-                )
-            else:  # complete
-                output_file = generator.generate_complete_project_report(
-                    project_id=selected_project_id,
-                    period=date_value,
-                    custom_start_date=custom_start_date,
-                    custom_end_date=custom_end_date
-                )
-            
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to generate PDF report:\n{str(e)}")
+            import traceback
+            traceback.print_exc()
+    
+    def on_report_progress(self, job_id, phase, done, total):
+        """Show the phase and row/page progress of a report job"""
+        progress = self.report_dialogs.get(job_id)
+        if progress is None:
+            return
+        if phase == PHASE_FETCH:
+            progress.setLabelText(f"Fetching data... {done} invoices")
+        elif phase == PHASE_BUILD:
+            progress.setLabelText(f"Building tables... {done}/{total} rows")
+        else:
+            progress.setLabelText(f"Laying out page {done}...")
+        progress.setRange(0, total)
+        progress.setValue(done if total else 0)
+    
+    def close_report_dialog(self, job_id):
+        progress = self.report_dialogs.pop(job_id, None)
+        if progress is not None:
             progress.close()
-            
+            progress.deleteLater()
+    
+    def on_report_cancelled(self, job_id):
+        self.close_report_dialog(job_id)
+        self.status_bar.showMessage("Report generation cancelled")
+    
+    def on_report_failed(self, job_id, message):
+        self.close_report_dialog(job_id)
+        QMessageBox.critical(self, "Error", f"Failed to generate PDF report:\n{message}")
+    
+    def on_report_finished(self, job_id, output_file):
+        """GUI side of a finished report job"""
+        self.close_report_dialog(job_id)
+        try:
             # Show success message with option to open file
             from PyQt5.QtWidgets import QPushButton
             msg = QMessageBox(self)
@@ -2145,8 +2117,4 @@ class MainApplicationWindow(QMainWindow):
                     subprocess.call(['open' if os.name == 'posix' else 'xdg-open', folder_path])
             
         except Exception as e:
-            if 'progress' in locals():
-                progress.close()
-            QMessageBox.critical(self, "Error", f"Failed to generate PDF report:\n{str(e)}")
-            import traceback
-            traceback.print_exc()
+            print(f"Error opening report: {e}")
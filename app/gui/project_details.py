@@ -6,8 +6,11 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
 
-from app.db import create_connection, read_lignes_charge_by_facture
+from app.db import (create_connection, read_projet_summary, iter_invoices, update_projet_budget,
+                    delete_facture_charge)
+from app.line_cache import LINE_PREFETCH_INVOICES, get_line_cache
 from app.utils import format_currency, format_date
+from app.gui.loaders import DataLoader
 
 
 class ProjectDetailsDialog(QDialog):
@@ -19,6 +22,7 @@ class ProjectDetailsDialog(QDialog):
         self.parent_window = parent
         self.user_role = user_role  # Store user role for access control
         self.invoice_ids = []
+        self.loader = DataLoader(self)
         self.project_statuses = {
             'Active': '#10b981',      # Green
             'In Progress': '#f59e0b', # Orange
@@ -237,7 +241,7 @@ class ProjectDetailsDialog(QDialog):
         # Get values
         budget_max = self.project_data.get('budget_max', 0)
         montant_investi = self.project_data.get('montant_investi', 0)
-        remaining = budget_max - montant_investi
+        remaining = self.project_data.get('reste_budget', budget_max - montant_investi)
         
         # Left Column
         left_column = QVBoxLayout()
@@ -454,28 +458,22 @@ class ProjectDetailsDialog(QDialog):
         return tab_widget
     
     def load_project_invoices(self):
-        """Load invoices for the current project"""
-        try:
-            conn = create_connection()
-            if not conn:
-                return
-            
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id_facture_charge, date_facture, fournisseur, montant_total, status
-                FROM FactureCharge 
-                WHERE id_projet = ?
-                ORDER BY date_facture DESC
-            """, (self.project_data.get('id_projet'),))
-            
-            invoices = cursor.fetchall()
-            conn.close()
-            
-            self.display_invoices_table(invoices)
-            
-        except Exception as e:
-            print(f"Error loading project invoices: {e}")
-            QMessageBox.critical(self, "Error", f"Failed to load project invoices: {str(e)}")
+        """Load invoices for the current project in the background"""
+        self.loader.load('invoices', self.read_project_invoices, self.display_invoices_table,
+                         self.project_data.get('id_projet'),
+                         on_error=lambda message: QMessageBox.critical(
+                             self, "Error", f"Failed to load project invoices: {message}"))
+    
+    @staticmethod
+    def read_project_invoices(conn, project_id):
+        """Worker side of load_project_invoices: (id, date, supplier, amount, status) rows.
+        
+        Also prefetches the expense lines of the first invoices in one query,
+        so opening them does not cost a query each.
+        """
+        invoices = [(row[0], row[1], row[2], row[3], row[5]) for row in iter_invoices(conn, id_projet=project_id)]
+        get_line_cache().prefetch(conn, [invoice[0] for invoice in invoices[:LINE_PREFETCH_INVOICES]])
+        return invoices
     
     def display_invoices_table(self, invoices):
         """Display invoices in the table with status badges and action buttons"""
@@ -740,25 +738,16 @@ class ProjectDetailsDialog(QDialog):
                 # Update the project in database
                 conn = create_connection()
                 if conn:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        UPDATE Projet 
-                        SET budget_max = ?
-                        WHERE id_projet = ?
-                    """, (new_budget, self.project_data.get('id_projet')))
-                    conn.commit()
-                    conn.close()
+                    update_projet_budget(conn, self.project_data.get('id_projet'), new_budget)
                     
-                    # Update local data
+                    # Update local data (the summary carries the derived KPIs)
+                    self.project_data = read_projet_summary(conn, self.project_data.get('id_projet')) or self.project_data
                     self.project_data['budget_max'] = new_budget
+                    conn.close()
                     
-                    # Refresh the dialog
+                    # Refresh the dialog (the main window patches its row from the write event)
                     QMessageBox.information(self, "Success", "Project budget updated successfully!")
                     
-                    # Refresh parent window and close this dialog
-                    if self.parent_window and hasattr(self.parent_window, 'load_data'):
-                        self.parent_window.load_data()
-                    
                     # Recreate the project info section with new data
                     self.setup_ui()
                     
@@ -774,9 +763,6 @@ class ProjectDetailsDialog(QDialog):
             if show_invoice_form(self):
                 # Refresh the invoices table
                 self.load_project_invoices()
-                # Refresh parent window if available
-                if self.parent_window and hasattr(self.parent_window, 'load_data'):
-                    self.parent_window.load_data()
                     
         except Exception as e:
             print(f"Error adding invoice: {e}")
@@ -797,27 +783,22 @@ class ProjectDetailsDialog(QDialog):
                     'status': self.get_invoice_status(invoice_id)
                 }
                 
-                # Get expense lines from database
-                expense_lines = []
-                try:
-                    conn = create_connection()
-                    if conn:
-                        expense_lines = read_lignes_charge_by_facture(conn, invoice_id)
-                        conn.close()
-                except Exception as e:
-                    print(f"Error fetching expense lines: {e}")
-                
-                # Open invoice details dialog with expense lines
-                from app.gui.invoice_form import show_invoice_details
-                show_invoice_details(invoice_data, expense_lines, self)
-                
-                # Refresh the table
-                self.load_project_invoices()
+                # Get expense lines (usually prefetched) in the background,
+                # then open the invoice details dialog with them
+                self.loader.load('invoice_lines', get_line_cache().get_lines,
+                                 lambda expense_lines: self.show_invoice_lines(invoice_data, expense_lines),
+                                 invoice_id)
                 
         except Exception as e:
             print(f"Error editing invoice: {e}")
             QMessageBox.critical(self, "Error", f"Failed to edit invoice: {str(e)}")
     
+    def show_invoice_lines(self, invoice_data, expense_lines):
+        """Open the invoice details dialog, then refresh the table"""
+        from app.gui.invoice_form import show_invoice_details
+        show_invoice_details(invoice_data, expense_lines, self)
+        self.load_project_invoices()
+    
     def delete_invoice(self, row):
         """Delete the selected invoice"""
         # Check if user has permission
@@ -836,18 +817,16 @@ class ProjectDetailsDialog(QDialog):
                 if reply == QMessageBox.Yes:
                     conn = create_connection()
                     if conn:
-                        cursor = conn.cursor()
-                        cursor.execute("DELETE FROM FactureCharge WHERE id_facture_charge = ?", (invoice_id,))
-                        conn.commit()
+                        deleted = delete_facture_charge(conn, invoice_id)
                         conn.close()
+                        if not deleted:
+                            QMessageBox.critical(self, "Error", "Failed to delete invoice")
+                            return
                         
                         QMessageBox.information(self, "Success", "Invoice deleted successfully")
                         
                         # Refresh the table
                         self.load_project_invoices()
-                        # Refresh parent window if available
-                        if self.parent_window and hasattr(self.parent_window, 'load_data'):
-                            self.parent_window.load_data()
                             
         except Exception as e:
             print(f"Error deleting invoice: {e}")
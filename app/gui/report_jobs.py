@@ -0,0 +1,124 @@
+"""
+Background PDF report generation
+
+Reports are built by a ReportTask on a dedicated single-thread QThreadPool,
+so several requests queue up and run one after another while the window
+stays responsive. Progress arrives per phase (data fetch, table build, page
+layout). Cancelling a job sets the event the generator checks between rows
+and on every page, which aborts doc.build without writing the file.
+"""
+
+import threading
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from app.report_cache import ReportCache
+
+# ReportLab documents are built one at a time; further jobs wait their turn
+REPORT_THREADS = 1
+
+
+class ReportSignals(QObject):
+    """Signals a ReportTask emits from its worker thread"""
+
+    progress = pyqtSignal(int, str, int, int)
+    finished = pyqtSignal(int, str)
+    failed = pyqtSignal(int, str)
+
+
+class ReportTask(QRunnable):
+    """Generates one report: report_type is 'invoice', 'complete' or 'detailed'"""
+
+    def __init__(self, job_id, report_type, options, cache=None):
+        super().__init__()
+        self.job_id = job_id
+        self.report_type = report_type
+        self.options = options
+        self.cache = cache
+        self.signals = ReportSignals()
+        self.cancelled = threading.Event()
+
+    def on_progress(self, phase, done, total):
+        self.signals.progress.emit(self.job_id, phase, done, total)
+
+    def run(self):
+        if self.cancelled.is_set():
+            return
+        # ReportLab is only imported once a report is actually requested
+        from app.pdf_generator import PDFReportGenerator, ReportCancelled
+        try:
+            generator = PDFReportGenerator(progress=self.on_progress, cancel_event=self.cancelled,
+                                           cache=self.cache)
+            if self.report_type == 'invoice':
+                output_file = generator.generate_invoice_report(**self.options)
+            elif self.report_type == 'detailed':
+                output_file = generator.generate_detailed_project_report(**self.options)
+            else:
+                output_file = generator.generate_complete_project_report(**self.options)
+        except ReportCancelled:
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(self.job_id, str(e))
+            return
+        self.signals.finished.emit(self.job_id, output_file)
+
+
+class ReportQueue(QObject):
+    """Queues report jobs and relays their progress to the GUI thread"""
+
+    progress = pyqtSignal(int, str, int, int)   # job id, phase, done, total
+    finished = pyqtSignal(int, str)             # job id, output file
+    failed = pyqtSignal(int, str)               # job id, error message
+    cancelled = pyqtSignal(int)                 # job id
+
+    def __init__(self, parent=None, cache=None):
+        super().__init__(parent)
+        # Identical requests on unchanged data are served from disk
+        self.cache = cache or ReportCache()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(REPORT_THREADS)
+        self._next_id = 0
+        self._jobs = {}   # job id -> (cancelled event, signals)
+
+    def submit(self, report_type, **options):
+        """Queue a report; options are passed to the generator. Return the job id"""
+        self._next_id += 1
+        job_id = self._next_id
+        task = ReportTask(job_id, report_type, options, self.cache)
+        task.signals.progress.connect(self._on_progress)
+        task.signals.finished.connect(self._on_finished)
+        task.signals.failed.connect(self._on_failed)
+        self._jobs[job_id] = (task.cancelled, task.signals)
+        self.pool.start(task)
+        return job_id
+
+    def pending(self):
+        """Return the number of jobs queued or running"""
+        return len(self._jobs)
+
+    def cancel(self, job_id):
+        """Abort a job; a running build stops at its next row or page"""
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return
+        job[0].set()
+        self.cancelled.emit(job_id)
+
+    def cancel_all(self):
+        """Abort every queued or running job"""
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+
+    def _on_progress(self, job_id, phase, done, total):
+        if job_id in self._jobs:
+            self.progress.emit(job_id, phase, done, total)
+
+    def _on_finished(self, job_id, output_file):
+        if self._jobs.pop(job_id, None) is not None:
+            self.finished.emit(job_id, output_file)
+
+    def _on_failed(self, job_id, message):
+        if self._jobs.pop(job_id, None) is not None:
+            self.failed.emit(job_id, message)
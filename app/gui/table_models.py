@@ -0,0 +1,651 @@
+import math
+
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyle, QApplication
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QRectF, QSize, QEvent, pyqtSignal
+from PyQt5.QtGui import QFont, QColor, QPainter, QPainterPath, QFontMetrics
+
+from app.utils import format_currency, format_date
+
+
+PROJECT_STATUS_COLORS = {
+    'Active': '#10b981',       # Green
+    'In Progress': '#f59e0b',  # Orange
+    'Completed': '#6b7280'     # Gray
+}
+
+INVOICE_STATUS_COLORS = {
+    'Paid': '#22c55e',     # Green
+    'Pending': '#eab308',  # Yellow
+    'Overdue': '#ef4444'   # Red
+}
+
+
+class KeyedTableModel(QAbstractTableModel):
+    """Table model over records identified by a key.
+
+    Subclasses define HEADERS, row_key(record) and display(record, column).
+    apply_rows() brings the model to a freshly loaded list with a keyed diff,
+    so a refresh only emits signals for rows that were removed, inserted,
+    moved or whose displayed cells changed; selection and scroll position
+    follow the rows instead of being reset. Subclasses that also define
+    sort_key(record), matching their reader's ORDER BY, can take single new
+    rows with insert_row().
+    """
+
+    HEADERS = []
+    SORT_DESCENDING = False
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._records = []
+        self._rows_by_id = {}
+
+    def row_key(self, record):
+        raise NotImplementedError
+
+    def display(self, record, column):
+        raise NotImplementedError
+
+    def sort_key(self, record):
+        raise NotImplementedError
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def _reindex(self):
+        self._rows_by_id = {self.row_key(record): row for row, record in enumerate(self._records)}
+
+    def set_rows(self, records):
+        """Replace every row"""
+        self.beginResetModel()
+        self._records = list(records)
+        self._reindex()
+        self.endResetModel()
+
+    def append_rows(self, records):
+        """Add rows at the end (next page)"""
+        records = list(records)
+        if not records:
+            return
+        first = len(self._records)
+        self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+        self._records.extend(records)
+        for row, record in enumerate(records, start=first):
+            self._rows_by_id[self.row_key(record)] = row
+        self.endInsertRows()
+
+    def update_row(self, record):
+        """Replace one row in place; return False if the record is not loaded"""
+        row = self._rows_by_id.get(self.row_key(record))
+        if row is None:
+            return False
+        self._replace(row, record)
+        return True
+
+    def insert_row(self, record, complete=True):
+        """Insert a new record at its sort position.
+
+        If it sorts after every loaded row while more pages remain
+        (complete=False), nothing is inserted: that page will bring it.
+        Returns True if a row was inserted or updated.
+        """
+        if self.update_row(record):
+            return True
+        key = self.sort_key(record)
+        position = len(self._records)
+        for row, existing in enumerate(self._records):
+            existing_key = self.sort_key(existing)
+            if existing_key < key if self.SORT_DESCENDING else existing_key > key:
+                position = row
+                break
+        else:
+            if not complete:
+                return False
+        self.beginInsertRows(QModelIndex(), position, position)
+        self._records.insert(position, record)
+        self.endInsertRows()
+        self._reindex()
+        return True
+
+    def remove_row(self, key):
+        """Remove the row of a record; return False if it is not loaded"""
+        row = self._rows_by_id.get(key)
+        if row is None:
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._records[row]
+        self.endRemoveRows()
+        self._reindex()
+        return True
+
+    def _replace(self, row, record):
+        """Store record on row and emit dataChanged over the cells that differ"""
+        previous = self._records[row]
+        self._records[row] = record
+        if previous == record:
+            return
+        changed = [column for column in range(len(self.HEADERS))
+                   if self.display(previous, column) != self.display(record, column)]
+        if changed:
+            self.dataChanged.emit(self.index(row, changed[0]), self.index(row, changed[-1]))
+
+    def apply_rows(self, records):
+        """Bring the rows to records (same order) with minimal model signals"""
+        records = list(records)
+        if not self._records:
+            self.set_rows(records)
+            return
+        keys = [self.row_key(record) for record in records]
+        wanted = set(keys)
+
+        # Removals, bottom-up so earlier row numbers stay valid
+        row = len(self._records) - 1
+        while row >= 0:
+            if self.row_key(self._records[row]) in wanted:
+                row -= 1
+                continue
+            last = row
+            while row >= 0 and self.row_key(self._records[row]) not in wanted:
+                row -= 1
+            self.beginRemoveRows(QModelIndex(), row + 1, last)
+            del self._records[row + 1:last + 1]
+            self.endRemoveRows()
+
+        # Every remaining row is wanted: walk the new order, inserting runs of
+        # new keys and moving rows whose sort position changed
+        present = {self.row_key(record) for record in self._records}
+        position = 0
+        while position < len(records):
+            key = keys[position]
+            if position < len(self._records) and self.row_key(self._records[position]) == key:
+                self._replace(position, records[position])
+                position += 1
+            elif key not in present:
+                end = position
+                while end < len(records) and keys[end] not in present:
+                    end += 1
+                self.beginInsertRows(QModelIndex(), position, end - 1)
+                self._records[position:position] = records[position:end]
+                self.endInsertRows()
+                present.update(keys[position:end])
+                position = end
+            else:
+                source = next(row for row in range(position + 1, len(self._records))
+                              if self.row_key(self._records[row]) == key)
+                self.beginMoveRows(QModelIndex(), source, source, QModelIndex(), position)
+                self._records.insert(position, self._records.pop(source))
+                self.endMoveRows()
+                self._replace(position, records[position])
+                position += 1
+        self._reindex()
+
+    def record_at(self, row):
+        """Return the record shown on a row, or None"""
+        if 0 <= row < len(self._records):
+            return self._records[row]
+        return None
+
+    def key_at(self, row):
+        """Return the key of the record shown on a row, or None"""
+        record = self.record_at(row)
+        return None if record is None else self.row_key(record)
+
+    def keys(self):
+        """Return the keys of the rows currently loaded"""
+        return list(self._rows_by_id)
+
+    def has_key(self, key):
+        """True if the record with this key is loaded"""
+        return key in self._rows_by_id
+
+
+class ProjectsTableModel(KeyedTableModel):
+    """Projects grid backed by project summary dicts (see read_projets_page)"""
+
+    HEADERS = ["Project Name", "Budget", "Remaining", "Status"]
+    STATUS_COLUMN = 3
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._font = QFont("Arial", 14)
+
+    def row_key(self, project):
+        return project['id_projet']
+
+    def sort_key(self, project):
+        return project['nom_projet'], project['id_projet']
+
+    def display(self, project, column):
+        if column == 0:
+            return project['nom_projet'] or 'N/A'
+        if column == 1:
+            return format_currency(project['budget_max'])
+        if column == 2:
+            return format_currency(project['reste_budget'])
+        if column == self.STATUS_COLUMN:
+            status = project['status']
+            return status if status in PROJECT_STATUS_COLORS else 'Active'
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        project = self._records[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            return self.display(project, column)
+        elif role == Qt.TextAlignmentRole:
+            if column in (1, 2):
+                return int(Qt.AlignVCenter | Qt.AlignRight)
+            if column == self.STATUS_COLUMN:
+                return int(Qt.AlignCenter)
+            return int(Qt.AlignVCenter | Qt.AlignLeft)
+        elif role == Qt.FontRole and column != self.STATUS_COLUMN:
+            return self._font
+        elif role == Qt.UserRole:
+            return project
+        return None
+
+
+class StatusPillDelegate(QStyledItemDelegate):
+    """Paints a status as a rounded colored pill; no per-row widgets"""
+
+    def __init__(self, colors, default_color='#10b981', parent=None):
+        super().__init__(parent)
+        self.colors = colors
+        self.default_color = default_color
+        self.font = QFont("Arial")
+        self.font.setBold(True)
+        self.font.setPixelSize(11)
+        self.metrics = QFontMetrics(self.font)
+
+    def paint(self, painter, option, index):
+        # Selection/hover background from the style, without the text
+        self.initStyleOption(option, index)
+        status = option.text
+        option.text = ""
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.CE_ItemViewItem, option, painter, option.widget)
+
+        width = min(max(self.metrics.horizontalAdvance(status) + 30, 80), 120)
+        height = self.metrics.height() + 10
+        rect = QRectF(option.rect.center().x() - width / 2, option.rect.center().y() - height / 2, width, height)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        path = QPainterPath()
+        path.addRoundedRect(rect, 8, 8)
+        painter.fillPath(path, QColor(self.colors.get(status, self.default_color)))
+        painter.setPen(QColor("white"))
+        painter.setFont(self.font)
+        painter.drawText(rect, Qt.AlignCenter, status)
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QSize(150, 70)
+
+
+class InvoicesTableModel(KeyedTableModel):
+    """Invoices list fetched lazily, one keyset page at a time.
+
+    fetch_page(after, on_page) must eventually call on_page(rows, next_cursor)
+    with a read_factures_page() result (typically from a background loader);
+    the view calls fetchMore() as the user scrolls towards the end.
+    """
+
+    HEADERS = ["Invoice ID", "Supplier", "Date", "Status", "Actions", ""]
+    STATUS_COLUMN = 3
+    ACTIONS_COLUMN = 4
+    SORT_DESCENDING = True   # newest first, like read_factures_page
+
+    def __init__(self, fetch_page, parent=None):
+        super().__init__(parent)
+        self.fetch_page = fetch_page
+        self._cursor = None
+        self._fetching = False
+        self._id_font = QFont("Arial", 12, QFont.Bold)
+
+    def row_key(self, invoice):
+        return invoice[0]
+
+    def sort_key(self, invoice):
+        return invoice[1], invoice[0]
+
+    def display(self, invoice, column):
+        if column == 0:
+            return f"INV-2025-{str(invoice[0]).zfill(3)}"
+        if column == 1:
+            return invoice[2]
+        if column == 2:
+            return format_date(invoice[1])
+        if column == self.STATUS_COLUMN:
+            return invoice[5] or "Pending"
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        invoice = self._records[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            return self.display(invoice, column)
+        elif role == Qt.FontRole and column == 0:
+            return self._id_font
+        elif role == Qt.UserRole:
+            return invoice
+        return None
+
+    def begin_reload(self):
+        """Stop fetching further pages until apply_page() delivers the reload"""
+        self._fetching = True
+
+    def apply_page(self, rows, cursor):
+        """Bring the loaded rows to a reload of the same range (see apply_rows)"""
+        self._cursor = cursor
+        self._fetching = False
+        self.apply_rows(rows)
+
+    def fetch_failed(self):
+        """Allow fetching again after a failed page load"""
+        self._fetching = False
+
+    def is_complete(self):
+        """True once every page has been loaded"""
+        return self._cursor is None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._cursor is not None and not self._fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._fetching = True
+        self.fetch_page(self._cursor, self._append_page)
+
+    def _append_page(self, rows, cursor):
+        self._cursor = cursor
+        self._fetching = False
+        self.append_rows(rows)
+
+
+class ExpenseLine:
+    """One editable expense line held as numbers; id_ligne is None until saved"""
+
+    __slots__ = ('id_ligne', 'motif', 'prix_unitaire', 'quantite', 'montant', 'saved')
+
+    def __init__(self, id_ligne, motif, prix_unitaire, quantite, montant):
+        self.id_ligne = id_ligne
+        self.motif = motif
+        self.prix_unitaire = prix_unitaire
+        self.quantite = quantite
+        self.montant = montant
+        # Values as last read from / written to the database
+        self.saved = self.values() if id_ligne is not None else None
+
+    def values(self):
+        return self.motif, self.prix_unitaire, self.quantite, self.montant
+
+    def is_valid(self):
+        return bool(self.motif) and self.prix_unitaire > 0 and self.quantite > 0
+
+
+class ExpenseLinesTableModel(QAbstractTableModel):
+    """Editable expense lines of one invoice, with a running subtotal.
+
+    Cells store numbers and are only formatted for display. Editing a price
+    or quantity recomputes that line's amount and moves the subtotal by the
+    difference, so an edit costs O(1) whatever the number of lines. Loaded
+    lines remember their saved values and removed ones their id, so changes()
+    gives exactly what a save has to write.
+    """
+
+    HEADERS = ["Expense Lines", "Unit Price", "Quantity", "Total"]
+    MOTIF_COLUMN, PRICE_COLUMN, QUANTITY_COLUMN, TOTAL_COLUMN = range(4)
+
+    subtotal_changed = pyqtSignal(float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lines = []
+        self.removed_ids = set()
+        self.subtotal = 0.0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._lines)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid() and index.column() != self.TOTAL_COLUMN:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        line = self._lines[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == self.MOTIF_COLUMN:
+                return line.motif
+            if column == self.PRICE_COLUMN:
+                return f"DH{line.prix_unitaire:,.2f}"
+            if column == self.QUANTITY_COLUMN:
+                return f"{line.quantite:g}"
+            return f"DH{line.montant:,.2f}"
+        elif role == Qt.EditRole:
+            # Numbers, so the default delegate edits them with a spin box
+            return (line.motif, line.prix_unitaire, line.quantite, line.montant)[column]
+        elif role == Qt.TextAlignmentRole and column != self.MOTIF_COLUMN:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        line = self._lines[index.row()]
+        column = index.column()
+        if column == self.MOTIF_COLUMN:
+            line.motif = str(value).strip()
+            self.dataChanged.emit(index, index)
+            return True
+        if column not in (self.PRICE_COLUMN, self.QUANTITY_COLUMN):
+            return False
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return False
+        if number < 0:
+            return False
+        if column == self.PRICE_COLUMN:
+            line.prix_unitaire = number
+        else:
+            line.quantite = number
+        self._set_amount(index.row(), line.prix_unitaire * line.quantite)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def _set_amount(self, row, montant):
+        line = self._lines[row]
+        self.subtotal += montant - line.montant
+        line.montant = montant
+        total_index = self.index(row, self.TOTAL_COLUMN)
+        self.dataChanged.emit(total_index, total_index)
+        self.subtotal_changed.emit(self.subtotal)
+
+    def set_lines(self, rows):
+        """Load read_lignes_charge_by_facture() rows as the saved state"""
+        self.beginResetModel()
+        self._lines = [ExpenseLine(row[0], str(row[2]), float(row[3]), float(row[4]), float(row[5]))
+                       for row in rows]
+        self.removed_ids = set()
+        self.subtotal = math.fsum(line.montant for line in self._lines)
+        self.endResetModel()
+        self.subtotal_changed.emit(self.subtotal)
+
+    def add_line(self, motif="New Expense Item", prix_unitaire=0.0, quantite=1.0):
+        """Append a new, unsaved line and return its row"""
+        row = len(self._lines)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._lines.append(ExpenseLine(None, motif, prix_unitaire, quantite, 0.0))
+        self.endInsertRows()
+        self._set_amount(row, prix_unitaire * quantite)
+        return row
+
+    def remove_line(self, row):
+        """Remove a line; a saved one is deleted by the next save"""
+        line = self._lines[row]
+        if line.id_ligne is not None:
+            self.removed_ids.add(line.id_ligne)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._lines[row]
+        self.endRemoveRows()
+        self.subtotal -= line.montant
+        self.subtotal_changed.emit(self.subtotal)
+
+    def line_at(self, row):
+        return self._lines[row]
+
+    def changes(self):
+        """Return (created, created_rows, updated, deleted_ids) since the last load or save.
+
+        created are new valid lines as (motif, prix_unitaire, quantite,
+        montant), updated are edited saved lines with their id_ligne appended.
+        Like the old delete-and-reinsert save, a saved line left invalid is
+        deleted.
+        """
+        created, created_rows, updated = [], [], []
+        deleted = set(self.removed_ids)
+        for row, line in enumerate(self._lines):
+            if line.id_ligne is None:
+                if line.is_valid():
+                    created.append(line.values())
+                    created_rows.append(row)
+            elif line.values() != line.saved:
+                if line.is_valid():
+                    updated.append(line.values() + (line.id_ligne,))
+                else:
+                    deleted.add(line.id_ligne)
+        return created, created_rows, updated, sorted(deleted)
+
+    def mark_saved(self, created_rows, new_ids, deleted_ids):
+        """Make the state written by a save the new baseline"""
+        for row, id_ligne in zip(created_rows, new_ids):
+            self._lines[row].id_ligne = id_ligne
+        for line in self._lines:
+            if line.id_ligne is not None:
+                line.saved = line.values()
+        self.removed_ids = set()
+        # Saved lines dropped as invalid leave the table too
+        deleted_ids = set(deleted_ids)
+        for row in range(len(self._lines) - 1, -1, -1):
+            if self._lines[row].id_ligne in deleted_ids:
+                self.remove_line(row)
+        self.removed_ids = set()
+
+
+class StatusDotDelegate(QStyledItemDelegate):
+    """Paints a colored dot followed by the status name"""
+
+    def __init__(self, colors, default_color='#eab308', parent=None):
+        super().__init__(parent)
+        self.colors = colors
+        self.default_color = default_color
+        self.font = QFont("Arial")
+        self.font.setBold(True)
+        self.font.setPixelSize(11)
+        self.dot_font = QFont("Arial")
+        self.dot_font.setPixelSize(14)
+
+    def paint(self, painter, option, index):
+        self.initStyleOption(option, index)
+        status = option.text
+        option.text = ""
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.CE_ItemViewItem, option, painter, option.widget)
+
+        rect = option.rect.adjusted(12, 0, -12, 0)
+        painter.save()
+        painter.setPen(QColor(self.colors.get(status, self.default_color)))
+        painter.setFont(self.dot_font)
+        painter.drawText(rect, Qt.AlignVCenter | Qt.AlignLeft, "●")
+        painter.setFont(self.font)
+        painter.drawText(rect.adjusted(20, 0, 0, 0), Qt.AlignVCenter | Qt.AlignLeft, status)
+        painter.restore()
+
+
+class ButtonDelegate(QStyledItemDelegate):
+    """Paints a push button in every cell and emits clicked(row) on release.
+
+    When enabled is False the cell shows read_only_text instead and ignores
+    clicks. Clicks are handled in editorEvent, so no widget exists per row.
+    """
+
+    clicked = pyqtSignal(int)
+
+    def __init__(self, text, color, hover_color, enabled=True, read_only_text="Read Only",
+                 size=QSize(55, 28), parent=None):
+        super().__init__(parent)
+        self.text = text
+        self.color = color
+        self.hover_color = hover_color
+        self.enabled = enabled
+        self.read_only_text = read_only_text
+        self.size = size
+        self.font = QFont("Arial")
+        self.font.setBold(True)
+        self.font.setPixelSize(11)
+        self.read_only_font = QFont("Arial")
+        self.read_only_font.setItalic(True)
+        self.read_only_font.setPixelSize(11)
+
+    def _button_rect(self, option):
+        return QRectF(option.rect.center().x() - self.size.width() / 2,
+                      option.rect.center().y() - self.size.height() / 2,
+                      self.size.width(), self.size.height())
+
+    def paint(self, painter, option, index):
+        self.initStyleOption(option, index)
+        option.text = ""
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.CE_ItemViewItem, option, painter, option.widget)
+
+        painter.save()
+        if not self.enabled:
+            painter.setPen(QColor("#6b7280"))
+            painter.setFont(self.read_only_font)
+            painter.drawText(option.rect, Qt.AlignCenter, self.read_only_text)
+        else:
+            rect = self._button_rect(option)
+            hovered = bool(option.state & QStyle.State_MouseOver)
+            painter.setRenderHint(QPainter.Antialiasing)
+            path = QPainterPath()
+            path.addRoundedRect(rect, 4, 4)
+            painter.fillPath(path, QColor(self.hover_color if hovered else self.color))
+            painter.setPen(QColor("white"))
+            painter.setFont(self.font)
+            painter.drawText(rect, Qt.AlignCenter, self.text)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if (self.enabled and event.type() == QEvent.MouseButtonRelease
+                and event.button() == Qt.LeftButton
+                and self._button_rect(option).contains(event.pos())):
+            self.clicked.emit(index.row())
+            return True
+        return super().editorEvent(event, model, option, index)
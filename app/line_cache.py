@@ -0,0 +1,147 @@
+"""
+Shared cache of invoice expense lines
+
+Opening an invoice used to cost one query (on its own connection) for its
+lines, so browsing a project's invoices was N+1 queries. Invoice lists now
+prefetch the lines of the invoices they show with one grouped query, and
+the invoice dialogs are served from this cache.
+
+The cache is bounded by its total number of lines, least recently used
+invoices going first. It is invalidated from the change_log (migration 7)
+before anything is served, so writes from this process or any other never
+leave stale lines behind.
+"""
+
+import threading
+from collections import OrderedDict
+from sqlite3 import Error
+
+from app.change_tracking import ChangeTracker
+from app.db import read_lignes_charge_by_factures
+
+LINE_CACHE_MAX_LINES = 50000
+
+# Invoices of a list whose lines are prefetched (the first screens of it)
+LINE_PREFETCH_INVOICES = 200
+
+
+class ExpenseLineCache:
+    """Bounded LRU of {facture id: expense line rows}, kept in sync with change_log"""
+
+    def __init__(self, max_lines=LINE_CACHE_MAX_LINES):
+        self.max_lines = max_lines
+        self._entries = OrderedDict()   # facture id -> tuple of rows
+        self._factures_by_line = {}     # id_ligne -> facture id, for cached lines
+        self._line_count = 0
+        self._tracker = ChangeTracker()
+        # Loaders call in from several worker threads
+        self._lock = threading.RLock()
+
+    def get_lines(self, conn, facture_id):
+        """Return the lines of one facture, reading them on a miss.
+
+        A failed read returns no lines and caches nothing, so the next call retries.
+        """
+        with self._lock:
+            self._sync(conn)
+            rows = self._entries.get(facture_id)
+            if rows is not None:
+                self._entries.move_to_end(facture_id)
+                return list(rows)
+            lines = read_lignes_charge_by_factures(conn, [facture_id])
+            if lines is None:
+                return []
+            self._store(facture_id, lines[facture_id])
+            return list(lines[facture_id])
+
+    def prefetch(self, conn, facture_ids):
+        """Read the lines of the uncached factures among facture_ids in one query.
+
+        Returns the number of factures read.
+        """
+        with self._lock:
+            self._sync(conn)
+            missing = [facture_id for facture_id in dict.fromkeys(facture_ids)
+                       if facture_id not in self._entries]
+            if not missing:
+                return 0
+            lines = read_lignes_charge_by_factures(conn, missing)
+            if lines is None:
+                return 0
+            for facture_id, rows in lines.items():
+                self._store(facture_id, rows)
+            return len(lines)
+
+    def invalidate(self, facture_ids):
+        """Drop the given factures"""
+        with self._lock:
+            for facture_id in facture_ids:
+                self._drop(facture_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._factures_by_line.clear()
+            self._line_count = 0
+
+    def _sync(self, conn):
+        """Drop the factures whose lines changed since the last sync"""
+        changes = self._tracker.poll(conn)
+        if changes is None:
+            self.clear()
+            return
+        if not changes:
+            return
+        stale = set(changes.get('FactureCharge', {}))
+        unknown = []
+        for id_ligne, op in changes.get('LigneCharge', {}).items():
+            if id_ligne in self._factures_by_line:
+                stale.add(self._factures_by_line[id_ligne])
+            elif op != 'D':
+                # New line, or moved from an uncached facture: find where it is now
+                unknown.append(id_ligne)
+        try:
+            for start in range(0, len(unknown), 500):
+                chunk = unknown[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cur = conn.execute(f"SELECT DISTINCT id_facture_charge FROM LigneCharge "
+                                   f"WHERE id_ligne IN ({placeholders})", chunk)
+                stale.update(row[0] for row in cur)
+        except Error as e:
+            print(f"Error locating changed expense lines: {e}")
+            self.clear()
+            return
+        for facture_id in stale:
+            self._drop(facture_id)
+
+    def _store(self, facture_id, rows):
+        self._drop(facture_id)
+        rows = tuple(rows)
+        self._entries[facture_id] = rows
+        for row in rows:
+            self._factures_by_line[row[0]] = facture_id
+        self._line_count += len(rows)
+        # Keep at least the entry just stored, however large
+        while self._line_count > self.max_lines and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, facture_id):
+        rows = self._entries.pop(facture_id, None)
+        if rows is None:
+            return
+        for row in rows:
+            self._factures_by_line.pop(row[0], None)
+        self._line_count -= len(rows)
+
+
+_line_cache = None
+_line_cache_lock = threading.Lock()
+
+
+def get_line_cache():
+    """Return the expense line cache shared by every window and dialog"""
+    global _line_cache
+    with _line_cache_lock:
+        if _line_cache is None:
+            _line_cache = ExpenseLineCache()
+        return _line_cache
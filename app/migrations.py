@@ -0,0 +1,402 @@
+"""
+Versioned schema migrations
+
+create_tables() only creates missing tables, so existing production databases
+never pick up schema changes. Each migration below is applied once, in order,
+inside its own transaction, and recorded in the schema_version table.
+
+To add a migration, append a new (version, description, steps) entry to
+MIGRATIONS. A step is either a SQL string or a callable taking the connection.
+Never edit or reorder a migration that has already shipped.
+"""
+
+from datetime import datetime
+from sqlite3 import Error
+
+from app.db import TVA_RATE, rebuild_projet_summaries, reconcile_totals, transaction
+
+
+MIGRATIONS = [
+    (1, "Index FactureCharge for per-project and date-ordered invoice lists", [
+        # load_project_invoices / get_invoice_data(project_id): filter by
+        # project, order by date; covers every column those queries read
+        '''CREATE INDEX IF NOT EXISTS idx_facture_projet_date
+           ON FactureCharge (id_projet, date_facture DESC, fournisseur, montant_total, status)''',
+        # load_invoices / get_invoice_data(date range): order or range by date
+        '''CREATE INDEX IF NOT EXISTS idx_facture_date
+           ON FactureCharge (date_facture DESC, id_projet, fournisseur, montant_total, status)''',
+    ]),
+    (2, "Index LigneCharge by facture", [
+        '''CREATE INDEX IF NOT EXISTS idx_ligne_facture
+           ON LigneCharge (id_facture_charge)''',
+    ]),
+    (3, "Refresh query planner statistics", [
+        "ANALYZE",
+    ]),
+    (4, "Maintain invoice and project totals with triggers", [
+        # FactureCharge -> Projet.montant_investi
+        '''CREATE TRIGGER IF NOT EXISTS trg_facture_insert_total
+           AFTER INSERT ON FactureCharge
+           BEGIN
+               UPDATE Projet SET montant_investi = COALESCE(montant_investi, 0) + COALESCE(NEW.montant_total, 0)
+               WHERE id_projet = NEW.id_projet;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_facture_delete_total
+           AFTER DELETE ON FactureCharge
+           BEGIN
+               UPDATE Projet SET montant_investi = COALESCE(montant_investi, 0) - COALESCE(OLD.montant_total, 0)
+               WHERE id_projet = OLD.id_projet;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_facture_update_total
+           AFTER UPDATE OF montant_total, id_projet ON FactureCharge
+           WHEN OLD.montant_total IS NOT NEW.montant_total OR OLD.id_projet IS NOT NEW.id_projet
+           BEGIN
+               UPDATE Projet SET montant_investi = COALESCE(montant_investi, 0) - COALESCE(OLD.montant_total, 0)
+               WHERE id_projet = OLD.id_projet;
+               UPDATE Projet SET montant_investi = COALESCE(montant_investi, 0) + COALESCE(NEW.montant_total, 0)
+               WHERE id_projet = NEW.id_projet;
+           END''',
+        # LigneCharge -> FactureCharge.montant_total (lines are net, invoices include TVA).
+        # An invoice's first line replaces the total it was entered with and
+        # removing its last line resets it, so an invoice with lines totals
+        # SUM(lines) plus TVA; the EXISTS probes are index lookups by facture.
+        f'''CREATE TRIGGER IF NOT EXISTS trg_ligne_insert_total
+           AFTER INSERT ON LigneCharge
+           BEGIN
+               UPDATE FactureCharge
+               SET montant_total = CASE
+                       WHEN EXISTS (SELECT 1 FROM LigneCharge
+                                    WHERE id_facture_charge = NEW.id_facture_charge AND id_ligne <> NEW.id_ligne)
+                       THEN COALESCE(montant_total, 0) + COALESCE(NEW.montant_total, 0) * {1 + TVA_RATE}
+                       ELSE COALESCE(NEW.montant_total, 0) * {1 + TVA_RATE}
+                   END
+               WHERE id_facture_charge = NEW.id_facture_charge;
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_ligne_delete_total
+           AFTER DELETE ON LigneCharge
+           BEGIN
+               UPDATE FactureCharge
+               SET montant_total = CASE
+                       WHEN EXISTS (SELECT 1 FROM LigneCharge WHERE id_facture_charge = OLD.id_facture_charge)
+                       THEN COALESCE(montant_total, 0) - COALESCE(OLD.montant_total, 0) * {1 + TVA_RATE}
+                       ELSE 0
+                   END
+               WHERE id_facture_charge = OLD.id_facture_charge;
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_ligne_update_total
+           AFTER UPDATE OF montant_total, id_facture_charge ON LigneCharge
+           WHEN OLD.montant_total IS NOT NEW.montant_total OR OLD.id_facture_charge IS NOT NEW.id_facture_charge
+           BEGIN
+               UPDATE FactureCharge
+               SET montant_total = CASE
+                       WHEN EXISTS (SELECT 1 FROM LigneCharge WHERE id_facture_charge = OLD.id_facture_charge)
+                       THEN COALESCE(montant_total, 0) - COALESCE(OLD.montant_total, 0) * {1 + TVA_RATE}
+                       ELSE 0
+                   END
+               WHERE id_facture_charge = OLD.id_facture_charge;
+               UPDATE FactureCharge
+               SET montant_total = CASE
+                       WHEN EXISTS (SELECT 1 FROM LigneCharge
+                                    WHERE id_facture_charge = NEW.id_facture_charge AND id_ligne <> NEW.id_ligne)
+                       THEN COALESCE(montant_total, 0) + COALESCE(NEW.montant_total, 0) * {1 + TVA_RATE}
+                       ELSE COALESCE(NEW.montant_total, 0) * {1 + TVA_RATE}
+                   END
+               WHERE id_facture_charge = NEW.id_facture_charge;
+           END''',
+        # Start from consistent totals
+        reconcile_totals,
+    ]),
+    (5, "Materialized ProjetSummary table kept current by triggers", [
+        '''CREATE TABLE IF NOT EXISTS ProjetSummary (
+               id_projet INTEGER PRIMARY KEY,
+               nombre_factures INTEGER NOT NULL DEFAULT 0,
+               total_charges REAL NOT NULL DEFAULT 0,
+               montant_en_attente REAL NOT NULL DEFAULT 0,
+               derniere_facture TEXT,
+               FOREIGN KEY (id_projet) REFERENCES Projet (id_projet)
+           )''',
+        rebuild_projet_summaries,
+        '''CREATE TRIGGER IF NOT EXISTS trg_summary_projet_insert
+           AFTER INSERT ON Projet
+           BEGIN
+               INSERT OR IGNORE INTO ProjetSummary (id_projet) VALUES (NEW.id_projet);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_summary_projet_delete
+           AFTER DELETE ON Projet
+           BEGIN
+               DELETE FROM ProjetSummary WHERE id_projet = OLD.id_projet;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_summary_facture_insert
+           AFTER INSERT ON FactureCharge
+           BEGIN
+               UPDATE ProjetSummary
+               SET nombre_factures = nombre_factures + 1,
+                   total_charges = total_charges + COALESCE(NEW.montant_total, 0),
+                   montant_en_attente = montant_en_attente +
+                       CASE WHEN COALESCE(NEW.status, 'Pending') = 'Pending' THEN COALESCE(NEW.montant_total, 0) ELSE 0 END,
+                   derniere_facture = CASE WHEN derniere_facture IS NULL OR NEW.date_facture > derniere_facture
+                                           THEN NEW.date_facture ELSE derniere_facture END
+               WHERE id_projet = NEW.id_projet;
+           END''',
+        # Removing rows can only lower the last date; MAX() is an index lookup
+        # on the (id_projet, date_facture) index
+        '''CREATE TRIGGER IF NOT EXISTS trg_summary_facture_delete
+           AFTER DELETE ON FactureCharge
+           BEGIN
+               UPDATE ProjetSummary
+               SET nombre_factures = nombre_factures - 1,
+                   total_charges = total_charges - COALESCE(OLD.montant_total, 0),
+                   montant_en_attente = montant_en_attente -
+                       CASE WHEN COALESCE(OLD.status, 'Pending') = 'Pending' THEN COALESCE(OLD.montant_total, 0) ELSE 0 END,
+                   derniere_facture = (SELECT MAX(date_facture) FROM FactureCharge WHERE id_projet = OLD.id_projet)
+               WHERE id_projet = OLD.id_projet;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_summary_facture_update
+           AFTER UPDATE OF id_projet, montant_total, status, date_facture ON FactureCharge
+           BEGIN
+               UPDATE ProjetSummary
+               SET nombre_factures = nombre_factures - 1,
+                   total_charges = total_charges - COALESCE(OLD.montant_total, 0),
+                   montant_en_attente = montant_en_attente -
+                       CASE WHEN COALESCE(OLD.status, 'Pending') = 'Pending' THEN COALESCE(OLD.montant_total, 0) ELSE 0 END
+               WHERE id_projet = OLD.id_projet;
+               UPDATE ProjetSummary
+               SET nombre_factures = nombre_factures + 1,
+                   total_charges = total_charges + COALESCE(NEW.montant_total, 0),
+                   montant_en_attente = montant_en_attente +
+                       CASE WHEN COALESCE(NEW.status, 'Pending') = 'Pending' THEN COALESCE(NEW.montant_total, 0) ELSE 0 END
+               WHERE id_projet = NEW.id_projet;
+               UPDATE ProjetSummary
+               SET derniere_facture = (SELECT MAX(date_facture) FROM FactureCharge
+                                       WHERE FactureCharge.id_projet = ProjetSummary.id_projet)
+               WHERE id_projet IN (OLD.id_projet, NEW.id_projet);
+           END''',
+    ]),
+    (6, "Indexes for keyset-paginated project and invoice lists", [
+        # read_factures_page: (date_facture, id) cursor, optionally per project
+        '''CREATE INDEX IF NOT EXISTS idx_facture_date_id
+           ON FactureCharge (date_facture, id_facture_charge, id_projet, fournisseur, montant_total, status)''',
+        '''CREATE INDEX IF NOT EXISTS idx_facture_projet_date_id
+           ON FactureCharge (id_projet, date_facture, id_facture_charge, fournisseur, montant_total, status)''',
+        # They lead with the same columns as migration 1's indexes and cover
+        # the same reads, so those are only extra write cost now
+        "DROP INDEX IF EXISTS idx_facture_date",
+        "DROP INDEX IF EXISTS idx_facture_projet_date",
+        # read_projets_page: (nom_projet, id) cursor
+        '''CREATE INDEX IF NOT EXISTS idx_projet_nom_id
+           ON Projet (nom_projet, id_projet)''',
+    ]),
+    (7, "Trigger-fed change_log for incremental refresh", [
+        '''CREATE TABLE IF NOT EXISTS change_log (
+               seq INTEGER PRIMARY KEY AUTOINCREMENT,
+               table_name TEXT NOT NULL,
+               row_id INTEGER NOT NULL,
+               op TEXT NOT NULL CHECK (op IN ('I', 'U', 'D'))
+           )''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_projet_insert
+           AFTER INSERT ON Projet
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('Projet', NEW.id_projet, 'I');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_projet_update
+           AFTER UPDATE ON Projet
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('Projet', NEW.id_projet, 'U');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_projet_delete
+           AFTER DELETE ON Projet
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('Projet', OLD.id_projet, 'D');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_facturecharge_insert
+           AFTER INSERT ON FactureCharge
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('FactureCharge', NEW.id_facture_charge, 'I');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_facturecharge_update
+           AFTER UPDATE ON FactureCharge
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('FactureCharge', NEW.id_facture_charge, 'U');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_facturecharge_delete
+           AFTER DELETE ON FactureCharge
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('FactureCharge', OLD.id_facture_charge, 'D');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_lignecharge_insert
+           AFTER INSERT ON LigneCharge
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('LigneCharge', NEW.id_ligne, 'I');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_lignecharge_update
+           AFTER UPDATE ON LigneCharge
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('LigneCharge', NEW.id_ligne, 'U');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_lignecharge_delete
+           AFTER DELETE ON LigneCharge
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('LigneCharge', OLD.id_ligne, 'D');
+           END''',
+        # Invoice count / pending amount changes show up in the projects grid
+        '''CREATE TRIGGER IF NOT EXISTS trg_log_projetsummary_update
+           AFTER UPDATE ON ProjetSummary
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('Projet', NEW.id_projet, 'U');
+           END''',
+    ]),
+    (8, "Covering index for line-item report aggregates", [
+        # read_line_breakdown: per-invoice lookups answered from the index
+        # alone; it starts with id_facture_charge, so it replaces idx_ligne_facture
+        '''CREATE INDEX IF NOT EXISTS idx_ligne_facture_motif
+           ON LigneCharge (id_facture_charge, motif, quantite, montant_total)''',
+        "DROP INDEX IF EXISTS idx_ligne_facture",
+        "ANALYZE LigneCharge",
+    ]),
+    (9, "Log project changes once per write, and only when a shown value changes", [
+        # Every invoice or line write cascades into several Projet and
+        # ProjetSummary updates; only log the ones that change a value.
+        # total_charges follows the same invoice totals as montant_investi,
+        # which trg_log_projet_update already logs, and so does the pending
+        # amount unless an invoice changed status: one row per write.
+        "DROP TRIGGER IF EXISTS trg_log_projet_update",
+        "DROP TRIGGER IF EXISTS trg_log_projetsummary_update",
+        # Migrations 4 and 5 took an edited invoice out of its project's totals
+        # and put it back (up to four updates); within one project, apply the
+        # deltas once
+        "DROP TRIGGER IF EXISTS trg_facture_update_total",
+        '''CREATE TRIGGER trg_facture_update_total
+           AFTER UPDATE OF montant_total, id_projet ON FactureCharge
+           WHEN OLD.id_projet IS NEW.id_projet AND OLD.montant_total IS NOT NEW.montant_total
+           BEGIN
+               UPDATE Projet
+               SET montant_investi = COALESCE(montant_investi, 0)
+                                     + COALESCE(NEW.montant_total, 0) - COALESCE(OLD.montant_total, 0)
+               WHERE id_projet = NEW.id_projet;
+           END''',
+        '''CREATE TRIGGER trg_facture_move_total
+           AFTER UPDATE OF id_projet ON FactureCharge
+           WHEN OLD.id_projet IS NOT NEW.id_projet
+           BEGIN
+               UPDATE Projet SET montant_investi = COALESCE(montant_investi, 0) - COALESCE(OLD.montant_total, 0)
+               WHERE id_projet = OLD.id_projet;
+               UPDATE Projet SET montant_investi = COALESCE(montant_investi, 0) + COALESCE(NEW.montant_total, 0)
+               WHERE id_projet = NEW.id_projet;
+           END''',
+        "DROP TRIGGER IF EXISTS trg_summary_facture_update",
+        '''CREATE TRIGGER trg_summary_facture_update
+           AFTER UPDATE OF id_projet, montant_total, status, date_facture ON FactureCharge
+           WHEN OLD.id_projet IS NEW.id_projet
+             AND (OLD.montant_total IS NOT NEW.montant_total OR OLD.status IS NOT NEW.status
+                  OR OLD.date_facture IS NOT NEW.date_facture)
+           BEGIN
+               UPDATE ProjetSummary
+               SET total_charges = total_charges + COALESCE(NEW.montant_total, 0) - COALESCE(OLD.montant_total, 0),
+                   montant_en_attente = montant_en_attente
+                       + CASE WHEN COALESCE(NEW.status, 'Pending') = 'Pending' THEN COALESCE(NEW.montant_total, 0) ELSE 0 END
+                       - CASE WHEN COALESCE(OLD.status, 'Pending') = 'Pending' THEN COALESCE(OLD.montant_total, 0) ELSE 0 END,
+                   derniere_facture = CASE WHEN OLD.date_facture IS NEW.date_facture THEN derniere_facture
+                                           ELSE (SELECT MAX(date_facture) FROM FactureCharge
+                                                 WHERE FactureCharge.id_projet = NEW.id_projet) END
+               WHERE id_projet = NEW.id_projet;
+           END''',
+        '''CREATE TRIGGER trg_summary_facture_move
+           AFTER UPDATE OF id_projet ON FactureCharge
+           WHEN OLD.id_projet IS NOT NEW.id_projet
+           BEGIN
+               UPDATE ProjetSummary
+               SET nombre_factures = nombre_factures - 1,
+                   total_charges = total_charges - COALESCE(OLD.montant_total, 0),
+                   montant_en_attente = montant_en_attente -
+                       CASE WHEN COALESCE(OLD.status, 'Pending') = 'Pending' THEN COALESCE(OLD.montant_total, 0) ELSE 0 END,
+                   derniere_facture = (SELECT MAX(date_facture) FROM FactureCharge
+                                       WHERE FactureCharge.id_projet = OLD.id_projet)
+               WHERE id_projet = OLD.id_projet;
+               UPDATE ProjetSummary
+               SET nombre_factures = nombre_factures + 1,
+                   total_charges = total_charges + COALESCE(NEW.montant_total, 0),
+                   montant_en_attente = montant_en_attente +
+                       CASE WHEN COALESCE(NEW.status, 'Pending') = 'Pending' THEN COALESCE(NEW.montant_total, 0) ELSE 0 END,
+                   derniere_facture = (SELECT MAX(date_facture) FROM FactureCharge
+                                       WHERE FactureCharge.id_projet = NEW.id_projet)
+               WHERE id_projet = NEW.id_projet;
+           END''',
+        '''CREATE TRIGGER trg_log_projet_update
+           AFTER UPDATE ON Projet
+           WHEN OLD.id_projet IS NOT NEW.id_projet
+             OR OLD.nom_projet IS NOT NEW.nom_projet
+             OR OLD.date_estimation IS NOT NEW.date_estimation
+             OR OLD.date_lancement IS NOT NEW.date_lancement
+             OR OLD.budget_max IS NOT NEW.budget_max
+             OR OLD.montant_investi IS NOT NEW.montant_investi
+             OR OLD.status IS NOT NEW.status
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('Projet', NEW.id_projet, 'U');
+           END''',
+        '''CREATE TRIGGER trg_log_projetsummary_update
+           AFTER UPDATE ON ProjetSummary
+           WHEN OLD.nombre_factures IS NOT NEW.nombre_factures
+             OR OLD.derniere_facture IS NOT NEW.derniere_facture
+             OR ABS((NEW.montant_en_attente - OLD.montant_en_attente)
+                    - (NEW.total_charges - OLD.total_charges)) > 0.005
+           BEGIN
+               INSERT INTO change_log (table_name, row_id, op) VALUES ('Projet', NEW.id_projet, 'U');
+           END''',
+    ]),
+]
+
+
+def ensure_version_table(conn):
+    """Create the schema_version table if it does not exist"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def get_schema_version(conn):
+    """Return the highest applied migration version (0 for a fresh database)"""
+    ensure_version_table(conn)
+    row = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()
+    return row[0]
+
+
+def apply_migrations(conn, migrations=None):
+    """Apply every pending migration; return the list of versions applied.
+
+    Each migration runs in its own transaction, so a failure leaves the
+    database at the last fully applied version.
+    """
+    if conn is None:
+        print("No database connection")
+        return []
+    migrations = MIGRATIONS if migrations is None else migrations
+    applied = []
+    try:
+        current = get_schema_version(conn)
+    except Error as e:
+        print(f"Migration error: {e}")
+        return applied
+
+    for version, description, steps in sorted(migrations, key=lambda m: m[0]):
+        if version <= current:
+            continue
+        try:
+            with transaction(conn):
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute("INSERT INTO schema_version(version, description, applied_at) VALUES(?,?,?)",
+                             (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            applied.append(version)
+            print(f"Applied migration {version}: {description}")
+        except Error as e:
+            print(f"Migration {version} failed: {e}")
+            break
+    return applied
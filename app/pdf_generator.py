@@ -12,19 +12,258 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.platypus.flowables import HRFlowable
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from datetime import datetime, timedelta
+import itertools
 import os
-import sqlite3
-from typing import List, Dict, Any, Optional
+import shutil
+import threading
+from contextlib import contextmanager
+from sqlite3 import Error
+from xml.sax.saxutils import escape
+from typing import Dict, Any, Iterator, Optional, Callable, Tuple
+
+from app.db import (DB_FILE, create_connection, iter_invoices, iter_report_lines, read_line_breakdown,
+                    read_report_totals, read_snapshot)
+from app.change_tracking import get_last_change_seq
+from app.report_cache import ReportCache
+
+# Bump whenever the layout of a report changes, so cached PDFs are rebuilt
+REPORT_TEMPLATE_VERSION = 3
+
+# Report phases passed to the progress callback as (phase, done, total)
+PHASE_FETCH = 'fetch'     # done = invoices matched so far, total unknown (0)
+PHASE_BUILD = 'build'     # done/total = invoice rows streamed into tables
+PHASE_LAYOUT = 'layout'   # done = page being laid out, total unknown (0)
+
+# Invoice rows per Table flowable. ReportLab re-wraps the remainder of a table
+# every time it splits it over a page, so one big table costs O(rows^2);
+# fixed-size chunks keep that cost per chunk
+TABLE_CHUNK_ROWS = 500
+
+# Style shared by every chunk of an invoice details table
+INVOICE_TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ed8936')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (3, 1), (3, -1), 'RIGHT'),  # Amount column right-aligned
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f7fafc')])
+]
+
+# Expense line tables: same look, numeric columns from the 4th one on right-aligned
+LINE_TABLE_STYLE = INVOICE_TABLE_STYLE[:3] + [('ALIGN', (3, 1), (-1, -1), 'RIGHT')] + INVOICE_TABLE_STYLE[4:]
+
+# Breakdown tables (label, then numbers from the 2nd column on)
+BREAKDOWN_TABLE_STYLE = INVOICE_TABLE_STYLE[:3] + [('ALIGN', (1, 1), (-1, -1), 'RIGHT')] + INVOICE_TABLE_STYLE[4:]
+
+# Motifs listed in the detailed report's breakdown
+TOP_MOTIFS = 10
+
+
+class ReportCancelled(Exception):
+    """Raised out of a report build when its cancel event is set"""
+
+
+class StreamingStory(list):
+    """Story list that pulls flowables from an iterable as doc.build consumes it.
+
+    doc.build only works on the head of the list (len, [0], del [0] and split
+    remainders put back in front), so a few buffered flowables are enough and
+    the rest of the report is never held in memory.
+    """
+    
+    def __init__(self, flowables, buffer_size=8):
+        super().__init__()
+        self._source = iter(flowables)
+        self._buffer_size = buffer_size
+    
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self._buffer_size:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+    
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+    
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+    
+    def close(self):
+        """Stop the source early, e.g. when the build is cancelled"""
+        if self._source is not None and hasattr(self._source, 'close'):
+            self._source.close()
+        self._source = None
 
 
 class PDFReportGenerator:
     """Main class for generating PDF reports"""
     
-    def __init__(self, db_path: str = "gestion_projets.db"):
+    def __init__(self, db_path: str = DB_FILE, progress: Optional[Callable[[str, int, int], None]] = None,
+                 cancel_event: Optional[threading.Event] = None, cache: Optional[ReportCache] = None):
         self.db_path = db_path
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.cache = cache
         self.styles = getSampleStyleSheet()
         self.setup_custom_styles()
     
+    def report_progress(self, phase: str, done: int = 0, total: int = 0):
+        """Forward progress to the callback; raise ReportCancelled once cancelled"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ReportCancelled("Report generation cancelled")
+        if self.progress:
+            self.progress(phase, done, total)
+    
+    def build_document(self, doc: SimpleDocTemplate, story: list, tail: Iterator = ()):
+        """Build the PDF from story then the lazily produced tail flowables.
+        
+        Reports each page and aborts doc.build once cancelled.
+        """
+        def on_progress(kind, value):
+            if kind == 'PAGE':
+                self.report_progress(PHASE_LAYOUT, value)
+            elif kind == 'PROGRESS':
+                # Between flowables; a long table only reports through its pages
+                self.report_progress(PHASE_LAYOUT, doc.page)
+        
+        def flowables():
+            yield from story
+            yield from tail
+        
+        doc.setProgressCallBack(on_progress)
+        self.report_progress(PHASE_LAYOUT, 1)
+        streamed = StreamingStory(flowables())
+        try:
+            # Nothing is written until the last page is laid out, so an abort
+            # leaves no partial file behind
+            doc.build(streamed)
+        finally:
+            streamed.close()
+    
+    def from_cache(self, conn, report_type: str, project_id: Optional[int], start_date: Optional[str],
+                   end_date: Optional[str], output_file: str) -> Tuple[Optional[tuple], bool]:
+        """Return (cache entry, hit); on a hit the cached PDF is copied to output_file"""
+        if self.cache is None:
+            return None, False
+        # Read inside the report's snapshot, so the version matches the data exactly
+        try:
+            version = get_last_change_seq(conn)
+        except Error as e:
+            print(f"Error reading data version: {e}")
+            return None, False
+        key = self.cache.key(self.db_path, report_type, project_id, start_date, end_date, REPORT_TEMPLATE_VERSION)
+        cached = self.cache.get(key, version)
+        if cached is None:
+            return (key, version), False
+        try:
+            shutil.copyfile(cached, output_file)
+        except OSError as e:
+            # Evicted by another process since get(): rebuild instead
+            print(f"Error reading cached report: {e}")
+            return (key, version), False
+        return (key, version), True
+    
+    @staticmethod
+    def report_stamp(cache_entry: Optional[tuple]) -> str:
+        """First report info line: the build time, or the data version for cached reports.
+        
+        A cached PDF is served again later, so it must not claim when it was generated.
+        """
+        if cache_entry is not None:
+            return f"Data version: {cache_entry[1]}"
+        return f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}"
+    
+    def to_cache(self, entry: Optional[tuple], output_file: str):
+        """Store a freshly built report under the entry from_cache returned"""
+        if entry is not None:
+            self.cache.put(*entry, output_file)
+    
+    def invoice_tables(self, invoices: Iterator[Dict[str, Any]], header: list, row, col_widths: list,
+                       total: int, style: list = INVOICE_TABLE_STYLE) -> Iterator[Table]:
+        """Yield the invoice details table in TABLE_CHUNK_ROWS chunks.
+        
+        Rows are built with row(inv) as the invoices stream in; every chunk
+        repeats the header on each page it spans.
+        """
+        chunk = [header]
+        done = 0
+        for inv in invoices:
+            chunk.append(row(inv))
+            done += 1
+            if len(chunk) > TABLE_CHUNK_ROWS:
+                self.report_progress(PHASE_BUILD, done, total)
+                yield self.invoice_table(chunk, col_widths, style)
+                chunk = [header]
+        if len(chunk) > 1:
+            self.report_progress(PHASE_BUILD, done, total)
+            yield self.invoice_table(chunk, col_widths, style)
+    
+    def invoice_table(self, table_data: list, col_widths: list, style: list = INVOICE_TABLE_STYLE) -> Table:
+        table = Table(table_data, colWidths=col_widths, repeatRows=1)
+        table.setStyle(TableStyle(style))
+        return table
+    
+    @contextmanager
+    def snapshot(self):
+        """Yield one pooled connection holding a read transaction for a whole report"""
+        conn = create_connection(self.db_path)
+        if conn is None:
+            raise RuntimeError("Unable to connect to database")
+        try:
+            with read_snapshot(conn):
+                yield conn
+        finally:
+            conn.close()
+    
+    def get_invoice_report_data(self, conn, project_id: Optional[int], start_date: Optional[str],
+                                end_date: Optional[str]) -> Dict[str, Any]:
+        """Read an invoice report's data on conn.
+        
+        The project row and the SQL count/sum/average come from one statement;
+        'invoices' streams the filtered rows on the same connection.
+        """
+        summary, count, total, average = read_report_totals(conn, project_id or None, start_date, end_date)
+        return {
+            'project': self.project_dict(summary) if summary else None,
+            'invoice_count': count,
+            'total_amount': total,
+            'average_amount': average,
+            'invoices': self.iter_invoice_data(project_id, start_date, end_date, conn=conn)
+        }
+    
+    def get_complete_report_data(self, conn, project_id: int, start_date: Optional[str],
+                                 end_date: Optional[str]) -> Dict[str, Any]:
+        """Read a complete project report's data on conn (see get_invoice_report_data)"""
+        data = self.get_invoice_report_data(conn, project_id, start_date, end_date)
+        if data['project'] is None:
+            raise ValueError(f"Project with ID {project_id} not found")
+        return data
+    
+    def get_detailed_report_data(self, conn, project_id: int, start_date: Optional[str],
+                                 end_date: Optional[str]) -> Dict[str, Any]:
+        """Complete report data plus the expense line breakdown, aggregated in SQL"""
+        data = self.get_complete_report_data(conn, project_id, start_date, end_date)
+        (line_count, line_total), motifs, suppliers = read_line_breakdown(
+            conn, project_id, start_date, end_date, TOP_MOTIFS)
+        data.update({
+            'line_count': line_count,
+            'line_total': line_total,
+            'top_motifs': [{'motif': row[0], 'lines': row[1], 'quantity': row[2], 'amount': row[3]}
+                           for row in motifs],
+            'suppliers': [{'supplier': row[0], 'invoices': row[1], 'lines': row[2], 'amount': row[3]}
+                          for row in suppliers],
+            'lines': self.iter_line_data(conn, project_id, start_date, end_date)
+        })
+        return data
+    
     def setup_custom_styles(self):
         """Setup custom paragraph styles for the PDF"""
         # Title style
@@ -60,6 +299,17 @@ class PDFReportGenerator:
             fontName='Helvetica-Bold'
         ))
         
+        # Sub-header style
+        self.styles.add(ParagraphStyle(
+            name='CustomSubHeader',
+            parent=self.styles['Heading3'],
+            fontSize=12,
+            spaceAfter=8,
+            textColor=colors.HexColor('#2d3748'),
+            alignment=TA_LEFT,
+            fontName='Helvetica-Bold'
+        ))
+        
         # Info style
         self.styles.add(ParagraphStyle(
             name='CustomInfo',
@@ -69,99 +319,61 @@ class PDFReportGenerator:
             alignment=TA_RIGHT
         ))
     
-    def get_project_data(self, project_id: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Fetch project data from database"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            if project_id:
-                cursor.execute("""
-                    SELECT id_projet, nom_projet, date_estimation, date_lancement, 
-                           budget_max, montant_investi, status
-                    FROM Projet 
-                    WHERE id_projet = ?
-                """, (project_id,))
-            else:
-                cursor.execute("""
-                    SELECT id_projet, nom_projet, date_estimation, date_lancement, 
-                           budget_max, montant_investi, status
-                    FROM Projet 
-                    ORDER BY date_lancement DESC
-                """)
-            
-            projects = []
-            for row in cursor.fetchall():
-                projects.append({
-                    'id': row[0],
-                    'name': row[1],
-                    'date_estimation': row[2],
-                    'date_lancement': row[3],
-                    'budget_max': row[4],
-                    'montant_investi': row[5],
-                    'status': row[6] if len(row) > 6 else 'Active',
-                    'remaining_budget': row[4] - row[5]
-                })
-            
-            conn.close()
-            return projects
-            
-        except Exception as e:
-            print(f"Error fetching project data: {e}")
-            return []
+    @staticmethod
+    def project_dict(summary: Dict[str, Any]) -> Dict[str, Any]:
+        """Report view of a project summary dict (see read_projet_summaries)"""
+        return {
+            'id': summary['id_projet'],
+            'name': summary['nom_projet'],
+            'date_estimation': summary['date_estimation'],
+            'date_lancement': summary['date_lancement'],
+            'budget_max': summary['budget_max'],
+            'montant_investi': summary['montant_investi'],
+            'status': summary['status'],
+            'remaining_budget': summary['reste_budget'],
+            'budget_usage': summary['pourcentage_utilise'],
+            'invoice_count': summary['nombre_factures'],
+            'pending_amount': summary['montant_en_attente'],
+            'last_invoice_date': summary['derniere_facture']
+        }
     
-    def get_invoice_data(self, project_id: Optional[int] = None, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Fetch invoice data from database"""
+    def iter_invoice_data(self, project_id: Optional[int] = None, start_date: Optional[str] = None, end_date: Optional[str] = None, conn=None) -> Iterator[Dict[str, Any]]:
+        """Stream invoice data from database, newest first, in constant memory.
+        
+        Reads on conn when given (e.g. a report snapshot), else on its own connection.
+        """
+        owned = conn is None
+        if owned:
+            conn = create_connection(self.db_path)
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            query = """
-                SELECT fc.id_facture_charge, fc.date_facture, fc.fournisseur, 
-                       fc.montant_total, fc.status, p.nom_projet, p.id_projet
-                FROM FactureCharge fc
-                JOIN Projet p ON fc.id_projet = p.id_projet
-            """
-            params = []
-            conditions = []
-            
-            if project_id:
-                conditions.append("fc.id_projet = ?")
-                params.append(project_id)
-            
-            if start_date:
-                conditions.append("fc.date_facture >= ?")
-                params.append(start_date)
-            
-            if end_date:
-                conditions.append("fc.date_facture <= ?")
-                params.append(end_date)
-            
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-            
-            query += " ORDER BY fc.date_facture DESC"
-            
-            cursor.execute(query, params)
-            
-            invoices = []
-            for row in cursor.fetchall():
-                invoices.append({
+            for row in iter_invoices(conn, id_projet=project_id or None, date_from=start_date, date_to=end_date):
+                yield {
                     'id': row[0],
                     'date': row[1],
                     'supplier': row[2],
                     'amount': row[3],
-                    'status': row[4],
-                    'project_name': row[5],
+                    'status': row[5],
+                    'project_name': row[4],
                     'project_id': row[6]
-                })
-            
-            conn.close()
-            return invoices
-            
-        except Exception as e:
-            print(f"Error fetching invoice data: {e}")
-            return []
+                }
+        finally:
+            if owned and conn:
+                conn.close()
+    
+    def iter_line_data(self, conn, project_id: Optional[int], start_date: Optional[str],
+                       end_date: Optional[str]) -> Iterator[Dict[str, Any]]:
+        """Stream expense lines on conn, grouped by invoice in invoice-list order"""
+        for row in iter_report_lines(conn, project_id, start_date, end_date):
+            yield {
+                'id': row[0],
+                'invoice_id': row[1],
+                'date': row[2],
+                'supplier': row[3],
+                'motif': row[4],
+                'unit_price': row[5],
+                'quantity': row[6],
+                'amount': row[7]
+            }
     
     def add_header_with_logo(self, story):
         """Add header with logo and company information"""
@@ -220,6 +432,48 @@ class PDFReportGenerator:
             story.append(HRFlowable(width="100%", thickness=2, lineCap='round', color=colors.HexColor('#ed8936')))
             story.append(Spacer(1, 20))
     
+    def add_line_breakdown(self, story: list, data: Dict[str, Any]):
+        """Append the expense line breakdown: top motifs and per-supplier subtotals"""
+        story.append(Paragraph("Expense Breakdown", self.styles['CustomHeader']))
+        if not data['line_count']:
+            story.append(Paragraph("No expense lines found for the specified period.", self.styles['Normal']))
+            story.append(Spacer(1, 30))
+            return
+        
+        line_total = data['line_total']
+        story.append(Paragraph(
+            f"{data['line_count']:,} expense lines, {line_total:,.2f} DH excluding TVA",
+            self.styles['Normal']))
+        story.append(Spacer(1, 12))
+        
+        # Top motifs by spend
+        story.append(Paragraph(f"Top {TOP_MOTIFS} Motifs by Spend", self.styles['CustomSubHeader']))
+        motif_rows = [['Motif', 'Lines', 'Quantity', 'Amount (DH)', 'Share']]
+        for motif in data['top_motifs']:
+            motif_rows.append([
+                Paragraph(escape(motif['motif']), self.styles['Normal']),
+                f"{motif['lines']:,}",
+                f"{motif['quantity']:,.2f}",
+                f"{motif['amount']:,.2f}",
+                f"{motif['amount'] / line_total * 100:.1f}%" if line_total else '-'
+            ])
+        story.append(self.invoice_table(motif_rows, [170, 60, 80, 100, 55], BREAKDOWN_TABLE_STYLE))
+        story.append(Spacer(1, 20))
+        
+        # Subtotals per supplier
+        story.append(Paragraph("Subtotals by Supplier", self.styles['CustomSubHeader']))
+        supplier_rows = [['Supplier', 'Invoices', 'Lines', 'Amount (DH)', 'Share']]
+        for supplier in data['suppliers']:
+            supplier_rows.append([
+                Paragraph(escape(supplier['supplier']), self.styles['Normal']),
+                f"{supplier['invoices']:,}",
+                f"{supplier['lines']:,}",
+                f"{supplier['amount']:,.2f}",
+                f"{supplier['amount'] / line_total * 100:.1f}%" if line_total else '-'
+            ])
+        story.append(self.invoice_table(supplier_rows, [170, 60, 80, 100, 55], BREAKDOWN_TABLE_STYLE))
+        story.append(Spacer(1, 30))
+    
     def get_date_range(self, period: str) -> tuple[Optional[str], Optional[str]]:
         """Get start and end dates for specified period"""
         today = datetime.now()
@@ -252,9 +506,24 @@ class PDFReportGenerator:
         else:
             start_date, end_date = self.get_date_range(period)
         
-        # Get data
-        invoices = self.get_invoice_data(project_id, start_date, end_date)
-        projects = self.get_project_data(project_id) if project_id else []
+        # One connection and one read transaction: the whole report sees one snapshot
+        with self.snapshot() as conn:
+            return self.build_invoice_report(conn, project_id, start_date, end_date, output_file)
+    
+    def build_invoice_report(self, conn, project_id: Optional[int], start_date: Optional[str],
+                             end_date: Optional[str], output_file: str) -> str:
+        """Lay out the invoice report from data read on conn"""
+        # Identical request on unchanged data: reuse the rendered file
+        cache_entry, hit = self.from_cache(conn, 'invoice', project_id, start_date, end_date, output_file)
+        if hit:
+            return output_file
+        
+        # Get data: project and totals in one query, the rows stream straight into the table
+        self.report_progress(PHASE_FETCH, 0)
+        data = self.get_invoice_report_data(conn, project_id, start_date, end_date)
+        invoice_count = data['invoice_count']
+        self.report_progress(PHASE_FETCH, invoice_count)
+        tables = ()
         
         # Create PDF
         doc = SimpleDocTemplate(output_file, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
@@ -268,63 +537,46 @@ class PDFReportGenerator:
         story.append(Spacer(1, 12))
         
         # Report info
-        report_info = f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}"
+        report_info = self.report_stamp(cache_entry)
         if start_date and end_date:
             report_info += f"<br/>Period: {start_date} to {end_date}"
-        if project_id and projects:
-            report_info += f"<br/>Project: {projects[0]['name']}"
+        if project_id and data['project']:
+            report_info += f"<br/>Project: {data['project']['name']}"
         
         story.append(Paragraph(report_info, self.styles['CustomInfo']))
         story.append(Spacer(1, 20))
         story.append(HRFlowable(width="100%", thickness=1, lineCap='round', color=colors.HexColor('#e2e8f0')))
         story.append(Spacer(1, 20))
         
-        if not invoices:
+        if not invoice_count:
             story.append(Paragraph("No invoices found for the specified criteria.", self.styles['Normal']))
         else:
             # Summary
-            total_amount = sum(inv['amount'] for inv in invoices)
             story.append(Paragraph(f"Summary", self.styles['CustomHeader']))
-            story.append(Paragraph(f"Total Invoices: {len(invoices)}", self.styles['Normal']))
-            story.append(Paragraph(f"Total Amount: {total_amount:,.2f} DH", self.styles['Normal']))
+            story.append(Paragraph(f"Total Invoices: {invoice_count}", self.styles['Normal']))
+            story.append(Paragraph(f"Total Amount: {data['total_amount']:,.2f} DH", self.styles['Normal']))
             story.append(Spacer(1, 20))
             
             # Invoice table
             story.append(Paragraph("Invoice Details", self.styles['CustomHeader']))
             
-            # Table data
-            table_data = [['Invoice ID', 'Date', 'Supplier', 'Amount (DH)', 'Status', 'Project']]
-            
-            for inv in invoices:
-                table_data.append([
+            # Table chunks, built from the cursor while the pages are laid out
+            tables = self.invoice_tables(
+                data['invoices'],
+                ['Invoice ID', 'Date', 'Supplier', 'Amount (DH)', 'Status', 'Project'],
+                lambda inv: [
                     f"INV-{inv['id']:03d}",
                     inv['date'],
                     inv['supplier'],
                     f"{inv['amount']:,.2f}",
                     inv['status'],
                     inv['project_name']
-                ])
-            
-            # Create table
-            table = Table(table_data, colWidths=[80, 80, 120, 80, 60, 120])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ed8936')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('ALIGN', (3, 1), (3, -1), 'RIGHT'),  # Amount column right-aligned
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f7fafc')])
-            ]))
-            
-            story.append(table)
+                ],
+                [80, 80, 120, 80, 60, 120], invoice_count)
         
         # Build PDF
-        doc.build(story)
+        self.build_document(doc, story, tables)
+        self.to_cache(cache_entry, output_file)
         return output_file
     
     def generate_complete_project_report(self, project_id: int, period: str, custom_start_date: Optional[str] = None, custom_end_date: Optional[str] = None, output_file: Optional[str] = None) -> str:
@@ -339,13 +591,44 @@ class PDFReportGenerator:
         else:
             start_date, end_date = self.get_date_range(period)
         
-        # Get data
-        projects = self.get_project_data(project_id)
-        if not projects:
-            raise ValueError(f"Project with ID {project_id} not found")
+        # One connection and one read transaction: the whole report sees one snapshot
+        with self.snapshot() as conn:
+            return self.build_complete_project_report(conn, project_id, start_date, end_date, output_file)
+    
+    def generate_detailed_project_report(self, project_id: int, period: str, custom_start_date: Optional[str] = None, custom_end_date: Optional[str] = None, output_file: Optional[str] = None) -> str:
+        """Generate the complete project report plus expense line breakdown and line items"""
+        if not output_file:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            output_file = f"project_detailed_report_{timestamp}.pdf"
+        
+        if custom_start_date and custom_end_date:
+            start_date, end_date = custom_start_date, custom_end_date
+        else:
+            start_date, end_date = self.get_date_range(period)
         
-        project = projects[0]
-        invoices = self.get_invoice_data(project_id, start_date, end_date)
+        with self.snapshot() as conn:
+            return self.build_complete_project_report(conn, project_id, start_date, end_date, output_file,
+                                                      detailed=True)
+    
+    def build_complete_project_report(self, conn, project_id: int, start_date: Optional[str],
+                                      end_date: Optional[str], output_file: str, detailed: bool = False) -> str:
+        """Lay out the complete (or detailed) project report from data read on conn"""
+        report_type = 'detailed' if detailed else 'complete'
+        # Identical request on unchanged data: reuse the rendered file
+        cache_entry, hit = self.from_cache(conn, report_type, project_id, start_date, end_date, output_file)
+        if hit:
+            return output_file
+        
+        # Get data: project and period totals in one query, the rows stream into the table
+        self.report_progress(PHASE_FETCH, 0)
+        if detailed:
+            data = self.get_detailed_report_data(conn, project_id, start_date, end_date)
+        else:
+            data = self.get_complete_report_data(conn, project_id, start_date, end_date)
+        project = data['project']
+        total_invoices = data['invoice_count']
+        self.report_progress(PHASE_FETCH, total_invoices)
+        tables = ()
         
         # Create PDF
         doc = SimpleDocTemplate(output_file, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
@@ -355,11 +638,12 @@ class PDFReportGenerator:
         self.add_header_with_logo(story)
         
         # Report title
-        story.append(Paragraph("Complete Project Report", self.styles['CustomTitle']))
+        title = "Detailed Project Report" if detailed else "Complete Project Report"
+        story.append(Paragraph(title, self.styles['CustomTitle']))
         story.append(Spacer(1, 12))
         
         # Report info
-        report_info = f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}"
+        report_info = self.report_stamp(cache_entry)
         if start_date and end_date:
             report_info += f"<br/>Period: {start_date} to {end_date}"
         
@@ -379,7 +663,7 @@ class PDFReportGenerator:
             ['Total Budget:', f"{project['budget_max']:,.2f} DH"],
             ['Amount Invested:', f"{project['montant_investi']:,.2f} DH"],
             ['Remaining Budget:', f"{project['remaining_budget']:,.2f} DH"],
-            ['Budget Usage:', f"{(project['montant_investi']/project['budget_max']*100) if project['budget_max'] > 0 else 0:.1f}%"]
+            ['Budget Usage:', f"{project['budget_usage']:.1f}%"]
         ]
         
         project_table = Table(project_info, colWidths=[150, 300])
@@ -399,15 +683,14 @@ class PDFReportGenerator:
         # Financial Summary
         story.append(Paragraph("Financial Summary", self.styles['CustomHeader']))
         
-        total_invoices = len(invoices)
-        total_amount = sum(inv['amount'] for inv in invoices)
-        avg_invoice = total_amount / total_invoices if total_invoices > 0 else 0
-        
         financial_info = [
             ['Total Invoices (Period):', str(total_invoices)],
-            ['Total Amount (Period):', f"{total_amount:,.2f} DH"],
-            ['Average Invoice Amount:', f"{avg_invoice:,.2f} DH"],
-            ['Budget Utilization:', f"{(project['montant_investi']/project['budget_max']*100) if project['budget_max'] > 0 else 0:.1f}%"]
+            ['Total Amount (Period):', f"{data['total_amount']:,.2f} DH"],
+            ['Average Invoice Amount:', f"{data['average_amount']:,.2f} DH"],
+            ['Total Invoices (All):', str(project['invoice_count'])],
+            ['Pending Amount:', f"{project['pending_amount']:,.2f} DH"],
+            ['Last Invoice:', project['last_invoice_date'] or 'N/A'],
+            ['Budget Utilization:', f"{project['budget_usage']:.1f}%"]
         ]
         
         financial_table = Table(financial_info, colWidths=[150, 300])
@@ -424,42 +707,47 @@ class PDFReportGenerator:
         story.append(financial_table)
         story.append(Spacer(1, 30))
         
+        if detailed:
+            self.add_line_breakdown(story, data)
+        
         # Invoice Details
-        if invoices:
+        if total_invoices:
             story.append(Paragraph("Invoice Details", self.styles['CustomHeader']))
             
-            # Table data
-            table_data = [['Invoice ID', 'Date', 'Supplier', 'Amount (DH)', 'Status']]
-            
-            for inv in invoices:
-                table_data.append([
+            # Table chunks, built from the cursor while the pages are laid out
+            tables = self.invoice_tables(
+                data['invoices'],
+                ['Invoice ID', 'Date', 'Supplier', 'Amount (DH)', 'Status'],
+                lambda inv: [
                     f"INV-{inv['id']:03d}",
                     inv['date'],
                     inv['supplier'],
                     f"{inv['amount']:,.2f}",
                     inv['status']
-                ])
-            
-            # Create table
-            table = Table(table_data, colWidths=[80, 80, 150, 100, 80])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ed8936')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('ALIGN', (3, 1), (3, -1), 'RIGHT'),  # Amount column right-aligned
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f7fafc')])
-            ]))
-            
-            story.append(table)
+                ],
+                [80, 80, 150, 100, 80], total_invoices)
         else:
             story.append(Paragraph("No invoices found for the specified period.", self.styles['Normal']))
         
+        # Expense lines follow the invoice tables, streamed the same way
+        if detailed and data['line_count']:
+            tables = itertools.chain(tables, [
+                Spacer(1, 30),
+                Paragraph("Expense Line Details", self.styles['CustomHeader'])
+            ], self.invoice_tables(
+                data['lines'],
+                ['Invoice ID', 'Date', 'Motif', 'Unit Price', 'Qty', 'Amount (DH)'],
+                lambda line: [
+                    f"INV-{line['invoice_id']:03d}",
+                    line['date'],
+                    line['motif'],
+                    f"{line['unit_price']:,.2f}",
+                    f"{line['quantity']:g}",
+                    f"{line['amount']:,.2f}"
+                ],
+                [60, 65, 150, 65, 45, 70], data['line_count'], LINE_TABLE_STYLE))
+        
         # Build PDF
-        doc.build(story)
+        self.build_document(doc, story, tables)
+        self.to_cache(cache_entry, output_file)
         return output_file
@@ -0,0 +1,89 @@
+"""
+In-process project directory
+
+Combo boxes and pickers only need each project's id, name, status and
+budget. ProjectDirectory holds that projection in memory: it is read once,
+then kept current from the change_log (migration 7) by sync(), which only
+re-reads the projects that changed. Pickers call projects() on the GUI
+thread and get an instant answer without touching SQLite.
+"""
+
+import threading
+from sqlite3 import Error
+
+from app.change_tracking import ChangeTracker
+
+PROJECT_DIRECTORY_SQL = "SELECT id_projet, nom_projet, status, budget_max FROM Projet"
+
+
+class ProjectDirectory:
+    """(id_projet, nom_projet, status, budget_max) of every project, kept in sync"""
+
+    def __init__(self):
+        self._projects = {}   # id_projet -> row
+        self._ordered = []    # rows in id order, rebuilt on change
+        self._loaded = False
+        self._tracker = ChangeTracker()
+        self._lock = threading.Lock()
+        # Bumped on every change, so views know when to refill their pickers
+        self.version = 0
+
+    def is_loaded(self):
+        return self._loaded
+
+    def projects(self):
+        """Return the project rows in id order (empty until the first sync)"""
+        return self._ordered
+
+    def get(self, project_id):
+        """Return one project row, or None"""
+        return self._projects.get(project_id)
+
+    def sync(self, conn):
+        """Load on first use, then apply the project changes since the last sync.
+
+        Safe to call from worker threads; returns True if the directory changed.
+        """
+        with self._lock:
+            try:
+                changes = self._tracker.poll(conn)
+                if changes is None:
+                    rows = conn.execute(PROJECT_DIRECTORY_SQL).fetchall()
+                    projects = {row[0]: row for row in rows}
+                else:
+                    changed = list(changes.get('Projet', {}))
+                    if not changed:
+                        return False
+                    projects = dict(self._projects)
+                    for project_id in changed:
+                        projects.pop(project_id, None)
+                    for start in range(0, len(changed), 500):
+                        chunk = changed[start:start + 500]
+                        placeholders = ",".join("?" * len(chunk))
+                        for row in conn.execute(f"{PROJECT_DIRECTORY_SQL} WHERE id_projet IN ({placeholders})",
+                                                chunk):
+                            projects[row[0]] = row
+            except Error as e:
+                print(f"Error syncing project directory: {e}")
+                return False
+            if self._loaded and projects == self._projects:
+                return False
+            # Swap whole snapshots, so GUI-thread readers never see a partial update
+            self._projects = projects
+            self._ordered = [projects[project_id] for project_id in sorted(projects)]
+            self._loaded = True
+            self.version += 1
+            return True
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_project_directory():
+    """Return the project directory shared by every window and dialog"""
+    global _directory
+    with _directory_lock:
+        if _directory is None:
+            _directory = ProjectDirectory()
+        return _directory
@@ -0,0 +1,94 @@
+"""
+On-disk cache of generated PDF reports
+
+A report is fully determined by its database, type, project, resolved date
+range, the data it was built from and the layout code that drew it. The
+cache key combines all of them; the data part is the change_log sequence number
+(migration 7), which every insert, update or delete on Projet, FactureCharge
+and LigneCharge moves forward, so any relevant write makes older entries
+unreachable. Entries live in a size-bounded per-user directory, shared by
+every database and evicted least recently used first.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+
+REPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+
+def default_cache_dir():
+    """Per-user cache directory: %LOCALAPPDATA% on Windows, $XDG_CACHE_HOME or ~/.cache elsewhere"""
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "gestion_projets", "report_cache")
+
+
+REPORT_CACHE_DIR = default_cache_dir()
+
+
+class ReportCache:
+    """Size-bounded LRU directory of rendered reports"""
+
+    def __init__(self, directory=REPORT_CACHE_DIR, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(db_file, report_type, project_id, start_date, end_date, template_version):
+        """Return the cache key of a request, without its data version"""
+        # Databases share the directory: same ids and change_log seqs must not collide
+        params = repr((os.path.abspath(db_file), report_type, project_id, start_date, end_date,
+                       template_version))
+        return hashlib.sha1(params.encode('utf-8')).hexdigest()
+
+    def path(self, key, data_version):
+        return os.path.join(self.directory, f"{key}_{data_version}.pdf")
+
+    def get(self, key, data_version):
+        """Return the cached file for key at data_version, or None"""
+        path = self.path(key, data_version)
+        with self._lock:
+            try:
+                # Touching the file marks it most recently used
+                os.utime(path)
+                return path
+            except OSError:
+                return None
+
+    def put(self, key, data_version, source_file):
+        """Store a copy of source_file; older versions of the same key are dropped"""
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                path = self.path(key, data_version)
+                temp_path = path + ".tmp"
+                shutil.copyfile(source_file, temp_path)
+                os.replace(temp_path, path)
+                for name in os.listdir(self.directory):
+                    if name.startswith(key + "_") and name != os.path.basename(path):
+                        os.remove(os.path.join(self.directory, name))
+                self._evict()
+            except OSError as e:
+                print(f"Error caching report: {e}")
+
+    def _evict(self):
+        """Delete least recently used entries until the directory fits max_bytes"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".pdf"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """Delete every cached report"""
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
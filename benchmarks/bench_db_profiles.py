@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark: read/write concurrency before and after the SQLite pragma profiles
+
+A reader thread replays the main window refresh query (invoices JOIN projects)
+while a writer thread saves invoices with expense lines, the way a director
+does while the 30-second auto-refresh runs. Each profile runs on a fresh
+temporary database.
+
+Usage:
+    python benchmarks/bench_db_profiles.py [--seconds 5] [--invoices 5000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.db import ConnectionPool, DB_PROFILES, create_tables
+
+
+READ_SQL = """
+    SELECT fc.id_facture_charge, fc.date_facture, fc.fournisseur,
+           fc.montant_total, p.nom_projet, fc.status
+    FROM FactureCharge fc
+    JOIN Projet p ON fc.id_projet = p.id_projet
+    ORDER BY fc.date_facture DESC
+"""
+
+
+def seed(db_file, invoices):
+    """Create the schema and a realistic amount of data"""
+    conn = sqlite3.connect(db_file)
+    create_tables(conn)
+    conn.executemany("INSERT INTO Projet(nom_projet, budget_max) VALUES(?, ?)",
+                     [(f"Projet {i}", 1000000.0) for i in range(50)])
+    conn.executemany(
+        "INSERT INTO FactureCharge(id_projet, date_facture, fournisseur, montant_total) VALUES(?,?,?,?)",
+        [(i % 50 + 1, f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}", f"Fournisseur {i % 40}", 1000.0)
+         for i in range(invoices)])
+    conn.commit()
+    conn.close()
+
+
+def run(profile_name, pragmas, seconds, invoices):
+    """Run reader and writer concurrently; return counters"""
+    handle, db_file = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    try:
+        seed(db_file, invoices)
+        # A single pool, like the application; each thread gets its own connection
+        pool = ConnectionPool(db_file, max_size=2, pragmas=pragmas, timeout=5.0)
+        stop = threading.Event()
+        stats = {"reads": 0, "writes": 0, "read_errors": 0, "write_errors": 0,
+                 "worst_read_ms": 0.0, "worst_write_ms": 0.0}
+
+        def reader():
+            conn = pool.acquire()
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    conn.execute(READ_SQL).fetchall()
+                    stats["reads"] += 1
+                except sqlite3.OperationalError:
+                    stats["read_errors"] += 1
+                stats["worst_read_ms"] = max(stats["worst_read_ms"], (time.perf_counter() - started) * 1000)
+            pool.release(conn)
+
+        def writer():
+            conn = pool.acquire()
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    cur = conn.cursor()
+                    cur.execute("INSERT INTO FactureCharge(id_projet, date_facture, fournisseur, montant_total) "
+                                "VALUES(1, '2025-06-01', 'Bench', 100.0)")
+                    facture_id = cur.lastrowid
+                    cur.executemany("INSERT INTO LigneCharge(id_facture_charge, motif, prix_unitaire, quantite, montant_total) "
+                                    "VALUES(?, 'ligne', 10.0, 1, 10.0)", [(facture_id,)] * 10)
+                    conn.commit()
+                    stats["writes"] += 1
+                except sqlite3.OperationalError:
+                    conn.rollback()
+                    stats["write_errors"] += 1
+                stats["worst_write_ms"] = max(stats["worst_write_ms"], (time.perf_counter() - started) * 1000)
+            pool.release(conn)
+
+        threads = [threading.Thread(target=reader), threading.Thread(target=writer)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        pool.close_all()
+        return stats
+    finally:
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--invoices", type=int, default=5000)
+    args = parser.parse_args()
+
+    # "baseline" is the pre-profile behaviour: rollback journal, default page cache
+    runs = [("baseline", {}), ("desktop", DB_PROFILES["desktop"]["pragmas"]),
+            ("network_share", DB_PROFILES["network_share"]["pragmas"])]
+
+    print(f"{'profile':<15}{'reads/s':>10}{'writes/s':>10}{'read err':>10}{'write err':>10}"
+          f"{'worst read':>12}{'worst write':>13}")
+    for name, pragmas in runs:
+        stats = run(name, pragmas, args.seconds, args.invoices)
+        print(f"{name:<15}{stats['reads'] / args.seconds:>10.1f}{stats['writes'] / args.seconds:>10.1f}"
+              f"{stats['read_errors']:>10}{stats['write_errors']:>10}"
+              f"{stats['worst_read_ms']:>10.1f}ms{stats['worst_write_ms']:>11.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark: invoice report layout, single table vs streamed chunked tables
+
+The "single" layout is the pre-streaming behaviour: every invoice loaded into
+one list and laid out as one Table, which ReportLab re-splits on every page.
+The "streamed" layout is generate_invoice_report(): rows come from the DB
+cursor and are laid out in TABLE_CHUNK_ROWS chunks as the pages are built.
+Each size runs on a fresh temporary database; peak memory is measured with
+tracemalloc, so absolute times are slower than a normal run.
+
+Usage:
+    python benchmarks/bench_report_layout.py [--sizes 1000 10000 100000] [--single-max 10000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+
+from app.db import create_tables
+from app.pdf_generator import INVOICE_TABLE_STYLE, PDFReportGenerator
+
+
+def seed(db_file, invoices):
+    """Create the schema with 50 projects and the given number of invoices"""
+    conn = sqlite3.connect(db_file)
+    create_tables(conn)
+    conn.executemany("INSERT INTO Projet(nom_projet, budget_max) VALUES(?, ?)",
+                     [(f"Projet {i}", 1000000.0) for i in range(50)])
+    conn.executemany(
+        "INSERT INTO FactureCharge(id_projet, date_facture, fournisseur, montant_total, status) VALUES(?,?,?,?,?)",
+        [(i % 50 + 1, f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}", f"Fournisseur {i % 40}", 1000.0 + i,
+          ('Paid', 'Pending', 'Overdue')[i % 3]) for i in range(invoices)])
+    conn.commit()
+    conn.close()
+
+
+def build_single(generator, output_file):
+    """Pre-streaming layout: all rows in memory, one Table"""
+    rows = [['Invoice ID', 'Date', 'Supplier', 'Amount (DH)', 'Status', 'Project']]
+    for inv in list(generator.iter_invoice_data()):
+        rows.append([f"INV-{inv['id']:03d}", inv['date'], inv['supplier'], f"{inv['amount']:,.2f}",
+                     inv['status'], inv['project_name']])
+    table = Table(rows, colWidths=[80, 80, 120, 80, 60, 120])
+    table.setStyle(TableStyle(INVOICE_TABLE_STYLE))
+    doc = SimpleDocTemplate(output_file, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+    doc.build([table])
+
+
+def build_streamed(generator, output_file):
+    generator.generate_invoice_report(None, 'all', output_file=output_file)
+
+
+def measure(build, db_file):
+    """Run one build; return (seconds, peak MB, pages)"""
+    handle, output_file = tempfile.mkstemp(suffix=".pdf")
+    os.close(handle)
+    pages = [0]
+    generator = PDFReportGenerator(db_file, progress=lambda phase, done, total:
+                                   pages.__setitem__(0, max(pages[0], done)) if phase == 'layout' else None)
+    try:
+        tracemalloc.start()
+        started = time.perf_counter()
+        build(generator, output_file)
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        return seconds, peak, pages[0]
+    finally:
+        tracemalloc.stop()
+        os.remove(output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--single-max", type=int, default=10000,
+                        help="Skip the single-table layout above this many rows (it grows quadratically)")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8}  {'layout':<10}{'seconds':>10}{'peak MB':>10}{'pages':>8}")
+    for size in args.sizes:
+        handle, db_file = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        try:
+            seed(db_file, size)
+            for name, build in (("single", build_single), ("streamed", build_streamed)):
+                if name == "single" and size > args.single_max:
+                    print(f"{size:>8}  {name:<10}{'skipped':>10}")
+                    continue
+                seconds, peak, pages = measure(build, db_file)
+                print(f"{size:>8}  {name:<10}{seconds:>10.2f}{peak:>10.1f}{pages or '-':>8}")
+        finally:
+            for suffix in ("", "-wal", "-shm", "-journal"):
+                if os.path.exists(db_file + suffix):
+                    os.remove(db_file + suffix)
+
+
+if __name__ == "__main__":
+    main()
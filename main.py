@@ -13,7 +13,9 @@ from PyQt5.QtGui import QPixmap, QFont
 # Add the app directory to Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
 
-from app.db import create_connection, create_tables, add_user
+from app.db import create_connection, create_tables, add_user, close_pools
+from app.migrations import apply_migrations
+from app.change_tracking import prune_change_log
 from app.auth import hash_password
 from app.gui.login import SignInDialog
 from app.gui.main_window import MainApplicationWindow
@@ -30,6 +32,9 @@ class ProjectManagementApp:
         # Set application style
         self.app.setStyle('Fusion')
         
+        # Release pooled database connections on exit
+        self.app.aboutToQuit.connect(close_pools)
+        
         # Initialize database
         self.init_database()
         
@@ -43,11 +48,13 @@ class ProjectManagementApp:
         self.show_login()
     
     def init_database(self):
-        """Initialize database and create tables"""
+        """Initialize database, create tables and apply pending migrations"""
         try:
             conn = create_connection()
             if conn:
                 create_tables(conn)
+                apply_migrations(conn)
+                prune_change_log(conn)
                 conn.close()
                 print("Database initialized successfully")
             else:
@@ -2,6 +2,10 @@
 """
 Setup Script for Project Management System
 Initializes database and creates default users
+
+Usage:
+    python setup.py               # create/upgrade the database
+    python setup.py --reconcile   # repair invoice and project totals
 """
 
 import sys
@@ -10,7 +14,8 @@ import os
 # Add the app directory to Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
 
-from app.db import create_connection, create_tables, add_user, get_user_by_username
+from app.db import create_connection, create_tables, add_user, get_user_by_username, reconcile_totals, rebuild_projet_summaries
+from app.migrations import apply_migrations
 from app.auth import hash_password
 
 
@@ -28,9 +33,17 @@ def setup_database():
             raise Exception("Could not connect to database")
         
         create_tables(conn)
-        conn.close()
         print("✅ Database tables created successfully")
         
+        # Upgrade existing databases in place
+        print("🧱 Applying schema migrations...")
+        applied = apply_migrations(conn)
+        conn.close()
+        if applied:
+            print(f"✅ Applied migrations: {', '.join(str(v) for v in applied)}")
+        else:
+            print("ℹ️  Schema already up to date")
+        
         # Create default users if they don't exist
         print("👥 Creating default users...")
         
@@ -70,6 +83,28 @@ def setup_database():
         return False
 
 
+def reconcile_database():
+    """Repair drifted invoice and project totals in one pass"""
+    print("🧮 Reconciling invoice and project totals...")
+    try:
+        conn = create_connection()
+        if not conn:
+            raise Exception("Could not connect to database")
+        apply_migrations(conn)
+        invoices_fixed, projects_fixed = reconcile_totals(conn)
+        summaries = rebuild_projet_summaries(conn)
+        conn.close()
+        print(f"✅ Fixed {invoices_fixed} invoice totals and {projects_fixed} project totals")
+        print(f"✅ Rebuilt {summaries} project summaries")
+        return True
+    except Exception as e:
+        print(f"❌ Reconciliation failed: {e}")
+        return False
+
+
 if __name__ == "__main__":
-    success = setup_database()
+    if "--reconcile" in sys.argv[1:]:
+        success = reconcile_database()
+    else:
+        success = setup_database()
     sys.exit(0 if success else 1)
@@ -0,0 +1,65 @@
+"""
+Checkouts handed out by ConnectionPool
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from app.db import ConnectionPool
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pool = ConnectionPool(os.path.join(self.tmpdir, "pool.db"), max_size=1)
+
+    def tearDown(self):
+        self.pool.close_all()
+        shutil.rmtree(self.tmpdir)
+
+    def in_thread(self, target):
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+    def test_release_from_another_thread(self):
+        conn = self.pool.acquire()
+        self.in_thread(conn.close)
+        self.assertEqual(self.pool._held, {})
+        self.assertEqual(len(self.pool._idle), 1)
+
+    def test_stale_close_leaves_new_holder_alone(self):
+        stale = self.pool.acquire()
+        stale.close()
+        results = []
+
+        def hold():
+            current = self.pool.acquire()
+            stale.close()
+            results.append(self.pool._held.get(threading.get_ident()) is current)
+            results.append(current.execute("SELECT 1").fetchone()[0])
+            current.close()
+
+        self.in_thread(hold)
+        self.assertEqual(results, [True, 1])
+        self.assertEqual(self.pool._held, {})
+        with self.assertRaises(sqlite3.ProgrammingError):
+            stale.execute("SELECT 1")
+
+    def test_nested_acquisitions_share_a_checkout(self):
+        outer = self.pool.acquire()
+        inner = self.pool.acquire()
+        self.assertIs(outer, inner)
+        inner.close()
+        outer.execute("SELECT 1")
+        outer.close()
+        self.assertEqual(len(self.pool._idle), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Invoice and project totals maintained by the migration 4 triggers
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.db import (
+    TVA_RATE, close_pools, create_connection, create_tables, create_projet, create_facture_charge,
+    create_facture_with_lignes, create_ligne_charge, update_ligne_charge, delete_ligne_charge,
+    delete_facture_charge, read_lignes_charge_by_facture
+)
+from app.migrations import apply_migrations
+
+
+class TotalsTriggerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.conn = create_connection(os.path.join(self.tmpdir, "totals.db"))
+        create_tables(self.conn)
+        apply_migrations(self.conn)
+        self.project_id = create_projet(self.conn, ("Totals", "2025-01-01", "2025-01-01", 1000.0, 0))
+
+    def tearDown(self):
+        self.conn.close()
+        close_pools()
+        shutil.rmtree(self.tmpdir)
+
+    def invoice_total(self, facture_id):
+        return self.conn.execute("SELECT montant_total FROM FactureCharge WHERE id_facture_charge = ?",
+                                 (facture_id,)).fetchone()[0]
+
+    def project_total(self):
+        return self.conn.execute("SELECT montant_investi FROM Projet WHERE id_projet = ?",
+                                 (self.project_id,)).fetchone()[0]
+
+    def test_insert_with_lines_counts_them_once(self):
+        facture_id, errors = create_facture_with_lignes(
+            self.conn, (self.project_id, "2025-02-01", "Sup", 110.0),
+            [("a", 30.0, 2.0, 60.0), ("b", 40.0, 1.0, 40.0)])
+        self.assertEqual(errors, [])
+        self.assertAlmostEqual(self.invoice_total(facture_id), 100.0 * (1 + TVA_RATE))
+        self.assertAlmostEqual(self.project_total(), 100.0 * (1 + TVA_RATE))
+
+    def test_first_line_replaces_entered_total(self):
+        facture_id = create_facture_charge(self.conn, (self.project_id, "2025-02-01", "Sup", 500.0))
+        self.assertAlmostEqual(self.project_total(), 500.0)
+        create_ligne_charge(self.conn, (facture_id, "a", 10.0, 1.0, 10.0))
+        self.assertAlmostEqual(self.invoice_total(facture_id), 10.0 * (1 + TVA_RATE))
+        self.assertAlmostEqual(self.project_total(), 10.0 * (1 + TVA_RATE))
+
+    def test_update_and_delete_lines(self):
+        facture_id, _ = create_facture_with_lignes(
+            self.conn, (self.project_id, "2025-02-01", "Sup", 0.0),
+            [("a", 10.0, 1.0, 10.0), ("b", 20.0, 1.0, 20.0)])
+        first, second = [row[0] for row in read_lignes_charge_by_facture(self.conn, facture_id)]
+
+        update_ligne_charge(self.conn, ("a", 15.0, 2.0, 30.0, first))
+        self.assertAlmostEqual(self.invoice_total(facture_id), 50.0 * (1 + TVA_RATE))
+        self.assertAlmostEqual(self.project_total(), 50.0 * (1 + TVA_RATE))
+
+        delete_ligne_charge(self.conn, first)
+        self.assertAlmostEqual(self.invoice_total(facture_id), 20.0 * (1 + TVA_RATE))
+        self.assertAlmostEqual(self.project_total(), 20.0 * (1 + TVA_RATE))
+
+        delete_ligne_charge(self.conn, second)
+        self.assertAlmostEqual(self.invoice_total(facture_id), 0.0)
+        self.assertAlmostEqual(self.project_total(), 0.0)
+
+    def test_delete_invoice(self):
+        kept, _ = create_facture_with_lignes(
+            self.conn, (self.project_id, "2025-02-01", "Sup", 0.0), [("a", 10.0, 1.0, 10.0)])
+        deleted, _ = create_facture_with_lignes(
+            self.conn, (self.project_id, "2025-02-02", "Sup", 0.0), [("b", 20.0, 1.0, 20.0)])
+        self.assertTrue(delete_facture_charge(self.conn, deleted))
+        self.assertAlmostEqual(self.project_total(), self.invoice_total(kept))
+        self.assertAlmostEqual(self.project_total(), 10.0 * (1 + TVA_RATE))
+
+
+if __name__ == "__main__":
+    unittest.main()